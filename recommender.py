@@ -1,27 +1,39 @@
 """CSC108 A3 interactive recommender."""
 
-from typing import List
+from typing import List, Optional
 import recommender_functions as student
+import recommender_loader as loader
+from recommender_search import TitleIndex
 from recommender_constants import MovieDict, Rating, UserRatingDict, MovieUserDict
 import time
 start_time = time.time()
 def print_recommend(target_rating: Rating,
                     movies: MovieDict,
                     ratings: UserRatingDict,
-                    movie_users: MovieUserDict) -> None:
+                    movie_users: MovieUserDict,
+                    index: Optional[student.RatingIndex] = None,
+                    profile: bool = False) -> None:
     """Print recommendations from movies for a user with target_rating, using
-    data from ratings and movie_users.
+    data from ratings and movie_users (and the prebuilt index of ratings).
+    With profile, also print the time and output size of each stage.
     """
+    trace = student.RecommendTrace() if profile else None
     results = student.recommend_movies(target_rating,
                                        ratings,
                                        movie_users,
-                                       5)
+                                       5,
+                                       index,
+                                       trace)
     print("Watched:")
     for movie_id in target_rating:
         print(movie_id, movies[movie_id][0])
     print("Recommend:")
     for movie_id in results:
         print(movie_id, movies[movie_id][0])
+    if trace is not None:
+        print("Stages:")
+        for stage, seconds, items in trace.stages:
+            print("%-22s %8.3f ms %8d items" % (stage, seconds * 1000, items))
     print()
 
 
@@ -40,15 +52,17 @@ def search_movie(query: str, movies_dict: MovieDict) -> List[tuple]:
 
 def recommend_interactive(movies: MovieDict,
                           ratings: UserRatingDict,
-                          movie_users: MovieUserDict) -> None:
+                          movie_users: MovieUserDict,
+                          index: Optional[student.RatingIndex] = None) -> None:
     """Recommend movies based on user input using data from movies, rating,
-    and movie_users.
+    movie_users and the prebuilt index of ratings.
     """
 
     print("This script uses the code you wrote to recommend movies.")
     print("To begin, rate at least one movie using the 'rate' command.")
     print("You will need to know the movie ID in order to rate a movie.")
     print("You can use the 'search' command to search for a movie's ID.")
+    title_index = TitleIndex(movies)
     
     command = None # user input command
     while command != 'no':
@@ -62,7 +76,7 @@ def recommend_interactive(movies: MovieDict,
                 print("What movie would you like to search for?")
                 query = input("Search: ")
                 query = query.strip()
-                results = search_movie(query, movies)
+                results = title_index.search(query)
                 if len(results) > 0:
                     print("Search results:")
                     for k, v in results:
@@ -100,7 +114,8 @@ def recommend_interactive(movies: MovieDict,
         results = student.recommend_movies(user_ratings,
                                            ratings, 
                                            movie_users,
-                                           5)
+                                           5,
+                                           index)
         for movie_id in results:
             print(movie_id, movies[movie_id][0])
 
@@ -110,37 +125,32 @@ def recommend_interactive(movies: MovieDict,
 
 if __name__ == "__main__":
     print("Reading in a list of movies.")
-    movfile = open('movies.csv', 'r')
-    movies = student.read_movies(movfile)
-    movfile.close()
+    movies = loader.load_movies('movies.csv')
 
-    print("Reading in user ratings.")
-    ratingfile = open('ratings_medium.csv', 'r')
-    ratings = student.read_ratings(ratingfile)
-    ratingfile.close()
+    print("Reading in user ratings, removing ratings for movies we have no "
+          "data on and building movies to users dictionary.")
+    ratings, movie_users = loader.load_prepared_ratings('ratings_medium.csv',
+                                                        movies)
 
-    print("Removing ratings for movies we have no data on.")
-    student.remove_unknown_movies(ratings, movies)
-
-    print("Building movies to users dictionary.")
-    movie_users = student.movies_to_users(ratings)
+    print("Building rating index.")
+    index = student.RatingIndex(ratings)
 
     ### You can uncomment these to test recommendations for the following movies
 
-    print_recommend({663:5, 274:4.5, 745:4.5}, movies, ratings, movie_users)
+    print_recommend({663:5, 274:4.5, 745:4.5}, movies, ratings, movie_users, index)
     # Should get: [25753, 65, 25769, 74, 82]
     
-    print_recommend({2109:3, 954:4}, movies, ratings, movie_users)
+    print_recommend({2109:3, 954:4}, movies, ratings, movie_users, index)
     # Should get: [2313, 100, 2049, 2642, 6970]
     
-    print_recommend({745:5}, movies, ratings, movie_users)
+    print_recommend({745:5}, movies, ratings, movie_users, index)
     # Should get: [25753, 25769, 82, 74, 2348]
     
-    print_recommend({1262:5}, movies, ratings, movie_users)
+    print_recommend({1262:5}, movies, ratings, movie_users, index)
     # Should get: [4515, 2289, 1249, 55687, 2284]
 
     print("--- %s seconds ---" % (time.time() - start_time))
     ### Run interactive recommendations
 
-    #recommend_interactive(movies, ratings, movie_users)
+    #recommend_interactive(movies, ratings, movie_users, index)
 
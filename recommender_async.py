@@ -0,0 +1,250 @@
+"""Asyncio version of recommend_movies for event loop services.
+
+recommend_movies runs from start to end without giving up the thread, so
+an asyncio service calling it directly stalls every other request for the
+length of the query. recommend_movies_async walks the similar users in
+chunks of chunk_size and awaits between chunks, so other tasks run in
+between, a cancelled task stops at the next chunk, and a timeout is checked
+after each chunk.
+
+A similar user's number of candidate movies is their number of movies
+rated CUT_OFF_RATING or above that the target has not rated, which does not
+depend on the other similar users, so each chunk finds its users'
+similarities, candidate movies and score contributions in one go. Chunks
+run in ascending user order, the order get_movie_score_dict adds the
+contributions in, so a query that finishes returns exactly what
+recommend_movies returns. With best_effort, a query that runs out of time
+returns the top movies scored from the users reached so far instead of
+raising asyncio.TimeoutError.
+
+min_similarity drops users chunk by chunk. top_m needs every similarity
+before any user can be dropped, so with top_m the similarities are found
+in chunks first, and only the kept users are scored, again in chunks; a
+best_effort query that runs out of time before the similarities are all
+found returns no movies. With genre_movies only those movies are scored,
+each still divided by the user's full number of candidate movies, as in
+get_filtered_movie_score_dict.
+
+Without a prebuilt index, the RatingIndex is built in the loop's default
+executor, as building it is one step as long as a whole query.
+
+    python recommender_async.py --ratings ratings_small.csv
+
+reports the longest event loop stall while queries run with each chunk
+size.
+"""
+
+import argparse
+import asyncio
+import time
+from typing import AbstractSet, List, Optional
+
+from recommender_constants import Rating, UserRatingDict, MovieUserDict
+from recommender_constants import (USER_RATING_DICT_SMALL,
+                                   MOVIE_USER_DICT_SMALL)
+from recommender_functions import (RatingIndex, RecommendTrace,
+                                   get_users_who_watched, get_similarities,
+                                   prune_similar_users, add_user_scores,
+                                   sort_moviescore_dict)
+
+# similar users scored between two yields to the event loop
+CHUNK_SIZE = 256
+
+
+async def recommend_movies_async(target_rating: Rating,
+                                 user_ratings: UserRatingDict,
+                                 movie_users: MovieUserDict,
+                                 num_movies: int,
+                                 index: Optional[RatingIndex] = None,
+                                 chunk_size: int = CHUNK_SIZE,
+                                 timeout: Optional[float] = None,
+                                 best_effort: bool = False,
+                                 trace: Optional[RecommendTrace] = None,
+                                 min_similarity: float = 0.0,
+                                 top_m: Optional[int] = None,
+                                 genre_movies: Optional[AbstractSet[int]]
+                                 = None) -> List[int]:
+    """
+    return recommend_movies for target_rating, yielding to the event loop
+    after every chunk_size similar users
+    :param target_rating: dictionary of movie_ids to rating
+    :param user_ratings: UserRatingDict dictionary
+    :param movie_users: MovieUserDict of user_ratings
+    :param num_movies: number of movies to recommend
+    :param index: prebuilt RatingIndex of user_ratings, built in the
+    loop's default executor if None
+    :param chunk_size: similar users scored between yields
+    :param timeout: seconds from the call after which the query stops, no
+    limit if None
+    :param best_effort: on timeout, return the top movies scored so far
+    instead of raising
+    :param trace: counts 'async_chunks' and 'async_users' scored, and
+    'async_timeouts'
+    :param min_similarity: prune as in get_similar_users
+    :param top_m: prune as in get_similar_users
+    :param genre_movies: only recommend these movies, as recommend_movies
+    :return: list of recommended movie ids
+    :raise asyncio.TimeoutError: if timeout passes without best_effort
+    >>> asyncio.run(recommend_movies_async(
+    ...     {68735: 4.5}, USER_RATING_DICT_SMALL, MOVIE_USER_DICT_SMALL, 2,
+    ...     chunk_size=1))
+    [302156, 293660]
+    >>> asyncio.run(recommend_movies_async(
+    ...     {68735: 4.5}, USER_RATING_DICT_SMALL, MOVIE_USER_DICT_SMALL, 2,
+    ...     chunk_size=1, timeout=0, best_effort=True))
+    []
+    >>> asyncio.run(recommend_movies_async(
+    ...     {68735: 4.5}, USER_RATING_DICT_SMALL, MOVIE_USER_DICT_SMALL, 2,
+    ...     chunk_size=1, top_m=1))
+    [302156]
+    >>> asyncio.run(recommend_movies_async(
+    ...     {68735: 4.5}, USER_RATING_DICT_SMALL, MOVIE_USER_DICT_SMALL, 2,
+    ...     genre_movies={293660}))
+    [293660]
+    """
+    loop = asyncio.get_running_loop()
+    if timeout is not None:
+        deadline = loop.time() + timeout
+    if index is None:
+        # building the index is one long step, so keep it off the loop
+        index = await loop.run_in_executor(None, RatingIndex, user_ratings)
+
+    def timed_out() -> bool:
+        """
+        return whether the query is out of time, raising unless best_effort
+        """
+        if timeout is None or loop.time() < deadline:
+            return False
+        if trace is not None:
+            trace.count('async_timeouts')
+        if not best_effort:
+            raise asyncio.TimeoutError()
+        return True
+
+    users = get_users_who_watched(list(target_rating), movie_users)
+    high_movies = index.high_movies
+    movie_score_dict = {}
+    kept_sim_dict = None
+    if top_m is not None:
+        kept_sim_dict = {}
+        for start in range(0, len(users), chunk_size):
+            if timed_out():
+                return []
+            kept_sim_dict.update(prune_similar_users(
+                get_similarities(target_rating,
+                                 users[start:start + chunk_size],
+                                 user_ratings, index.norms),
+                min_similarity))
+            await asyncio.sleep(0)
+        kept_sim_dict = prune_similar_users(kept_sim_dict, top_m=top_m)
+        users = list(kept_sim_dict)
+    for start in range(0, len(users), chunk_size):
+        if timed_out():
+            break
+        chunk = users[start:start + chunk_size]
+        if kept_sim_dict is None:
+            user_sim_dict = prune_similar_users(
+                get_similarities(target_rating, chunk, user_ratings,
+                                 index.norms), min_similarity)
+        else:
+            user_sim_dict = {user: kept_sim_dict[user] for user in chunk}
+        for user, user_sim_score in user_sim_dict.items():
+            user_movies = [movie for movie in high_movies[user]
+                           if movie not in target_rating]
+            num_user_movie = len(user_movies)
+            if genre_movies is not None:
+                user_movies = [movie for movie in user_movies
+                               if movie in genre_movies]
+            add_user_scores(movie_score_dict, user_sim_score, user_movies,
+                            num_user_movie, index.popularity)
+        if trace is not None:
+            trace.count('async_chunks')
+            trace.count('async_users', len(chunk))
+        # let other tasks run; a cancelled query stops here
+        await asyncio.sleep(0)
+    return sort_moviescore_dict(movie_score_dict, num_movies)
+
+
+async def longest_stall(query, interval: float = 0.001) -> float:
+    """
+    return the longest gap in seconds between ticks of a task that wakes
+    every interval seconds while query, a coroutine, runs
+    """
+    stop = False
+    stalls = [0.0]
+
+    async def tick() -> None:
+        """
+        record how late each wake-up is
+        """
+        while not stop:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            stalls.append(time.perf_counter() - start - interval)
+
+    ticker = asyncio.create_task(tick())
+    await asyncio.sleep(0)
+    try:
+        await query
+    finally:
+        stop = True
+        await ticker
+    return max(stalls)
+
+
+def main() -> None:
+    """
+    time the longest event loop stall of the popular seed queries with
+    recommend_movies and with each chunk size of recommend_movies_async
+    """
+    from recommender_functions import recommend_movies
+    from recommender_loader import load_movies, load_prepared_ratings
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--movies', default='movies.csv')
+    parser.add_argument('--ratings', default='ratings_small.csv')
+    parser.add_argument('--chunk-sizes', type=int, nargs='+',
+                        default=[64, 256, 1024])
+    parser.add_argument('--queries', type=int, default=20)
+    args = parser.parse_args()
+
+    user_ratings, movie_users = load_prepared_ratings(
+        args.ratings, load_movies(args.movies))
+    index = RatingIndex(user_ratings)
+    popular = sorted(movie_users, key=lambda movie: -len(movie_users[movie]))
+    targets = [{movie: 5.0} for movie in popular[:args.queries]]
+    expected = [recommend_movies(target, user_ratings, movie_users, 5, index)
+                for target in targets]
+
+    async def blocking() -> None:
+        """
+        run the queries without yielding
+        """
+        for target in targets:
+            recommend_movies(target, user_ratings, movie_users, 5, index)
+
+    async def chunked(chunk_size: int, results: List) -> None:
+        """
+        run the queries with recommend_movies_async
+        """
+        for target in targets:
+            results.append(await recommend_movies_async(
+                target, user_ratings, movie_users, 5, index, chunk_size))
+
+    print('%16s %12s %12s %6s' % ('query', 'stall_ms', 'total_ms', 'same'))
+    start = time.perf_counter()
+    stall = asyncio.run(longest_stall(blocking()))
+    print('%16s %12.2f %12.1f %6s' % ('recommend_movies', stall * 1000,
+                                      (time.perf_counter() - start) * 1000,
+                                      True))
+    for chunk_size in args.chunk_sizes:
+        results = []
+        start = time.perf_counter()
+        stall = asyncio.run(longest_stall(chunked(chunk_size, results)))
+        print('%16s %12.2f %12.1f %6s' % (
+            'chunk %d' % chunk_size, stall * 1000,
+            (time.perf_counter() - start) * 1000, results == expected))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,895 @@
+"""Benchmarks for the CSC108 A3 recommender on synthetic rating data.
+
+``python recommender_bench.py run --ratings 1e6 --output new.json`` writes
+a MovieLens-shaped dataset of the given size (reused on later runs), times
+each stage of the pipeline and saves latency percentiles and peak memory as
+JSON. ``python recommender_bench.py compare old.json new.json`` compares two
+such results, e.g. from two revisions. ``python recommender_bench.py
+candidates`` shows how candidate generation latency changes with the size
+of the rating data, ``python recommender_bench.py memory`` compares the
+memory and query latency of a UserRatingDict and a CompactRatings,
+``python recommender_bench.py genres`` compares filtering recommendations
+by genre after scoring with pushing the filter into scoring, ``python
+recommender_bench.py movies`` times read_movies against plain split and
+csv module parsers, ``python recommender_bench.py pages`` compares
+paging with recommend_movies against a RecommendCursor, and ``python
+recommender_bench.py prune`` reports the speed-up and ranking agreement of
+neighbour pruning.
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+from array import array
+from typing import (Callable, List, Dict, Iterator, Optional, Sequence,
+                    TextIO)
+
+from recommender_compact import CompactRatings
+from recommender_constants import (MovieDict, Rating, UserRatingDict,
+                                   MovieUserDict)
+from recommender_cursor import RecommendCursor
+from recommender_functions import (RatingIndex, RecommendTrace,
+                                   read_movies, read_ratings,
+                                   remove_unknown_movies, movies_to_users,
+                                   get_users_who_watched, get_candidate_movies,
+                                   get_similar_users, get_movie_score_dict,
+                                   sort_moviescore_dict, recommend_movies)
+from recommender_genres import GenreIndex
+from recommender_loader import (open_rating_columns, load_movies,
+                                load_prepared_ratings)
+
+HALF_STARS = [0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 4.5, 5.0]
+# rough shape of MovieLens: star ratings skew high
+HALF_STAR_WEIGHTS = [1, 3, 2, 7, 4, 20, 10, 26, 8, 15]
+GENRES = ['Action', 'Adventure', 'Animation', 'Comedy', 'Crime',
+          'Documentary', 'Drama', 'Family', 'Fantasy', 'Horror', 'Romance',
+          'Thriller']
+CHUNK_SIZE = 10 ** 6
+DATA_DIR = 'bench_data'
+
+
+def iter_ratings(num_ratings: int, num_users: int = 0, num_movies: int = 0,
+                 skew: float = 1.0, seed: int = 108) -> Iterator[tuple]:
+    """
+    yield (user_id, {movie_id: rating}) for about num_ratings synthetic
+    ratings, one user at a time in ascending user id order, where movie
+    popularity follows a Zipf law with exponent skew
+    :param num_ratings: number of ratings, fewer only if a user would have
+    to rate more than half of the movies
+    :param num_users: number of users, num_ratings // 30 if 0
+    :param num_movies: number of movies, num_ratings // 10 if 0
+    :param skew: Zipf exponent of movie popularity, 0 for uniform
+    :param seed: random seed
+    :return: iterator of (user id, rating)
+    """
+    rand = random.Random(seed)
+    num_users = num_users or max(1, num_ratings // 30)
+    num_movies = num_movies or max(1, num_ratings // 10)
+    movie_weights = list(itertools.accumulate(
+        1 / rank ** skew for rank in range(1, num_movies + 1)))
+    movie_ids = list(range(1, num_movies + 1))
+    rand.shuffle(movie_ids)
+    counts = array('l', [0] * (num_users + 1))
+    for start in range(0, num_ratings, CHUNK_SIZE):
+        size = min(CHUNK_SIZE, num_ratings - start)
+        for user in rand.choices(range(1, num_users + 1), k=size):
+            counts[user] += 1
+    for user in range(1, num_users + 1):
+        # a user rates each movie at most once
+        wanted = min(counts[user], num_movies // 2 or 1)
+        if wanted == 0:
+            continue
+        movies = set()
+        while len(movies) < wanted:
+            movies.update(rand.choices(movie_ids, cum_weights=movie_weights,
+                                       k=wanted - len(movies)))
+        stars = rand.choices(HALF_STARS, weights=HALF_STAR_WEIGHTS, k=wanted)
+        yield user, dict(zip(sorted(movies), stars))
+
+
+def make_ratings(num_ratings: int, num_users: int = 0, num_movies: int = 0,
+                 skew: float = 1.0, seed: int = 108) -> UserRatingDict:
+    """
+    return the synthetic ratings of iter_ratings as a UserRatingDict
+    >>> ratings = make_ratings(3000, seed=1)
+    >>> len(ratings) <= 100
+    True
+    >>> sum(len(movies) for movies in ratings.values())
+    3000
+    """
+    return dict(iter_ratings(num_ratings, num_users, num_movies, skew, seed))
+
+
+def random_ratings(rand: random.Random, num_ratings: int, num_users: int,
+                   num_movies: int) -> UserRatingDict:
+    """
+    return num_ratings uniformly random half-star ratings drawn from rand,
+    of movies 1 to num_movies by users 1 to num_users; a rating drawn again
+    for the same user and movie replaces the earlier one, so usually fewer
+    are kept; the small unskewed datasets of the unit tests
+    >>> ratings = random_ratings(random.Random(1), 50, 5, 10)
+    >>> sum(len(movies) for movies in ratings.values()) <= 50
+    True
+    >>> all(rating in HALF_STARS for movies in ratings.values()
+    ...     for rating in movies.values())
+    True
+    """
+    ratings = {}
+    for _ in range(num_ratings):
+        ratings.setdefault(rand.randint(1, num_users), {})[
+            rand.randint(1, num_movies)] = rand.randint(1, 10) / 2
+    return ratings
+
+
+def write_dataset(data_dir: str, num_ratings: int, skew: float = 1.0,
+                  seed: int = 108, unknown: float = 0.2) -> tuple:
+    """
+    write a synthetic MovieLens-shaped rating file and matching movie file
+    to data_dir, reusing them if they already exist, and return their
+    (movie file, rating file) paths
+    :param data_dir: directory for the files
+    :param num_ratings: number of ratings
+    :param skew: Zipf exponent of movie popularity
+    :param seed: random seed
+    :param unknown: fraction of rated movie ids left out of the movie file,
+    for remove_unknown_movies to drop
+    :return: (movie file path, rating file path)
+    """
+    name = '%d_%g_%d' % (num_ratings, skew, seed)
+    movie_path = os.path.join(data_dir, 'movies_%s.csv' % name)
+    rating_path = os.path.join(data_dir, 'ratings_%s.csv' % name)
+    if os.path.exists(movie_path) and os.path.exists(rating_path):
+        return movie_path, rating_path
+    os.makedirs(data_dir, exist_ok=True)
+    rand = random.Random(seed)
+    timestamp = 1260759144
+    with open(rating_path + '.tmp', 'w') as rating_file:
+        rating_file.write('userId,movieId,rating,timestamp\n')
+        for user, ratings in iter_ratings(num_ratings, skew=skew, seed=seed):
+            rating_file.writelines('%d,%d,%s,%d\n' % (user, movie, rating,
+                                                      timestamp)
+                                   for movie, rating in ratings.items())
+    with open(movie_path + '.tmp', 'w') as movie_file:
+        movie_file.write('movie_id,title,release_date,runtime,genres\n')
+        for movie in range(1, max(1, num_ratings // 10) + 1):
+            if rand.random() < unknown:
+                continue
+            genres = rand.sample(GENRES, rand.randint(0, 3))
+            movie_file.write(','.join(['%d' % movie, 'Movie %d' % movie,
+                                       '1995-10-30', '100.0'] + genres) +
+                             '\n')
+    os.replace(rating_path + '.tmp', rating_path)
+    os.replace(movie_path + '.tmp', movie_path)
+    return movie_path, rating_path
+
+
+def pick_target(movie_users: MovieUserDict, audience: int) -> Rating:
+    """
+    return a one-movie target rating for the movie whose number of raters
+    is closest to audience, so every dataset size gets a similar
+    neighbourhood
+    :param movie_users: MovieUserDict dictionary
+    :param audience: wanted number of users who rated the target movie
+    :return: target rating
+    >>> pick_target({1: [1, 2, 3], 2: [1], 3: [2, 3]}, 2)
+    {3: 4.0}
+    """
+    movie = min(movie_users,
+                key=lambda movie: (abs(len(movie_users[movie]) - audience),
+                                   movie))
+    return {movie: 4.0}
+
+
+def time_calls(func: Callable[[], object], repeat: int) -> List[float]:
+    """
+    return the wall time in seconds of each of repeat calls to func
+    >>> len(time_calls(lambda: None, 3))
+    3
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def bench_candidates(sizes: List[int], audience: int = 50,
+                     repeat: int = 20) -> List[Dict[str, float]]:
+    """
+    return one row per dataset size with the median latency of candidate
+    generation (get_users_who_watched then get_candidate_movies) for a
+    target whose movie was rated by about audience users
+    :param sizes: numbers of ratings to generate
+    :param audience: wanted number of users who rated the target movie
+    :param repeat: number of timed runs per size
+    :return: list of result rows
+    """
+    rows = []
+    for size in sizes:
+        user_ratings = make_ratings(size)
+        movie_users = movies_to_users(user_ratings)
+        target = pick_target(movie_users, audience)
+
+        def candidates() -> List[int]:
+            """candidate generation for target"""
+            sim_users = get_users_who_watched(list(target), movie_users)
+            return get_candidate_movies(target, sim_users, user_ratings)
+
+        times = sorted(time_calls(candidates, repeat))
+        rows.append({'ratings': size,
+                     'neighbours': len(movie_users[list(target)[0]]),
+                     'candidates': len(candidates()),
+                     'median_ms': times[len(times) // 2] * 1000})
+    return rows
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """
+    return the nearest-rank percentile of values, 0.0 if there are none
+    >>> percentile([4.0, 1.0, 3.0, 2.0], 50)
+    2.0
+    >>> percentile([4.0, 1.0, 3.0, 2.0], 99)
+    4.0
+    >>> percentile([], 90)
+    0.0
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(times: List[float], peak: int = 0) -> Dict[str, float]:
+    """
+    return the latency percentiles in ms of times and the peak memory in KiB
+    >>> summarize([0.001, 0.003, 0.002], 2048)['p50_ms']
+    2.0
+    """
+    return {'runs': len(times),
+            'mean_ms': sum(times) / len(times) * 1000,
+            'p50_ms': percentile(times, 50) * 1000,
+            'p90_ms': percentile(times, 90) * 1000,
+            'p99_ms': percentile(times, 99) * 1000,
+            'peak_kib': peak / 1024}
+
+
+def peak_memory(func: Callable[[], object]) -> int:
+    """
+    return the peak number of bytes Python allocated while running func
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def retained_memory(func: Callable[[], object]) -> int:
+    """
+    return the number of bytes Python allocated for the result of func
+    that are still held once it returns
+    """
+    tracemalloc.start()
+    try:
+        result = func()
+        size = tracemalloc.get_traced_memory()[0]
+        del result
+        return size
+    finally:
+        tracemalloc.stop()
+
+
+def sample_targets(user_ratings: UserRatingDict, count: int,
+                   seed: int = 108) -> List[Rating]:
+    """
+    return count target ratings, each made of up to 5 ratings of a random
+    user, so the targets look like real users' histories
+    >>> targets = sample_targets({1: {10: 4.0}, 2: {11: 3.0, 12: 5.0}}, 3)
+    >>> len(targets)
+    3
+    """
+    rand = random.Random(seed)
+    users = sorted(user_ratings)
+    targets = []
+    for _ in range(count):
+        ratings = user_ratings[rand.choice(users)]
+        movies = rand.sample(sorted(ratings), min(len(ratings),
+                                                  rand.randint(1, 5)))
+        targets.append({movie: ratings[movie] for movie in movies})
+    return targets
+
+
+def bench_pipeline(movie_path: str, rating_path: str, queries: int = 50,
+                   repeat: int = 3, memory: bool = True) -> Dict[str, Dict]:
+    """
+    return latency percentiles and peak memory for each pipeline stage on
+    the given files: the load stages run repeat times each, the query
+    stages once per sampled target
+    :param movie_path: movie file
+    :param rating_path: rating file
+    :param queries: number of sampled targets
+    :param repeat: number of runs of each load stage
+    :param memory: measure peak memory with tracemalloc in one extra run
+    of each stage
+    :return: {stage: summary}
+    """
+    with open(movie_path) as movie_file:
+        movies = read_movies(movie_file)
+    load_times = {'read_ratings': [], 'remove_unknown_movies': [],
+                  'movies_to_users': [], 'rating_index': [],
+                  'prepare_ratings': []}
+    peaks = dict.fromkeys(load_times, 0)
+    state = {}
+
+    def read() -> None:
+        """read_ratings stage"""
+        with open(rating_path) as rating_file:
+            state['ratings'] = read_ratings(rating_file)
+
+    def remove() -> None:
+        """remove_unknown_movies stage"""
+        remove_unknown_movies(state['ratings'], movies)
+
+    def build_users() -> None:
+        """movies_to_users stage"""
+        state['movie_users'] = movies_to_users(state['ratings'])
+
+    def build_index() -> None:
+        """RatingIndex stage"""
+        state['index'] = RatingIndex(state['ratings'])
+
+    def prepare() -> None:
+        """read_ratings, remove_unknown_movies and movies_to_users as one
+        pass over the cached columns"""
+        load_prepared_ratings(rating_path, movies)
+
+    stages = [('read_ratings', read), ('remove_unknown_movies', remove),
+              ('movies_to_users', build_users), ('rating_index', build_index),
+              ('prepare_ratings', prepare)]
+    for _ in range(repeat):
+        for stage, func in stages:
+            load_times[stage].extend(time_calls(func, 1))
+    if memory:
+        for stage, func in stages:
+            peaks[stage] = peak_memory(func)
+    results = {stage: summarize(times, peaks[stage])
+               for stage, times in load_times.items()}
+
+    ratings = state['ratings']
+    movie_users = state['movie_users']
+    index = state['index']
+    targets = sample_targets(ratings, queries)
+    query_stages = [
+        ('get_similar_users',
+         lambda target: get_similar_users(target, ratings, movie_users,
+                                          index)),
+        ('recommend_movies',
+         lambda target: recommend_movies(target, ratings, movie_users, 5,
+                                         index))]
+    for stage, func in query_stages:
+        times = []
+        for target in targets:
+            times.extend(time_calls(lambda: func(target), 1))
+        peak = 0
+        if memory:
+            peak = max(peak_memory(lambda: func(target))
+                       for target in targets[:5])
+        results[stage] = summarize(times, peak)
+    stage_times = {}
+    for target in targets:
+        trace = RecommendTrace()
+        recommend_movies(target, ratings, movie_users, 5, index, trace)
+        for stage, seconds, _ in trace.stages:
+            stage_times.setdefault(stage, []).append(seconds)
+    for stage, times in stage_times.items():
+        results['recommend_movies/' + stage] = summarize(times)
+    return results
+
+
+def bench_memory(rating_path: str, queries: int = 50) -> Dict[str, Dict]:
+    """
+    return the memory held by the ratings of rating_path as a
+    UserRatingDict and as a CompactRatings, and the latency of
+    recommend_movies on each
+    :param rating_path: rating file
+    :param queries: number of sampled targets
+    :return: {representation: {'bytes', 'bytes_per_rating', 'query'}}
+    """
+    with open_rating_columns(rating_path) as columns:
+        count = len(columns)
+
+        def as_dict() -> UserRatingDict:
+            """UserRatingDict of the file"""
+            return columns.to_user_ratings()
+
+        def as_compact() -> CompactRatings:
+            """CompactRatings of the file"""
+            return CompactRatings.from_columns(columns.users.tolist(),
+                                               columns.movies.tolist(),
+                                               columns.ratings.tolist())
+
+        representations = [('dict', as_dict), ('compact', as_compact)]
+        sizes = {name: retained_memory(build)
+                 for name, build in representations}
+        built = {name: build() for name, build in representations}
+    targets = sample_targets(built['dict'], queries)
+    results = {}
+    for name, ratings in built.items():
+        movie_users = movies_to_users(ratings)
+        index = RatingIndex(ratings)
+        times = []
+        for target in targets:
+            times.extend(time_calls(
+                lambda: recommend_movies(target, ratings, movie_users, 5,
+                                         index), 1))
+        results[name] = {'bytes': sizes[name],
+                         'bytes_per_rating': sizes[name] / max(count, 1),
+                         'query': summarize(times)}
+    return results
+
+
+def bench_genres(movie_path: str, rating_path: str,
+                 queries: int = 50) -> List[Dict]:
+    """
+    return, for the rarest genre, the most common genre and the two most
+    common genres, the latency of recommend_movies filtered to them after
+    scoring every candidate and with genre_movies, and whether both give
+    the same movies
+    :param movie_path: movie file
+    :param rating_path: rating file
+    :param queries: number of sampled targets
+    :return: list of {'genres', 'movies', 'post_ms', 'push_ms', 'same'}
+    """
+    movies = load_movies(movie_path)
+    ratings, movie_users = load_prepared_ratings(rating_path, movies)
+    index = RatingIndex(ratings)
+    genre_index = GenreIndex(movies)
+    by_size = genre_index.genres()
+    targets = sample_targets(ratings, queries)
+    rows = []
+    for genres in ([by_size[-1]], [by_size[0]], by_size[:2]):
+        allowed = genre_index.movies_with(genres)
+        post_times = []
+        push_times = []
+        same = True
+        for target in targets:
+            post = []
+
+            def post_filter() -> None:
+                """score every candidate, then keep the genre's movies"""
+                user_sim_dict = get_similar_users(target, ratings,
+                                                  movie_users, index)
+                candidate_movies = get_candidate_movies(
+                    target, list(user_sim_dict), ratings)
+                movie_score_dict = get_movie_score_dict(
+                    candidate_movies, user_sim_dict, ratings, index)
+                post[:] = sort_moviescore_dict(
+                    {movie: score for movie, score in movie_score_dict.items()
+                     if movie in allowed}, 5)
+
+            post_times.extend(time_calls(post_filter, 1))
+            push_times.extend(time_calls(
+                lambda: recommend_movies(target, ratings, movie_users, 5,
+                                         index, genre_movies=allowed), 1))
+            same = same and post == recommend_movies(
+                target, ratings, movie_users, 5, index, genre_movies=allowed)
+        rows.append({'genres': genres, 'movies': len(allowed),
+                     'post_ms': summarize(post_times)['p50_ms'],
+                     'push_ms': summarize(push_times)['p50_ms'],
+                     'same': same})
+    return rows
+
+
+def bench_pages(movie_path: str, rating_path: str, queries: int = 50,
+                pages: int = 4, page_size: int = 5) -> Dict[str, float]:
+    """
+    return the mean time to fetch pages pages of page_size movies per
+    target by calling recommend_movies with a growing num_movies and with
+    a RecommendCursor, and whether both give the same pages
+    :param movie_path: movie file
+    :param rating_path: rating file
+    :param queries: number of sampled targets
+    :param pages: pages fetched per target
+    :param page_size: movies per page
+    :return: {'recommend_ms', 'cursor_ms', 'same'}
+    """
+    movies = load_movies(movie_path)
+    ratings, movie_users = load_prepared_ratings(rating_path, movies)
+    index = RatingIndex(ratings)
+    targets = sample_targets(ratings, queries)
+    fetched = {'recommend': [], 'cursor': []}
+
+    def by_recommend() -> None:
+        """page by recomputing recommend_movies for each page"""
+        for target in targets:
+            for page in range(1, pages + 1):
+                results = recommend_movies(target, ratings, movie_users,
+                                           page * page_size, index)
+                fetched['recommend'].append(
+                    results[(page - 1) * page_size:])
+
+    def by_cursor() -> None:
+        """page with one cursor per target"""
+        for target in targets:
+            cursor = RecommendCursor(target, ratings, movie_users, index)
+            for _ in range(pages):
+                fetched['cursor'].append(cursor.next_page(page_size))
+            cursor.close()
+
+    recommend_times = time_calls(by_recommend, 1)
+    cursor_times = time_calls(by_cursor, 1)
+    return {'recommend_ms': recommend_times[0] * 1000 / len(targets),
+            'cursor_ms': cursor_times[0] * 1000 / len(targets),
+            'same': fetched['recommend'] == fetched['cursor']}
+
+
+def bench_pruning(movie_path: str, rating_path: str, queries: int = 100,
+                  min_similarities: Sequence[float] = (0.0, 0.01, 0.05),
+                  top_ms: Sequence[Optional[int]] = (None, 1000, 200, 50),
+                  num_movies: int = 5) -> List[Dict]:
+    """
+    return, for every min_similarity and top_m setting and for sampled and
+    popular single-movie targets, the latency of recommend_movies with
+    pruned neighbours, its speed-up over no pruning, the mean number of
+    neighbours kept, and how well its recommendations agree with the
+    unpruned ones: the mean share of the unpruned movies it recommends and
+    the share of targets with exactly the same list
+    :param movie_path: movie file
+    :param rating_path: rating file
+    :param queries: targets of each kind
+    :param min_similarities: min_similarity values to try
+    :param top_ms: top_m values to try, None for no limit
+    :param num_movies: movies recommended per target
+    :return: list of {'targets', 'min_similarity', 'top_m', 'p50_ms',
+    'speedup', 'neighbours', 'overlap', 'same'}
+    """
+    movies = load_movies(movie_path)
+    ratings, movie_users = load_prepared_ratings(rating_path, movies)
+    index = RatingIndex(ratings)
+    popular = sorted(movie_users, key=lambda movie: -len(movie_users[movie]))
+    workloads = [('sampled', sample_targets(ratings, queries)),
+                 ('popular seed', [{movie: 5.0} for movie
+                                   in popular[:queries]])]
+    rows = []
+    for name, targets in workloads:
+        expected = []
+        base_times = []
+        for target in targets:
+            base_times.extend(time_calls(
+                lambda: expected.append(recommend_movies(
+                    target, ratings, movie_users, num_movies, index)), 1))
+        base_ms = summarize(base_times)['p50_ms']
+        for min_similarity in min_similarities:
+            for top_m in top_ms:
+                times = []
+                neighbours = overlap = same = 0
+                for target, unpruned in zip(targets, expected):
+                    results = []
+                    times.extend(time_calls(
+                        lambda: results.append(recommend_movies(
+                            target, ratings, movie_users, num_movies, index,
+                            min_similarity=min_similarity, top_m=top_m)), 1))
+                    neighbours += len(get_similar_users(
+                        target, ratings, movie_users, index, min_similarity,
+                        top_m))
+                    if unpruned:
+                        overlap += len(set(results[0]) & set(unpruned)) / \
+                            len(unpruned)
+                    else:
+                        overlap += 1
+                    same += results[0] == unpruned
+                p50_ms = summarize(times)['p50_ms']
+                rows.append({'targets': name,
+                             'min_similarity': min_similarity,
+                             'top_m': top_m, 'p50_ms': p50_ms,
+                             'speedup': base_ms / p50_ms,
+                             'neighbours': neighbours / len(targets),
+                             'overlap': overlap / len(targets),
+                             'same': same / len(targets)})
+    return rows
+
+
+def split_read_movies(movie_file: TextIO) -> MovieDict:
+    """
+    return read_movies of movie_file as it was before quoted fields were
+    handled, splitting every line on commas
+    """
+    res_dict = {}
+    movie_file.readline()  # skip header
+    for line in movie_file:
+        info_list = line.rstrip("\n").split(",")
+        res_dict[int(info_list[0])] = (info_list[1], info_list[4:])
+    return res_dict
+
+
+def csv_read_movies(movie_file: TextIO) -> MovieDict:
+    """
+    return read_movies of movie_file parsed entirely by the csv module
+    """
+    reader = csv.reader(movie_file)
+    next(reader)  # skip header
+    return {int(info_list[0]): (info_list[1], info_list[4:])
+            for info_list in reader}
+
+
+def write_quoted_movies(movie_path: str, quoted_path: str,
+                        every: int) -> None:
+    """
+    copy the movie file at movie_path to quoted_path with every every-th
+    title given a comma and an escaped quote, and so quoted
+    """
+    with open(movie_path) as movie_file, \
+            open(quoted_path, 'w') as quoted_file:
+        quoted_file.write(movie_file.readline())
+        for number, line in enumerate(movie_file):
+            if number % every == 0:
+                info_list = line.split(',', 2)
+                title = '"%s, ""The"""' % info_list[1].replace('"', '""')
+                line = ','.join([info_list[0], title, info_list[2]])
+            quoted_file.write(line)
+
+
+def bench_movies(movie_path: str, repeat: int = 5,
+                 data_dir: str = DATA_DIR) -> List[Dict]:
+    """
+    return the median time of each movie parser on movie_path and on
+    copies with one title in 100 and one in 10 quoted, and whether each
+    parser's result matches the csv module's
+    :param movie_path: movie file
+    :param repeat: runs of each parser on each file
+    :param data_dir: directory for the quoted copies
+    :return: list of {'file', 'parser', 'p50_ms', 'correct'}
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    files = [movie_path]
+    for every in (100, 10):
+        quoted_path = os.path.join(data_dir, 'movies_quoted_%d.csv' % every)
+        write_quoted_movies(movie_path, quoted_path, every)
+        files.append(quoted_path)
+    parsers = [('split', split_read_movies), ('csv', csv_read_movies),
+               ('read_movies', read_movies)]
+    rows = []
+    for path in files:
+        with open(path) as movie_file:
+            expected = csv_read_movies(movie_file)
+        for name, parser in parsers:
+            result = {}
+
+            def parse() -> None:
+                """parse the whole file"""
+                with open(path) as movie_file:
+                    result['movies'] = parser(movie_file)
+
+            times = time_calls(parse, repeat)
+            rows.append({'file': os.path.basename(path), 'parser': name,
+                         'p50_ms': summarize(times)['p50_ms'],
+                         'correct': result['movies'] == expected})
+    return rows
+
+
+def git_revision() -> str:
+    """
+    return the current git commit, or '' outside a git checkout
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def compare_results(old: Dict, new: Dict,
+                    threshold: float = 1.1) -> List[Dict[str, object]]:
+    """
+    return one row per stage in both results with the ratio of new to old
+    p50 latency, flagged as a regression above threshold
+    >>> old = {'stages': {'read_ratings': {'p50_ms': 10.0}}}
+    >>> new = {'stages': {'read_ratings': {'p50_ms': 12.5}}}
+    >>> compare_results(old, new)
+    [{'stage': 'read_ratings', 'old_ms': 10.0, 'new_ms': 12.5, 'ratio': 1.25, \
+'regression': True}]
+    """
+    rows = []
+    for stage, new_stage in new['stages'].items():
+        if stage not in old['stages']:
+            continue
+        old_ms = old['stages'][stage]['p50_ms']
+        new_ms = new_stage['p50_ms']
+        ratio = new_ms / old_ms if old_ms else float('inf')
+        rows.append({'stage': stage, 'old_ms': old_ms, 'new_ms': new_ms,
+                     'ratio': ratio, 'regression': ratio > threshold})
+    return rows
+
+
+def main() -> None:
+    """
+    parse the command line and run the chosen benchmark
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    candidates = commands.add_parser(
+        'candidates', help='candidate generation latency by dataset size')
+    candidates.add_argument('--sizes', type=int, nargs='+',
+                            default=[10 ** 4, 10 ** 5, 10 ** 6])
+    candidates.add_argument('--audience', type=int, default=50)
+    candidates.add_argument('--repeat', type=int, default=20)
+
+    generate = commands.add_parser(
+        'generate', help='write synthetic movie and rating files')
+    generate.add_argument('--ratings', type=float, default=10 ** 5)
+    generate.add_argument('--skew', type=float, default=1.0)
+    generate.add_argument('--seed', type=int, default=108)
+    generate.add_argument('--data-dir', default=DATA_DIR)
+
+    run = commands.add_parser(
+        'run', help='time each pipeline stage and write the results as JSON')
+    run.add_argument('--ratings', type=float, default=10 ** 5,
+                     help='synthetic dataset size, from 1e4 to 1e7')
+    run.add_argument('--skew', type=float, default=1.0)
+    run.add_argument('--seed', type=int, default=108)
+    run.add_argument('--data-dir', default=DATA_DIR)
+    run.add_argument('--movie-file', help='use this movie file instead')
+    run.add_argument('--rating-file', help='use this rating file instead')
+    run.add_argument('--queries', type=int, default=50)
+    run.add_argument('--repeat', type=int, default=3)
+    run.add_argument('--no-memory', action='store_true',
+                     help='skip the tracemalloc peak memory runs')
+    run.add_argument('--output', default='-',
+                     help="JSON result file, '-' for stdout")
+
+    memory = commands.add_parser(
+        'memory', help='memory of UserRatingDict against CompactRatings')
+    memory.add_argument('--ratings', type=float, default=10 ** 5,
+                        help='synthetic dataset size')
+    memory.add_argument('--seed', type=int, default=108)
+    memory.add_argument('--data-dir', default=DATA_DIR)
+    memory.add_argument('--rating-file', help='use this rating file instead')
+    memory.add_argument('--queries', type=int, default=50)
+
+    genres = commands.add_parser(
+        'genres', help='genre filtered recommendations, post filter against '
+                       'genre_movies')
+    genres.add_argument('--ratings', type=float, default=10 ** 5,
+                        help='synthetic dataset size')
+    genres.add_argument('--seed', type=int, default=108)
+    genres.add_argument('--data-dir', default=DATA_DIR)
+    genres.add_argument('--movie-file', help='use this movie file instead')
+    genres.add_argument('--rating-file', help='use this rating file instead')
+    genres.add_argument('--queries', type=int, default=50)
+
+    prune = commands.add_parser(
+        'prune', help='speed-up and agreement of neighbour pruning')
+    prune.add_argument('--movie-file', default='movies.csv')
+    prune.add_argument('--rating-file', default='ratings_small.csv')
+    prune.add_argument('--queries', type=int, default=100)
+    prune.add_argument('--min-similarity', type=float, nargs='+',
+                       default=[0.0, 0.01, 0.05])
+    prune.add_argument('--top-m', type=int, nargs='+',
+                       default=[0, 1000, 200, 50],
+                       help='neighbours kept, 0 for no limit')
+
+    pages = commands.add_parser(
+        'pages', help='paging with recommend_movies against a cursor')
+    pages.add_argument('--movie-file', default='movies.csv')
+    pages.add_argument('--rating-file', default='ratings_small.csv')
+    pages.add_argument('--queries', type=int, default=50)
+    pages.add_argument('--pages', type=int, default=4)
+    pages.add_argument('--page-size', type=int, default=5)
+
+    movies = commands.add_parser(
+        'movies', help='read_movies against split and csv module parsers')
+    movies.add_argument('--movie-file', default='movies.csv')
+    movies.add_argument('--repeat', type=int, default=5)
+    movies.add_argument('--data-dir', default=DATA_DIR)
+
+    compare = commands.add_parser(
+        'compare', help='compare two JSON results from run')
+    compare.add_argument('old')
+    compare.add_argument('new')
+    compare.add_argument('--threshold', type=float, default=1.1)
+    args = parser.parse_args()
+
+    if args.command == 'candidates':
+        print('%10s %10s %10s %10s' % ('ratings', 'neighbours', 'candidates',
+                                        'median_ms'))
+        for row in bench_candidates(args.sizes, args.audience, args.repeat):
+            print('%10d %10d %10d %10.3f' % (row['ratings'], row['neighbours'],
+                                              row['candidates'],
+                                              row['median_ms']))
+    elif args.command == 'generate':
+        for path in write_dataset(args.data_dir, int(args.ratings), args.skew,
+                                  args.seed):
+            print(path)
+    elif args.command == 'run':
+        dataset = {'movie_file': args.movie_file,
+                   'rating_file': args.rating_file}
+        if not (args.movie_file and args.rating_file):
+            movie_path, rating_path = write_dataset(
+                args.data_dir, int(args.ratings), args.skew, args.seed)
+            dataset = {'movie_file': movie_path, 'rating_file': rating_path,
+                       'ratings': int(args.ratings), 'skew': args.skew,
+                       'seed': args.seed}
+        stages = bench_pipeline(dataset['movie_file'], dataset['rating_file'],
+                                args.queries, args.repeat, not args.no_memory)
+        result = {'revision': git_revision(),
+                  'python': platform.python_version(),
+                  'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                  'dataset': dataset, 'queries': args.queries,
+                  'repeat': args.repeat, 'stages': stages}
+        if args.output == '-':
+            print(json.dumps(result, indent=2))
+        else:
+            with open(args.output, 'w') as output:
+                json.dump(result, output, indent=2)
+    elif args.command == 'memory':
+        rating_path = args.rating_file
+        if not rating_path:
+            rating_path = write_dataset(args.data_dir, int(args.ratings),
+                                        seed=args.seed)[1]
+        print('%10s %14s %16s %16s' % ('storage', 'bytes', 'bytes/rating',
+                                        'query_p50_ms'))
+        for name, row in bench_memory(rating_path, args.queries).items():
+            print('%10s %14d %16.1f %16.3f' % (name, row['bytes'],
+                                               row['bytes_per_rating'],
+                                               row['query']['p50_ms']))
+    elif args.command == 'genres':
+        movie_path, rating_path = args.movie_file, args.rating_file
+        if not (movie_path and rating_path):
+            movie_path, rating_path = write_dataset(
+                args.data_dir, int(args.ratings), seed=args.seed)
+        print('%-28s %7s %10s %10s %5s' % ('genres', 'movies', 'post_ms',
+                                            'push_ms', 'same'))
+        for row in bench_genres(movie_path, rating_path, args.queries):
+            print('%-28s %7d %10.3f %10.3f %5s' % (
+                ' | '.join(row['genres']), row['movies'], row['post_ms'],
+                row['push_ms'], row['same']))
+    elif args.command == 'prune':
+        print('%12s %7s %6s %9s %8s %10s %8s %6s' % (
+            'targets', 'min_sim', 'top_m', 'p50_ms', 'speedup', 'neighbours',
+            'overlap', 'same'))
+        for row in bench_pruning(args.movie_file, args.rating_file,
+                                 args.queries, args.min_similarity,
+                                 [top_m or None for top_m in args.top_m]):
+            print('%12s %7.3f %6s %9.3f %8.2f %10.1f %8.3f %6.2f' % (
+                row['targets'], row['min_similarity'], row['top_m'] or '-',
+                row['p50_ms'], row['speedup'], row['neighbours'],
+                row['overlap'], row['same']))
+    elif args.command == 'pages':
+        report = bench_pages(args.movie_file, args.rating_file, args.queries,
+                             args.pages, args.page_size)
+        print('%d pages of %d: recommend_movies %.3f ms, cursor %.3f ms '
+              'per target, same %s' % (args.pages, args.page_size,
+                                       report['recommend_ms'],
+                                       report['cursor_ms'], report['same']))
+    elif args.command == 'movies':
+        print('%-24s %12s %10s %8s' % ('file', 'parser', 'p50_ms',
+                                        'correct'))
+        for row in bench_movies(args.movie_file, args.repeat, args.data_dir):
+            print('%-24s %12s %10.3f %8s' % (row['file'], row['parser'],
+                                             row['p50_ms'], row['correct']))
+    elif args.command == 'compare':
+        with open(args.old) as old_file, open(args.new) as new_file:
+            rows = compare_results(json.load(old_file), json.load(new_file),
+                                   args.threshold)
+        print('%22s %12s %12s %8s' % ('stage', 'old_p50_ms', 'new_p50_ms',
+                                       'ratio'))
+        for row in rows:
+            print('%22s %12.3f %12.3f %8.2f%s' % (
+                row['stage'], row['old_ms'], row['new_ms'], row['ratio'],
+                '  REGRESSION' if row['regression'] else ''))
+
+
+if __name__ == '__main__':
+    main()
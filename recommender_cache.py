@@ -0,0 +1,293 @@
+"""LRU result caching for the CSC108 A3 recommender.
+
+CachedRecommender answers recommend_movies from two bounded LRU caches:
+one of neighbour similarity maps keyed by the target ratings and the
+pruning options, and one of final top-N lists keyed by those, num_movies
+and the genre filter. Target ratings are keyed in a canonical form, so
+dicts with the same ratings in a different order, or 5 instead of 5.0,
+share an entry. Misses are scored from the canonical form too, with
+get_similar_users and score_similar_users, the same steps as
+recommend_movies, so every target sharing an entry gets exactly the
+result recommend_movies gives the target with its movies in ascending
+order, whichever of them was scored first. Both caches are
+cleared whenever the underlying RatingStore changes, and callers get
+copies of the cached values.
+"""
+
+import sys
+from collections import OrderedDict
+from typing import AbstractSet, List, Dict, Optional, Hashable
+
+from recommender_constants import Rating
+from recommender_constants import USER_RATING_DICT_SMALL
+from recommender_functions import (RecommendTrace, get_similar_users,
+                                   score_similar_users, sort_moviescore_dict)
+from recommender_store import RatingStore
+
+
+def canonical_target(target_rating: Rating) -> tuple:
+    """
+    return a hashable form of target_rating that does not depend on the
+    order of the ratings or on int versus float ratings
+    >>> canonical_target({745: 5, 1262: 4.5})
+    ((745, 5.0), (1262, 4.5))
+    >>> canonical_target({1262: 4.5, 745: 5.0}) == canonical_target(
+    ...     {745: 5, 1262: 4.5})
+    True
+    """
+    return tuple(sorted((movie, float(rating))
+                        for movie, rating in target_rating.items()))
+
+
+def approx_size(value: object) -> int:
+    """
+    return the approximate number of bytes held by value, a number or a
+    dict / list / tuple of numbers
+    >>> approx_size([1, 2]) > approx_size([1])
+    True
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += sys.getsizeof(key) + sys.getsizeof(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            size += sys.getsizeof(item)
+    return size
+
+
+class LRUCache:
+    """
+    A mapping that keeps at most max_entries items and about max_bytes of
+    values, evicting the least recently used first
+    :ivar hits: number of lookups that found their key
+    :ivar misses: number of lookups that did not
+    :ivar evictions: number of items dropped to stay within the bounds
+    >>> cache = LRUCache(max_entries=2)
+    >>> cache.put('a', [1])
+    >>> cache.put('b', [2])
+    >>> cache.get('a')
+    [1]
+    >>> cache.put('c', [3])
+    >>> cache.get('b') is None
+    True
+    >>> cache.hits, cache.misses, cache.evictions
+    (1, 1, 1)
+    """
+
+    def __init__(self, max_entries: int = 1024,
+                 max_bytes: Optional[int] = None) -> None:
+        """
+        :param max_entries: largest number of cached items
+        :param max_bytes: largest approximate total size of cached values,
+        unbounded if None
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+        self._items = OrderedDict()
+
+    def __len__(self) -> int:
+        """
+        return the number of cached items
+        """
+        return len(self._items)
+
+    def get(self, key: Hashable) -> Optional[object]:
+        """
+        return the value cached for key and mark it most recently used, or
+        None if key is not cached
+        """
+        if key not in self._items:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._items.move_to_end(key)
+        return self._items[key][0]
+
+    def put(self, key: Hashable, value: object) -> None:
+        """
+        cache value for key, evicting least recently used items as needed;
+        a value larger than max_bytes on its own is not cached
+        """
+        size = approx_size(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        if key in self._items:
+            self.size -= self._items.pop(key)[1]
+        self._items[key] = (value, size)
+        self.size += size
+        while len(self._items) > self.max_entries or \
+                (self.max_bytes is not None and self.size > self.max_bytes):
+            self.size -= self._items.popitem(last=False)[1][1]
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """
+        drop every cached item, keeping the counters
+        """
+        self._items.clear()
+        self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        return the counters and current size of the cache
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'entries': len(self._items),
+                'bytes': self.size}
+
+
+class CachedRecommender:
+    """
+    recommend_movies over a RatingStore with cached neighbour similarities
+    and top-N lists
+    >>> store = RatingStore({user: dict(ratings) for user, ratings
+    ...                      in USER_RATING_DICT_SMALL.items()})
+    >>> recommender = CachedRecommender(store)
+    >>> recommender.recommend_movies({68735: 4.5}, 2)
+    [302156, 293660]
+    >>> recommender.recommend_movies({68735: 4.5}, 2)
+    [302156, 293660]
+    >>> recommender.recommend_movies({68735: 4.5}, 1)
+    [302156]
+    >>> recommender.stats()['results']['hits']
+    1
+    >>> recommender.stats()['similarities']['hits']
+    1
+    >>> store.add_rating(3, 124057, 5.0)
+    >>> store.add_rating(3, 68735, 4.0)
+    >>> recommender.recommend_movies({68735: 4.5}, 2)
+    [302156, 124057]
+    >>> trace = RecommendTrace()
+    >>> recommender.recommend_movies({68735: 4.5}, 2, trace)
+    [302156, 124057]
+    >>> trace.counters, trace.stages
+    ({'result_cache_hits': 1}, [])
+    >>> recommender.recommend_movies({68735: 4.5}, 2,
+    ...                              genre_movies=frozenset([124057]))
+    [124057]
+    """
+
+    def __init__(self, store: RatingStore, max_results: int = 4096,
+                 max_similarities: int = 256,
+                 max_bytes: Optional[int] = 64 * 1024 * 1024) -> None:
+        """
+        :param store: ratings to recommend from; the caches are cleared
+        whenever it changes
+        :param max_results: most cached top-N lists
+        :param max_similarities: most cached similarity maps
+        :param max_bytes: approximate memory bound of each cache
+        """
+        self.store = store
+        self.results = LRUCache(max_results, max_bytes)
+        self.similarities = LRUCache(max_similarities, max_bytes)
+        self._version = store.version
+
+    def invalidate(self) -> None:
+        """
+        drop all cached similarities and results
+        """
+        self.results.clear()
+        self.similarities.clear()
+        self._version = self.store.version
+
+    def _similar_users(self, target: tuple, min_similarity: float,
+                       top_m: Optional[int],
+                       trace: Optional[RecommendTrace]) -> Dict[int, float]:
+        """
+        return the cached get_similar_users dictionary for the canonical
+        target, computing it on a miss; callers must not change it
+        """
+        if self._version != self.store.version:
+            self.invalidate()
+        key = (target, min_similarity, top_m)
+        user_sim_dict = self.similarities.get(key)
+        if trace is not None:
+            trace.count('similarity_cache_misses' if user_sim_dict is None
+                        else 'similarity_cache_hits')
+        if user_sim_dict is None:
+            store = self.store
+            user_sim_dict = get_similar_users(dict(target),
+                                              store.user_ratings,
+                                              store.movie_users, store.index,
+                                              min_similarity, top_m)
+            self.similarities.put(key, user_sim_dict)
+        return user_sim_dict
+
+    def similar_users(self, target_rating: Rating,
+                      trace: Optional[RecommendTrace] = None,
+                      min_similarity: float = 0.0,
+                      top_m: Optional[int] = None) -> Dict[int, float]:
+        """
+        return get_similar_users for target_rating, cached
+        :param target_rating: dictionary of movie_ids to rating
+        :param trace: counts similarity cache hits and misses if given
+        :param min_similarity: prune as in get_similar_users
+        :param top_m: prune as in get_similar_users
+        :return: dictionary of user id to similarity score, a copy the
+        caller may change
+        """
+        return dict(self._similar_users(canonical_target(target_rating),
+                                        min_similarity, top_m, trace))
+
+    def recommend_movies(self, target_rating: Rating, num_movies: int,
+                         trace: Optional[RecommendTrace] = None,
+                         genre_movies: Optional[AbstractSet[int]] = None,
+                         min_similarity: float = 0.0,
+                         top_m: Optional[int] = None) -> List[int]:
+        """
+        return recommend_movies for target_rating, cached
+        :param target_rating: dictionary of movie_ids to rating
+        :param num_movies: number of movies to recommend
+        :param trace: records the stages and the cache hits and misses if
+        given
+        :param genre_movies: only recommend these movies, if given
+        :param min_similarity: prune as in get_similar_users
+        :param top_m: prune as in get_similar_users
+        :return: list of recommended movie ids
+        """
+        if self._version != self.store.version:
+            self.invalidate()
+        if genre_movies is not None:
+            genre_movies = frozenset(genre_movies)
+        target = canonical_target(target_rating)
+        key = (target, num_movies, genre_movies, min_similarity, top_m)
+        movies = self.results.get(key)
+        if trace is not None:
+            trace.count('result_cache_misses' if movies is None
+                        else 'result_cache_hits')
+        if movies is None:
+            store = self.store
+            if trace is not None:
+                start = trace.start()
+            user_sim_dict = self._similar_users(target, min_similarity,
+                                                top_m, trace)
+            if trace is not None:
+                trace.record('get_similar_users', start, len(user_sim_dict))
+            movie_score_dict = score_similar_users(
+                dict(target), user_sim_dict, store.user_ratings, store.index,
+                genre_movies, trace)
+            if trace is not None:
+                start = trace.start()
+            movies = sort_moviescore_dict(movie_score_dict, num_movies)
+            if trace is not None:
+                trace.record('sort_moviescore_dict', start, len(movies))
+            self.results.put(key, movies)
+        return list(movies)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        return the hit / miss counters of both caches
+        """
+        return {'results': self.results.stats(),
+                'similarities': self.similarities.stats()}
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
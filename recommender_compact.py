@@ -0,0 +1,370 @@
+"""Compact array-backed ratings for the CSC108 A3 recommender.
+
+A UserRatingDict spends over 100 bytes on every rating: a dict slot, a
+boxed movie id and a boxed float. CompactRatings keeps all ratings in a few
+flat arrays instead: the sorted user ids, the offset of each user's row, and
+per row the sorted movie ids with their ratings packed as half stars in one
+byte each, about 5 bytes per rating. It is a Mapping of user id to a Mapping
+of movie id to rating, so the functions in recommender_functions accept it
+wherever they take a UserRatingDict. Ratings cannot be added or changed, but
+they can be deleted, so remove_unknown_movies also works on it in place.
+"""
+
+import bisect
+import heapq
+from array import array
+from collections.abc import Mapping, ItemsView, ValuesView
+from typing import Iterable, Iterator, Optional, Tuple
+
+from recommender_constants import USER_RATING_DICT_SMALL, MOVIE_DICT_SMALL
+
+# packed rating of a deleted movie
+REMOVED = 0
+
+
+def to_stars(rating: float) -> int:
+    """
+    return rating packed as a number of half stars
+    :raise ValueError: if rating is not a half star rating from 0.5 to 127.5
+    >>> to_stars(3.5)
+    7
+    >>> to_stars(3.2)
+    Traceback (most recent call last):
+    ...
+    ValueError: rating 3.2 is not a positive half star rating
+    """
+    stars = rating * 2
+    if stars != int(stars) or not 0 < stars <= 255:
+        raise ValueError('rating %r is not a positive half star rating'
+                         % rating)
+    return int(stars)
+
+
+class UserRatings(Mapping):
+    """
+    The ratings of one user in a CompactRatings, a read-only Mapping of
+    movie id to rating whose movies can be deleted
+    >>> ratings = CompactRatings(USER_RATING_DICT_SMALL)[2]
+    >>> ratings[293660]
+    4.5
+    >>> list(ratings.items())
+    [(68735, 1.0), (124057, 1.5), (293660, 4.5)]
+    >>> ratings == USER_RATING_DICT_SMALL[2]
+    True
+    """
+    __slots__ = ('_store', '_pos', '_start', '_end')
+
+    def __init__(self, store: 'CompactRatings', pos: int) -> None:
+        """
+        :param store: the CompactRatings holding the row
+        :param pos: position of the user in store.user_ids
+        """
+        self._store = store
+        self._pos = pos
+        self._start = store.offsets[pos]
+        self._end = store.offsets[pos + 1]
+
+    def _find(self, movie_id: int) -> int:
+        """
+        return the position of movie_id in the row, or -1 if it is not rated
+        """
+        movie_ids = self._store.movie_ids
+        pos = bisect.bisect_left(movie_ids, movie_id, self._start, self._end)
+        if pos < self._end and movie_ids[pos] == movie_id and \
+                self._store.stars[pos] != REMOVED:
+            return pos
+        return -1
+
+    def __getitem__(self, movie_id: int) -> float:
+        """
+        return the rating of movie_id
+        :raise KeyError: if the user did not rate movie_id
+        """
+        pos = self._find(movie_id)
+        if pos < 0:
+            raise KeyError(movie_id)
+        return self._store.stars[pos] / 2
+
+    def __contains__(self, movie_id: object) -> bool:
+        """
+        return whether the user rated movie_id
+        """
+        return self._find(movie_id) >= 0
+
+    def __iter__(self) -> Iterator[int]:
+        """
+        iterate over the rated movie ids in ascending order
+        """
+        for movie_id, _ in self._pairs():
+            yield movie_id
+
+    def __len__(self) -> int:
+        """
+        return the number of rated movies
+        """
+        return self._store.counts[self._pos]
+
+    def __delitem__(self, movie_id: int) -> None:
+        """
+        delete the rating of movie_id
+        :raise KeyError: if the user did not rate movie_id
+        """
+        pos = self._find(movie_id)
+        if pos < 0:
+            raise KeyError(movie_id)
+        self._store.stars[pos] = REMOVED
+        self._store.counts[self._pos] -= 1
+
+    def _pairs(self) -> Iterator[Tuple[int, float]]:
+        """
+        iterate over (movie id, rating) without the bisect of __getitem__
+        """
+        store = self._store
+        start, end = self._start, self._end
+        for movie_id, stars in zip(store.movie_ids[start:end],
+                                   store.stars[start:end]):
+            if stars != REMOVED:
+                yield movie_id, stars / 2
+
+    def items(self) -> ItemsView:
+        """
+        return a view of (movie id, rating) pairs
+        """
+        return _PairItems(self)
+
+    def values(self) -> ValuesView:
+        """
+        return a view of the ratings
+        """
+        return _PairValues(self)
+
+    def __repr__(self) -> str:
+        """
+        return the ratings in dict form
+        """
+        return repr(dict(self._pairs()))
+
+
+class _PairItems(ItemsView):
+    """
+    ItemsView that iterates with the mapping's _pairs
+    """
+
+    def __iter__(self) -> Iterator[tuple]:
+        """
+        iterate over (key, value) pairs
+        """
+        return self._mapping._pairs()
+
+
+class _PairValues(ValuesView):
+    """
+    ValuesView that iterates with the mapping's _pairs
+    """
+
+    def __iter__(self) -> Iterator:
+        """
+        iterate over values
+        """
+        for _, value in self._mapping._pairs():
+            yield value
+
+
+class CompactRatings(Mapping):
+    """
+    A read-only UserRatingDict stored in flat arrays; users and their
+    ratings can be deleted but not added
+    :ivar user_ids: user ids in ascending order
+    :ivar offsets: row of user_ids[i] is offsets[i]:offsets[i + 1] in
+    movie_ids and stars
+    :ivar movie_ids: movie ids of each row in ascending order
+    :ivar stars: ratings as half stars, REMOVED once deleted
+    :ivar counts: number of ratings left in each row
+    >>> ratings = CompactRatings(USER_RATING_DICT_SMALL)
+    >>> ratings == USER_RATING_DICT_SMALL
+    True
+    >>> ratings[1]
+    {68735: 3.5, 302156: 4.0}
+    >>> ratings.nbytes() < 100
+    True
+    >>> from recommender_functions import remove_unknown_movies
+    >>> ratings = CompactRatings({1: {68735: 5.0, 10: 4.5}, 2: {11: 3.0}})
+    >>> remove_unknown_movies(ratings, MOVIE_DICT_SMALL)
+    >>> list(ratings.items())
+    [(1, {68735: 5.0})]
+    """
+
+    def __init__(self, user_ratings: Optional[Mapping] = None) -> None:
+        """
+        pack user_ratings, a UserRatingDict or other mapping of the same
+        shape
+        :raise ValueError: if a rating is not a half star rating
+        """
+        self.user_ids = array('i')
+        self.offsets = array('l', [0])
+        self.movie_ids = array('i')
+        self.stars = array('B')
+        self.counts = array('l')
+        self._removed = bytearray()
+        self._num_users = 0
+        if user_ratings:
+            self._extend((user_id, movie_id, rating)
+                         for user_id in sorted(user_ratings)
+                         for movie_id, rating
+                         in sorted(user_ratings[user_id].items()))
+
+    @classmethod
+    def from_columns(cls, users: Iterable[int], movies: Iterable[int],
+                     ratings: Iterable[float]) -> 'CompactRatings':
+        """
+        return the ratings of parallel user / movie / rating columns, such
+        as those of a recommender_loader.RatingColumns; a later row for the
+        same user and movie replaces an earlier one, as in read_ratings
+        >>> ratings = CompactRatings.from_columns([2, 1, 1], [10, 17, 10],
+        ...                                       [4.0, 3.0, 5.0])
+        >>> ratings[1]
+        {10: 5.0, 17: 3.0}
+        """
+        rows = list(zip(users, movies, ratings))
+        if any(rows[i][:2] > rows[i + 1][:2] for i in range(len(rows) - 1)):
+            rows.sort(key=lambda row: row[:2])
+        compact = cls()
+        compact._extend(rows)
+        return compact
+
+    @classmethod
+    def merge(cls, parts: Iterable['CompactRatings']) -> 'CompactRatings':
+        """
+        return the ratings of parts, which have no user in common, in one
+        CompactRatings; the rows are merged in order without unpacking
+        >>> merged = CompactRatings.merge([CompactRatings({3: {10: 4.0}}),
+        ...                                CompactRatings({1: {11: 2.5}})])
+        >>> merged
+        {1: {11: 2.5}, 3: {10: 4.0}}
+        """
+        compact = cls()
+        compact._extend(heapq.merge(*(
+            ((user_id, movie_id, rating)
+             for user_id, ratings in part._pairs()
+             for movie_id, rating in ratings._pairs())
+            for part in parts)))
+        return compact
+
+    def _extend(self, rows: Iterable[Tuple[int, int, float]]) -> None:
+        """
+        append (user id, movie id, rating) rows sorted by user then movie
+        """
+        user_ids, offsets = self.user_ids, self.offsets
+        movie_ids, stars = self.movie_ids, self.stars
+        last_user = last_movie = None
+        for user_id, movie_id, rating in rows:
+            if user_id != last_user:
+                if last_user is not None:
+                    offsets.append(len(movie_ids))
+                user_ids.append(user_id)
+                last_user, last_movie = user_id, None
+            if movie_id == last_movie:
+                stars[-1] = to_stars(rating)
+                continue
+            movie_ids.append(movie_id)
+            stars.append(to_stars(rating))
+            last_movie = movie_id
+        if last_user is not None:
+            offsets.append(len(movie_ids))
+        self.counts = array('l', (offsets[i + 1] - offsets[i]
+                                  for i in range(len(user_ids))))
+        self._removed = bytearray(len(user_ids))
+        self._num_users = len(user_ids)
+
+    def _position(self, user_id: int) -> int:
+        """
+        return the position of user_id in user_ids, or -1 if it is absent
+        """
+        pos = bisect.bisect_left(self.user_ids, user_id)
+        if pos < len(self.user_ids) and self.user_ids[pos] == user_id and \
+                not self._removed[pos]:
+            return pos
+        return -1
+
+    def __getitem__(self, user_id: int) -> UserRatings:
+        """
+        return the ratings of user_id
+        :raise KeyError: if user_id has no ratings
+        """
+        pos = self._position(user_id)
+        if pos < 0:
+            raise KeyError(user_id)
+        return UserRatings(self, pos)
+
+    def __contains__(self, user_id: object) -> bool:
+        """
+        return whether user_id has ratings
+        """
+        return self._position(user_id) >= 0
+
+    def __iter__(self) -> Iterator[int]:
+        """
+        iterate over the user ids in ascending order
+        """
+        for user_id, _ in self._pairs():
+            yield user_id
+
+    def __len__(self) -> int:
+        """
+        return the number of users
+        """
+        return self._num_users
+
+    def __delitem__(self, user_id: int) -> None:
+        """
+        delete user_id and all their ratings
+        :raise KeyError: if user_id has no ratings
+        """
+        pos = self._position(user_id)
+        if pos < 0:
+            raise KeyError(user_id)
+        self._removed[pos] = 1
+        self._num_users -= 1
+
+    def _pairs(self) -> Iterator[Tuple[int, UserRatings]]:
+        """
+        iterate over (user id, ratings) without the bisect of __getitem__
+        """
+        removed = self._removed
+        for pos, user_id in enumerate(self.user_ids):
+            if not removed[pos]:
+                yield user_id, UserRatings(self, pos)
+
+    def items(self) -> ItemsView:
+        """
+        return a view of (user id, ratings) pairs
+        """
+        return _PairItems(self)
+
+    def values(self) -> ValuesView:
+        """
+        return a view of the users' ratings
+        """
+        return _PairValues(self)
+
+    def nbytes(self) -> int:
+        """
+        return the number of bytes used by the arrays
+        """
+        return sum(column.itemsize * len(column)
+                   for column in (self.user_ids, self.offsets,
+                                  self.movie_ids, self.stars, self.counts)) \
+            + len(self._removed)
+
+    def __repr__(self) -> str:
+        """
+        return the ratings in dict form
+        """
+        return repr({user_id: dict(ratings._pairs())
+                     for user_id, ratings in self._pairs()})
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,141 @@
+"""Paginated recommendations for the CSC108 A3 recommender.
+
+recommend_movies scores every candidate movie and returns the first
+num_movies, so asking for the next page means calling it again with a
+larger num_movies and scoring everything again. iter_recommendations scores
+once, when the first movie is asked for, turns the scores into a heap and
+then yields the movies in rank order one pop at a time, so the first k
+movies cost O(C + k log C) for C candidates. RecommendCursor hands the
+movies out a page at a time:
+
+    cursor = RecommendCursor(target, ratings, movie_users, index)
+    cursor.next_page(5)   # the same as recommend_movies(..., 5, index)
+    cursor.next_page(5)   # the next five, without rescoring
+
+Only the heap is kept between pages; with max_results it holds at most
+max_results movies.
+"""
+
+import heapq
+from typing import AbstractSet, Iterator, List, Optional
+
+from recommender_constants import Rating, UserRatingDict, MovieUserDict
+from recommender_constants import (USER_RATING_DICT_SMALL,
+                                   MOVIE_USER_DICT_SMALL)
+from recommender_functions import (RatingIndex, get_similar_users,
+                                   score_similar_users)
+
+
+def iter_recommendations(target_rating: Rating,
+                         user_ratings: UserRatingDict,
+                         movie_users: MovieUserDict,
+                         index: Optional[RatingIndex] = None,
+                         genre_movies: Optional[AbstractSet[int]] = None,
+                         max_results: Optional[int] = None,
+                         min_similarity: float = 0.0,
+                         top_m: Optional[int] = None) -> Iterator[int]:
+    """
+    yield the movies recommend_movies ranks for target_rating, best first,
+    scoring them when the first movie is asked for
+    :param target_rating: dictionary of movie_ids to rating
+    :param user_ratings: UserRatingDict dictionary
+    :param movie_users: MovieUserDict of user_ratings
+    :param index: prebuilt RatingIndex of user_ratings, built here if None
+    :param genre_movies: only recommend these movies, if given
+    :param max_results: yield and keep at most this many movies, all of
+    them if None
+    :param min_similarity: prune as in get_similar_users
+    :param top_m: prune as in get_similar_users
+    :return: iterator of movie ids
+    >>> list(iter_recommendations({68735: 4.5}, USER_RATING_DICT_SMALL,
+    ...                           MOVIE_USER_DICT_SMALL))
+    [302156, 293660]
+    """
+    if index is None:
+        index = RatingIndex(user_ratings)
+    user_sim_dict = get_similar_users(target_rating, user_ratings, movie_users,
+                                      index, min_similarity, top_m)
+    movie_score_dict = score_similar_users(target_rating, user_sim_dict,
+                                           user_ratings, index, genre_movies)
+    # (-score, movie_id) ascending is the order of sort_moviescore_dict
+    if max_results is None:
+        heap = [(-score, movie) for movie, score in movie_score_dict.items()]
+        heapq.heapify(heap)
+    else:
+        # a sorted list is a valid heap
+        heap = heapq.nsmallest(max_results,
+                               ((-score, movie) for movie, score
+                                in movie_score_dict.items()))
+    del user_sim_dict, movie_score_dict
+    while heap:
+        yield heapq.heappop(heap)[1]
+
+
+class RecommendCursor:
+    """
+    Pages of the recommendations for one target, in rank order
+    :ivar returned: number of movies handed out so far
+    :ivar exhausted: True once a page came back short
+    >>> cursor = RecommendCursor({68735: 4.5}, USER_RATING_DICT_SMALL,
+    ...                          MOVIE_USER_DICT_SMALL)
+    >>> cursor.next_page(1), cursor.next_page(1), cursor.next_page(1)
+    ([302156], [293660], [])
+    >>> cursor.exhausted
+    True
+    """
+
+    def __init__(self, target_rating: Rating, user_ratings: UserRatingDict,
+                 movie_users: MovieUserDict,
+                 index: Optional[RatingIndex] = None,
+                 genre_movies: Optional[AbstractSet[int]] = None,
+                 max_results: Optional[int] = None,
+                 min_similarity: float = 0.0,
+                 top_m: Optional[int] = None) -> None:
+        """
+        open a cursor over iter_recommendations; nothing is scored until
+        the first page is asked for
+        :param target_rating: dictionary of movie_ids to rating
+        :param user_ratings: UserRatingDict dictionary
+        :param movie_users: MovieUserDict of user_ratings
+        :param index: prebuilt RatingIndex of user_ratings
+        :param genre_movies: only recommend these movies, if given
+        :param max_results: most movies the cursor will hand out
+        :param min_similarity: prune as in get_similar_users
+        :param top_m: prune as in get_similar_users
+        """
+        self._movies = iter_recommendations(target_rating, user_ratings,
+                                            movie_users, index, genre_movies,
+                                            max_results, min_similarity,
+                                            top_m)
+        self.returned = 0
+        self.exhausted = False
+
+    def next_page(self, size: int) -> List[int]:
+        """
+        return the next size movies, fewer on the last page and none once
+        the cursor is exhausted
+        """
+        page = []
+        if size <= 0:
+            return page
+        for movie in self._movies:
+            page.append(movie)
+            if len(page) == size:
+                break
+        if len(page) < size:
+            self.exhausted = True
+            self.close()
+        self.returned += len(page)
+        return page
+
+    def close(self) -> None:
+        """
+        drop the remaining movies
+        """
+        self._movies.close()
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
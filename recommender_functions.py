@@ -1,6 +1,11 @@
 """CSC108 A3 recommender starter code."""
 
-from typing import TextIO, List, Dict
+import csv
+import heapq
+import itertools
+import time
+from typing import (TextIO, AbstractSet, Callable, Dict, Iterable, List,
+                    Optional)
 
 from recommender_constants import (MovieDict, Rating, UserRatingDict,
                                    MovieUserDict)
@@ -45,14 +50,215 @@ def get_similarity(user1: Rating, user2: Rating) -> float:
 
 ############## STUDENT CONSTANTS
 
-# suppose there are at most SAME+SCORE_LIMIT number of movies
-# which has same score as the last movie in recommendation movies
-# this is for better running time
-SAME_SCORE_LIMIT = 10
 CUT_OFF_RATING = 3.5
 
+############## STUDENT HELPER CLASSES
+
+class RatingIndex:
+    """
+    Precomputed lookups over a UserRatingDict, built once and shared by
+    every recommend_movies call so scoring no longer rescans all ratings
+    :ivar popularity: {movie_id: number of users who rated the movie}
+    :ivar high_movies: {user_id: set of movies the user rated CUT_OFF_RATING
+    or above}
+    :ivar high_raters: {movie_id: list of users who rated the movie
+    CUT_OFF_RATING or above}
+    :ivar norms: {user_id: sum of the user's squared ratings}
+    >>> index = RatingIndex(USER_RATING_DICT_SMALL)
+    >>> index.popularity[68735]
+    2
+    >>> index.high_movies[1] == {68735, 302156}
+    True
+    >>> index.high_movies[2] == {293660}
+    True
+    >>> index.high_raters[68735]
+    [1]
+    >>> 124057 in index.high_raters
+    False
+    >>> index.norms[1]
+    28.25
+    """
+
+    def __init__(self, user_ratings: UserRatingDict) -> None:
+        """
+        build the index with one pass over user_ratings
+        :param user_ratings: UserRatingDict dictionary
+        """
+        self.popularity = {}
+        self.high_movies = {}
+        self.high_raters = {}
+        self.norms = {}
+        for user, ratings in user_ratings.items():
+            self.norms[user] = rating_norm(ratings)
+            high = set()
+            for movie, rating in ratings.items():
+                self.popularity[movie] = self.popularity.get(movie, 0) + 1
+                if rating >= CUT_OFF_RATING:
+                    high.add(movie)
+                    self.high_raters.setdefault(movie, []).append(user)
+            self.high_movies[user] = high
+
+class RecommendTrace:
+    """
+    Per-stage wall time and sizes of one recommend_movies call, recorded
+    when the trace is passed in; nothing is timed without one
+    :ivar stages: (stage name, seconds, number of items the stage produced)
+    in call order
+    :ivar counters: {name: count} of other events, such as cache hits
+    :ivar callback: called as callback(stage, seconds, items) as each stage
+    is recorded
+    >>> trace = RecommendTrace()
+    >>> recommend_movies({68735: 4.5}, USER_RATING_DICT_SMALL,
+    ...                  MOVIE_USER_DICT_SMALL, 2, trace=trace)
+    [302156, 293660]
+    >>> for stage, _, items in trace.stages:
+    ...     print(stage, items)
+    get_similar_users 2
+    get_candidate_movies 2
+    get_movie_score_dict 2
+    sort_moviescore_dict 2
+    """
+
+    def __init__(self, callback: Optional[Callable[[str, float, int],
+                                                   None]] = None) -> None:
+        """
+        :param callback: called as callback(stage, seconds, items) as each
+        stage is recorded
+        """
+        self.stages = []
+        self.counters = {}
+        self.callback = callback
+
+    def start(self) -> float:
+        """
+        return the clock reading a stage is timed from
+        """
+        return time.perf_counter()
+
+    def record(self, stage: str, start: float, items: int) -> float:
+        """
+        record that stage ran from start until now and produced items
+        items, and return now as the start of the next stage
+        """
+        now = time.perf_counter()
+        self.stages.append((stage, now - start, items))
+        if self.callback is not None:
+            self.callback(stage, now - start, items)
+        return now
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """
+        add amount to the counter name
+        """
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def total(self) -> float:
+        """
+        return the seconds spent in all recorded stages
+        """
+        return sum(seconds for _, seconds, _ in self.stages)
+
+    def as_dict(self) -> Dict[str, Dict]:
+        """
+        return the stages as {stage: {'ms': time, 'items': items}} with the
+        counters, e.g. for JSON output
+        >>> trace = RecommendTrace()
+        >>> trace.count('cache_hits')
+        >>> trace.as_dict()
+        {'stages': {}, 'counters': {'cache_hits': 1}}
+        """
+        return {'stages': {stage: {'ms': seconds * 1000, 'items': items}
+                           for stage, seconds, items in self.stages},
+                'counters': dict(self.counters)}
+
 ############## STUDENT HELPER FUNCTIONS
 
+def rating_norm(rating: Rating) -> float:
+    """
+    return the sum of squared ratings, the norm term of get_similarity
+    :param rating: dictionary of movie_ids to rating
+    :return: sum of squares
+    >>> rating_norm({1: 4.5, 2: 3.0, 3: 1.0})
+    30.25
+    """
+    norm = 0.0
+    for value in rating.values():
+        norm = norm + value ** 2
+    return norm
+
+
+def get_similarities(target_rating: Rating, user_ids: List[int],
+                     user_ratings: UserRatingDict,
+                     norms: Optional[Dict[int, float]] = None
+                     ) -> Dict[int, float]:
+    """
+    return {user: get_similarity(target_rating, user_ratings[user])} for
+    every user in user_ids, computing the target norm once, reading user
+    norms from norms when given and taking each shared dot product over the
+    smaller of the two rating dicts
+    :param target_rating: dictionary of movie_ids to rating
+    :param user_ids: users to compare against target_rating
+    :param user_ratings: UserRatingDict dictionary
+    :param norms: {user_id: rating_norm}, e.g. RatingIndex.norms
+    :return: dictionary of user id to similarity score
+    >>> r1 = {1: 4.5, 2: 3.0, 3: 1.0}
+    >>> ratings = {7: {2: 4.5, 3: 3.5, 4: 1.5, 5: 5.0}, 8: {6: 4.5}}
+    >>> sim = get_similarities(r1, [7, 8], ratings)
+    >>> abs(sim[7] - get_similarity(r1, ratings[7])) < 1e-12
+    True
+    >>> sim[8]
+    0.0
+    """
+    target_norm = rating_norm(target_rating)
+    user_sim_dict = {}
+    for user in user_ids:
+        ratings = user_ratings[user]
+        if norms is None:
+            user_norm = rating_norm(ratings)
+        else:
+            user_norm = norms[user]
+        if len(ratings) < len(target_rating):
+            small, large = ratings, target_rating
+        else:
+            small, large = target_rating, ratings
+        shared = 0.0
+        for m_id, value in small.items():
+            if m_id in large:
+                shared += value * large[m_id]
+        user_sim_dict[user] = (shared * shared) / (target_norm * user_norm)
+    return user_sim_dict
+
+
+def prune_similar_users(user_sim_dict: Dict[int, float],
+                        min_similarity: float = 0.0,
+                        top_m: Optional[int] = None) -> Dict[int, float]:
+    """
+    return the users of user_sim_dict with a similarity of at least
+    min_similarity, only the top_m most similar of them when top_m is given
+    (ties going to the smaller user id, kept with a heap of top_m users),
+    in the order of user_sim_dict
+    :param user_sim_dict: similar user dict{user:sim_score}
+    :param min_similarity: smallest similarity kept
+    :param top_m: number of users kept, all of them if None
+    :return: dictionary of user id to similarity score
+    >>> sim = {1: 0.2, 2: 0.5, 3: 0.5, 4: 0.01}
+    >>> prune_similar_users(sim, 0.1)
+    {1: 0.2, 2: 0.5, 3: 0.5}
+    >>> prune_similar_users(sim, top_m=2)
+    {2: 0.5, 3: 0.5}
+    """
+    if min_similarity > 0:
+        user_sim_dict = {user: sim for user, sim in user_sim_dict.items()
+                         if sim >= min_similarity}
+    if top_m is not None and top_m < len(user_sim_dict):
+        kept = set(user for user, _ in heapq.nsmallest(
+            top_m, user_sim_dict.items(),
+            key=lambda item: (-item[1], item[0])))
+        user_sim_dict = {user: sim for user, sim in user_sim_dict.items()
+                         if user in kept}
+    return user_sim_dict
+
+
 def get_candidate_movies(target_rating: Rating, sim_user_list: List[int],
                          user_ratings: UserRatingDict) -> List[int]:
     """
@@ -73,40 +279,153 @@ def get_candidate_movies(target_rating: Rating, sim_user_list: List[int],
     False
     """
     candidate_movies = set()
-    target_movies = list(target_rating.keys())
-    # movies similar users rated 3.5 or above
-    for user, ratings in user_ratings.items():
-        if user in sim_user_list:
-            potential_movies = list(ratings.keys())
-            for movie in potential_movies:
-                if not (movie in target_movies) and ratings[movie] >= CUT_OFF_RATING:
-                    candidate_movies.add(movie)
+    # movies similar users rated 3.5 or above, read from each similar
+    # user's own ratings instead of scanning every user
+    for user in sim_user_list:
+        for movie, rating in user_ratings.get(user, {}).items():
+            if rating >= CUT_OFF_RATING and movie not in target_rating:
+                candidate_movies.add(movie)
     return list(candidate_movies)
 
 
+def add_user_scores(movie_score_dict: Dict[int, float],
+                    user_sim_score: float, user_movies: Iterable[int],
+                    num_user_movie: int, popularity: Dict[int, int]) -> None:
+    """
+    add a similar user's contribution to the score of each of user_movies,
+    the handout formula every scoring path shares: the user's similarity
+    divided by num_user_movie, their number of candidate movies, and by the
+    movie's popularity
+    :param movie_score_dict: {movie: score} updated in place
+    :param user_sim_score: similarity of the user to the target
+    :param user_movies: candidate movies the user rated CUT_OFF_RATING or
+    above that get a contribution
+    :param num_user_movie: number of candidate movies the user rated
+    CUT_OFF_RATING or above
+    :param popularity: number of users who rated each movie, e.g.
+    RatingIndex.popularity
+    >>> scores = {}
+    >>> add_user_scores(scores, 0.5, [10, 11], 2, {10: 1, 11: 2})
+    >>> scores
+    {10: 0.25, 11: 0.125}
+    """
+    for movie in user_movies:
+        movie_popularity = popularity[movie]
+        con_user_to_movie = user_sim_score / (num_user_movie * movie_popularity)
+        movie_score_dict[movie] = movie_score_dict.get(movie, 0) + con_user_to_movie
+
+
 def get_movie_score_dict(candidate_movies: List[int],
                          user_sim_dict: Dict[int, float],
-                         user_ratings: UserRatingDict) -> Dict[int, float]:
+                         user_ratings: UserRatingDict,
+                         index: Optional[RatingIndex] = None
+                         ) -> Dict[int, float]:
     """
     return a dictionary with each movie with its corresponding score
     described in the handout
     :param candidate_movies:candidate movies
     :param user_sim_dict: similar user dict{user:sim_score}
     :param user_ratings: user ratings
+    :param index: prebuilt RatingIndex of user_ratings, built here if None
     :return: return a dict
+    >>> sim = {1: 0.5, 2: 0.25}
+    >>> get_movie_score_dict([302156, 293660], sim, USER_RATING_DICT_SMALL)
+    {302156: 0.5, 293660: 0.25}
     """
+    if index is None:
+        index = RatingIndex(user_ratings)
+    candidate_set = set(candidate_movies)
     movie_score_dict = {}
-    similar_users = list(user_sim_dict.keys())
     for movie in candidate_movies:
-        movie_score = 0
-        movie_popularity = get_movie_popularity(movie, user_ratings)
-        candidate_users = get_candidate_users(movie, user_ratings, similar_users)
-        for user in candidate_users:
-            user_sim_score = user_sim_dict[user]
-            num_user_movie = get_num_user_movie(user, candidate_movies, user_ratings)
-            con_user_to_movie = user_sim_score / (num_user_movie * movie_popularity)
-            movie_score = movie_score + con_user_to_movie
-        movie_score_dict[movie] = movie_score
+        movie_score_dict[movie] = 0
+    # walk similar users in order so each movie sums its contributions
+    # in the same order as the handout formula
+    for user, user_sim_score in user_sim_dict.items():
+        user_movies = index.high_movies[user] & candidate_set
+        add_user_scores(movie_score_dict, user_sim_score, user_movies,
+                        len(user_movies), index.popularity)
+    return movie_score_dict
+
+
+def get_filtered_movie_score_dict(target_rating: Rating,
+                                  user_sim_dict: Dict[int, float],
+                                  allowed_movies: AbstractSet[int],
+                                  index: RatingIndex) -> Dict[int, float]:
+    """
+    return the scores get_movie_score_dict gives the candidate movies that
+    are in allowed_movies, without generating the other candidates: a
+    similar user's number of candidate movies is their number of movies
+    rated CUT_OFF_RATING or above that the target has not rated, so only
+    the user's movies in allowed_movies need to be visited
+    :param target_rating: dictionary of movie_ids to rating
+    :param user_sim_dict: similar user dict{user:sim_score}
+    :param allowed_movies: movies that may be recommended
+    :param index: RatingIndex of the ratings user_sim_dict came from
+    :return: dictionary of movie id to score
+    >>> sim = {1: 0.5, 2: 0.25}
+    >>> get_filtered_movie_score_dict({68735: 4.5}, sim, {302156, 124057},
+    ...                               RatingIndex(USER_RATING_DICT_SMALL))
+    {302156: 0.5}
+    """
+    movie_score_dict = {}
+    for user, user_sim_score in user_sim_dict.items():
+        high_movies = index.high_movies[user]
+        num_user_movie = len(high_movies)
+        for movie in target_rating:
+            if movie in high_movies:
+                num_user_movie -= 1
+        user_movies = [movie for movie in high_movies & allowed_movies
+                       if movie not in target_rating]
+        add_user_scores(movie_score_dict, user_sim_score, user_movies,
+                        num_user_movie, index.popularity)
+    return movie_score_dict
+
+
+def score_similar_users(target_rating: Rating,
+                        user_sim_dict: Dict[int, float],
+                        user_ratings: UserRatingDict,
+                        index: Optional[RatingIndex] = None,
+                        genre_movies: Optional[AbstractSet[int]] = None,
+                        trace: Optional[RecommendTrace] = None
+                        ) -> Dict[int, float]:
+    """
+    return the movie scores recommend_movies ranks for target_rating from
+    its similar users: the candidate movies scored by get_movie_score_dict,
+    or with genre_movies, get_filtered_movie_score_dict of those movies
+    :param target_rating: dictionary of movie_ids to rating
+    :param user_sim_dict: similar user dict{user:sim_score}, e.g. from
+    get_similar_users
+    :param user_ratings: UserRatingDict dictionary
+    :param index: prebuilt RatingIndex of user_ratings, built here if None
+    :param genre_movies: only score these movies, if given
+    :param trace: records the stages if given
+    :return: dictionary of movie id to score
+    >>> score_similar_users({68735: 4.5}, {1: 0.5, 2: 0.25},
+    ...                     USER_RATING_DICT_SMALL)
+    {302156: 0.5, 293660: 0.25}
+    """
+    if trace is not None:
+        start = trace.start()
+    if genre_movies is not None:
+        if index is None:
+            index = RatingIndex(user_ratings)
+        movie_score_dict = get_filtered_movie_score_dict(
+            target_rating, user_sim_dict, genre_movies, index)
+        if trace is not None:
+            trace.record('get_filtered_movie_score_dict', start,
+                         len(movie_score_dict))
+        return movie_score_dict
+    # candidate_movies: movies similar users rated 3.5 or above and user has not rated
+    candidate_movies = get_candidate_movies(target_rating, list(user_sim_dict),
+                                            user_ratings)
+    if trace is not None:
+        start = trace.record('get_candidate_movies', start,
+                             len(candidate_movies))
+    # assign score to each movie
+    movie_score_dict = get_movie_score_dict(candidate_movies, user_sim_dict,
+                                            user_ratings, index)
+    if trace is not None:
+        trace.record('get_movie_score_dict', start, len(movie_score_dict))
     return movie_score_dict
 
 
@@ -176,34 +495,22 @@ def sort_moviescore_dict(movie_score_dict: Dict[int, float],
     """
     sort movie score dict with value, when the value are the same,
     sort by movie_id,smaller id appear first
+    only the first same_score_num_limit movies are selected, with a heap of
+    that size, so the cost is O(C log K) and ties are never dropped
     :param movie_score_dict: dictionary {movie_id:score}
     :param same_score_num_limit:the length of returned list
     :return:list of sorted movies
     >>> movie_score_dict = {3333:3,2345:3,1111:4,2555:1,1133:1,3557:1.5}
     >>> sort_moviescore_dict(movie_score_dict,6)
     [1111, 2345, 3333, 3557, 1133, 2555]
+    >>> sort_moviescore_dict(movie_score_dict,2)
+    [1111, 2345]
+    >>> sort_moviescore_dict({},3)
+    []
     """
-    # we have to sort the whole movie list for movie score,
-    # but we don't need to sort the whole list for movie_id
-    res_list = []
-    sort_tuple = tuple(sorted(movie_score_dict.items(),
-                              key=lambda x: x[1],
-                              reverse=True))[:same_score_num_limit]
-    current_value = sort_tuple[0][1]#defalt score,score for first movie
-    current_list = []
-    for moviescore in sort_tuple:
-        if moviescore[1] == current_value:
-            current_list.append(moviescore[0])
-        else:#if the score are different, append the last list,update the list
-            current_value = moviescore[1]
-            current_list = sorted(current_list)
-            for i in current_list:
-                res_list.append(i)
-            current_list = [moviescore[0]]
-    current_list = sorted(current_list)
-    for i in current_list:#for left overs in current list
-        res_list.append(i)
-    return res_list
+    # (score desc, movie_id asc) is the ascending order of (-score, movie_id)
+    return heapq.nsmallest(same_score_num_limit, movie_score_dict,
+                           key=lambda movie: (-movie_score_dict[movie], movie))
 
 ############## STUDENT FUNCTIONS
 
@@ -223,11 +530,25 @@ def read_movies(movie_file: TextIO) -> MovieDict:
     4
     >>> movies == MOVIE_DICT_SMALL
     True
+
+    Fields may be quoted as in RFC 4180, so titles can contain commas,
+    quotes and line breaks.
+
+    >>> import io
+    >>> read_movies(io.StringIO('movie_id,title,release_date,runtime,genres\\n'
+    ...                         '1,"Good, the Bad ""and"" the Ugly",1966-12-23,'
+    ...                         '161.0,Western\\n'))
+    {1: ('Good, the Bad "and" the Ugly', ['Western'])}
     """
     res_dict = {}
     movie_file.readline()  # skip header
     for line in movie_file:  # for the rest of the file
-        info_list = line.rstrip("\n").split(",")
+        if '"' in line:
+            # the csv module reads any continuation lines of a quoted
+            # field from movie_file, so the loop resumes after the record
+            info_list = next(csv.reader(itertools.chain([line], movie_file)))
+        else:
+            info_list = line.rstrip("\n").split(",")
         res_dict[int(info_list[0])] = (info_list[1], info_list[4:])
     return res_dict
 
@@ -276,38 +597,31 @@ def remove_unknown_movies(user_ratings: UserRatingDict,
     >>> 1002 in small_ratings
     False
     """
-    remove_movie_list = []
-    remove_user_list = []
+    empty_users = []
     for user, rating in user_ratings.items():
-        for movie_ids in rating:
-            if not (movie_ids in movies):
-                remove_movie_list.append((user, movie_ids))
-    for remove in remove_movie_list:
-        del user_ratings[remove[0]][remove[1]]
-    for user, rating in user_ratings.items():
-        if rating == {}:
-            remove_user_list.append(user)
-    for remove in remove_user_list:
-        del user_ratings[remove]
+        unknown = [movie_id for movie_id in rating if movie_id not in movies]
+        for movie_id in unknown:
+            del rating[movie_id]
+        if not rating:
+            empty_users.append(user)
+    for user in empty_users:
+        del user_ratings[user]
 
 
 def movies_to_users(user_ratings: UserRatingDict) -> MovieUserDict:
     """Return a dictionary of movie ids to list of users who rated the movie,
     using information from the user_ratings dictionary of users to movie
-    ratings dictionaries.
+    ratings dictionaries. Each list of users is in ascending order.
 
     >>> result = movies_to_users(USER_RATING_DICT_SMALL)
     >>> result == MOVIE_USER_DICT_SMALL
     True
     """
     movie_user_dict = {}
-    for user, value in user_ratings.items():
-        for movie_id in value:
+    for user in sorted(user_ratings):
+        for movie_id in user_ratings[user]:
             if movie_id in movie_user_dict:
-                if movie_user_dict[movie_id] is None:
-                    movie_user_dict[movie_id] = [user]
-                else:
-                    movie_user_dict[movie_id].append(user)
+                movie_user_dict[movie_id].append(user)
             else:
                 movie_user_dict[movie_id] = [user]
     return movie_user_dict
@@ -316,7 +630,7 @@ def movies_to_users(user_ratings: UserRatingDict) -> MovieUserDict:
 def get_users_who_watched(movie_ids: List[int],
                           movie_users: MovieUserDict) -> List[int]:
     """Return the list of user ids in moive_users who watched at least one
-    movie in moive_ids.
+    movie in moive_ids, in ascending order.
 
     >>> get_users_who_watched([293660], MOVIE_USER_DICT_SMALL)
     [2]
@@ -327,63 +641,87 @@ def get_users_who_watched(movie_ids: List[int],
     [1, 2]
     """
     result_list = set()
-    for movie_id, users in movie_users.items():
-        if movie_id in movie_ids:
-            for user in users:
-                result_list.add(user)
-    return list(result_list)
+    # look up each movie's posting list rather than scanning movie_users
+    for movie_id in movie_ids:
+        if movie_id in movie_users:
+            result_list.update(movie_users[movie_id])
+    return sorted(result_list)
 
 
 def get_similar_users(target_rating: Rating,
                       user_ratings: UserRatingDict,
-                      movie_users: MovieUserDict) -> Dict[int, float]:
+                      movie_users: MovieUserDict,
+                      index: Optional[RatingIndex] = None,
+                      min_similarity: float = 0.0,
+                      top_m: Optional[int] = None) -> Dict[int, float]:
     """Return a dictionary of similar user ids to similarity scores between the
     similar user's movie rating in user_ratings dictionary and the
     target_rating. Only return similarites for similar users who has at least
     one rating in movie_users dictionary that appears in target_Ratings.
     example return dict:{u1:simscore1,u2:simscore2},higher the score,more sim
+    User norms are read from index when it is given. Users below
+    min_similarity, and all but the top_m most similar users when top_m is
+    given, are pruned with prune_similar_users.
 
     >>> sim = get_similar_users({293660: 4.5}, USER_RATING_DICT_SMALL, MOVIE_USER_DICT_SMALL)
     >>> len(sim)
     1
     >>> round(sim[2], 2)
     0.86
+    >>> list(get_similar_users({68735: 4.5}, USER_RATING_DICT_SMALL, MOVIE_USER_DICT_SMALL, top_m=1))
+    [1]
     """
     movie_ids = list(target_rating.keys())  # [293660,337540]
-    user_sim_dict = {}
     filter_user_ids = get_users_who_watched(movie_ids, movie_users)  # [1,2,3]
-    for user in filter_user_ids:
-        user_movie_rating = user_ratings[user]
-        sim_socre = get_similarity(target_rating, user_movie_rating)
-        user_sim_dict[user] = sim_socre
+    norms = None if index is None else index.norms
+    user_sim_dict = get_similarities(target_rating, filter_user_ids,
+                                     user_ratings, norms)
+    if min_similarity > 0 or top_m is not None:
+        user_sim_dict = prune_similar_users(user_sim_dict, min_similarity,
+                                            top_m)
     return user_sim_dict
 
 
 def recommend_movies(target_rating: Rating,
                      user_ratings: UserRatingDict,
                      movie_users: MovieUserDict,
-                     num_movies: int) -> List[int]:
+                     num_movies: int,
+                     index: Optional[RatingIndex] = None,
+                     trace: Optional[RecommendTrace] = None,
+                     genre_movies: Optional[AbstractSet[int]] = None,
+                     min_similarity: float = 0.0,
+                     top_m: Optional[int] = None) -> List[int]:
     """Return a list of num_movies movie id recommendations for a target user 
     with target_rating of previous movies. The recommendations are based on
     movies and "similar users" data from the user_ratings / movie_users 
-    dictionaries.
+    dictionaries. Pass a RatingIndex built once from user_ratings as index
+    to avoid rebuilding it on every call, and a RecommendTrace as trace to
+    time each stage. With genre_movies, e.g. from GenreIndex.movies_with,
+    only those movies are recommended, ranked as they would be among all
+    the recommendations, and only those movies are scored. min_similarity
+    and top_m prune the similar users as in get_similar_users, trading
+    agreement with the unpruned recommendations for speed.
 
     >>> recommend_movies({302156: 4.5}, USER_RATING_DICT_SMALL, MOVIE_USER_DICT_SMALL, 2)
     [68735]
     >>> recommend_movies({68735: 4.5}, USER_RATING_DICT_SMALL, MOVIE_USER_DICT_SMALL, 2)
     [302156, 293660]
     """
-    user_sim_dict = get_similar_users(target_rating, user_ratings, movie_users)
-    # who rated at least one movies the target rated
-    similar_users = list(user_sim_dict.keys())
-    # candidate_movies: movies similar users rated 3.5 or above and user has not rated
-    candidate_movies = get_candidate_movies(target_rating, similar_users, user_ratings)
-    # assign score to each movie
-    movie_score_dict = get_movie_score_dict\
-        (candidate_movies, user_sim_dict, user_ratings)  # {[movie:score]}
-    length_limit = num_movies + SAME_SCORE_LIMIT
-    final_movie_list = sort_moviescore_dict(movie_score_dict, length_limit)
-    return final_movie_list[:num_movies]
+    if trace is not None:
+        start = trace.start()
+    user_sim_dict = get_similar_users(target_rating, user_ratings, movie_users,
+                                      index, min_similarity, top_m)
+    if trace is not None:
+        trace.record('get_similar_users', start, len(user_sim_dict))
+    movie_score_dict = score_similar_users(target_rating, user_sim_dict,
+                                           user_ratings, index, genre_movies,
+                                           trace)
+    if trace is not None:
+        start = trace.start()
+    results = sort_moviescore_dict(movie_score_dict, num_movies)
+    if trace is not None:
+        trace.record('sort_moviescore_dict', start, len(results))
+    return results
 
 
 if __name__ == '__main__':
@@ -0,0 +1,143 @@
+"""Genre bitmap index for genre-filtered recommendations.
+
+GenreIndex numbers the movies of a MovieDict and keeps, for every genre, a
+bitmap (a Python int) with bit i set when movie i has the genre. Genre
+filters are combined with bitwise or / and, and the resulting movie set is
+handed to recommend_movies as genre_movies, which then scores only those
+movies:
+
+    genres = GenreIndex(movies)
+    recommend_movies(target, ratings, movie_users, 5, index,
+                     genre_movies=genres.movies_with(['Comedy']))
+"""
+
+from collections import OrderedDict
+from typing import List, Dict, FrozenSet
+
+from recommender_constants import MovieDict
+from recommender_constants import (MOVIE_DICT_SMALL, USER_RATING_DICT_SMALL,
+                                   MOVIE_USER_DICT_SMALL)
+
+# most genre filters whose movie sets are kept
+MAX_CACHED_FILTERS = 64
+# positions of the set bits of each byte value, lowest first
+BYTE_BITS = tuple(tuple(bit for bit in range(8) if value >> bit & 1)
+                  for value in range(256))
+
+
+class GenreIndex:
+    """
+    Bitmaps of the movies of each genre in a MovieDict
+    :ivar movie_ids: movie id of each bit position
+    :ivar bitmaps: {genre: int with the bits of the genre's movies set}
+    >>> genres = GenreIndex(MOVIE_DICT_SMALL)
+    >>> sorted(genres.movies_with(['Comedy', 'Fantasy']))
+    [68735, 293660]
+    >>> sorted(genres.movies_with(['Action', 'Adventure'], match_all=True))
+    [68735, 293660]
+    >>> genres.movies_with(['Horror'])
+    frozenset()
+    >>> from recommender_functions import recommend_movies
+    >>> recommend_movies({68735: 4.5}, USER_RATING_DICT_SMALL,
+    ...                  MOVIE_USER_DICT_SMALL, 2,
+    ...                  genre_movies=genres.movies_with(['Comedy']))
+    [293660]
+    """
+
+    def __init__(self, movies: MovieDict) -> None:
+        """
+        build the bitmaps of the genres in movies
+        :param movies: MovieDict dictionary
+        """
+        self.movie_ids = sorted(movies)
+        self.bitmaps = {}
+        for pos, movie_id in enumerate(self.movie_ids):
+            bit = 1 << pos
+            for genre in movies[movie_id][1]:
+                self.bitmaps[genre] = self.bitmaps.get(genre, 0) | bit
+        # (genres, match_all) -> movie set, least recently used first
+        self._cache = OrderedDict()
+
+    def genres(self) -> List[str]:
+        """
+        return the known genres, most common first
+        >>> GenreIndex(MOVIE_DICT_SMALL).genres()[:2]
+        ['Action', 'Adventure']
+        """
+        return sorted(self.bitmaps,
+                      key=lambda genre: (-bin(self.bitmaps[genre]).count('1'),
+                                         genre))
+
+    def bitmap(self, genres: List[str], match_all: bool = False) -> int:
+        """
+        return the bitmap of the movies with any (or all, with match_all)
+        of genres; unknown genres match no movie
+        """
+        if not genres:
+            return 0
+        bitmaps = [self.bitmaps.get(genre, 0) for genre in genres]
+        result = bitmaps[0]
+        for bitmap in bitmaps[1:]:
+            if match_all:
+                result &= bitmap
+            else:
+                result |= bitmap
+        return result
+
+    def movies_with(self, genres: List[str],
+                    match_all: bool = False) -> FrozenSet[int]:
+        """
+        return the ids of the movies with any (or all, with match_all) of
+        genres, keeping the MAX_CACHED_FILTERS most recently used filters;
+        the set is frozen as it is shared by every caller of the same
+        filter
+        :param genres: genre names
+        :param match_all: require every genre instead of any
+        :return: frozenset of movie ids
+        """
+        key = (frozenset(genres), match_all)
+        movie_set = self._cache.get(key)
+        if movie_set is not None:
+            self._cache.move_to_end(key)
+            return movie_set
+        movie_set = frozenset(self.decode(self.bitmap(genres, match_all)))
+        if len(self._cache) >= MAX_CACHED_FILTERS:
+            self._cache.popitem(last=False)
+        self._cache[key] = movie_set
+        return movie_set
+
+    def decode(self, bitmap: int) -> List[int]:
+        """
+        return the movie ids of the set bits of bitmap, in movie id order;
+        the bitmap is read a byte at a time, skipping empty bytes, rather
+        than one big-int operation per set bit
+        >>> genres = GenreIndex(MOVIE_DICT_SMALL)
+        >>> genres.decode(0b1010)
+        [124057, 302156]
+        """
+        movie_ids = self.movie_ids
+        movie_list = []
+        data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+        for byte_pos, value in enumerate(data):
+            if value:
+                base = byte_pos * 8
+                for bit in BYTE_BITS[value]:
+                    movie_list.append(movie_ids[base + bit])
+        return movie_list
+
+
+def genre_counts(movies: MovieDict) -> Dict[str, int]:
+    """
+    return {genre: number of movies with the genre}
+    >>> genre_counts(MOVIE_DICT_SMALL)['Adventure']
+    2
+    """
+    genres = GenreIndex(movies)
+    return {genre: bin(genres.bitmaps[genre]).count('1')
+            for genre in genres.genres()}
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,290 @@
+"""Streaming ingestion of rating files larger than memory.
+
+read_ratings builds the whole UserRatingDict before remove_unknown_movies
+throws away the ratings of unknown movies. ingest_ratings instead reads the
+rating file in chunks and drops those ratings as it goes. Kept ratings are
+buffered in memory up to a budget; past it the buffer is spilled to
+partition files on disk, each user always going to the same partition. The
+partitions are then read back one at a time. iter_partitions hands them
+to the caller one by one and ingest_compact packs each into a
+CompactRatings as it is read, so neither holds the ratings as dicts past
+the budget. ingest_ratings builds the whole UserRatingDict and
+MovieUserDict, the same, in the same order, as those of read_ratings,
+remove_unknown_movies and movies_to_users, so its memory is that of the
+result however small the budget.
+"""
+
+import os
+import struct
+import tempfile
+from array import array
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+from recommender_compact import CompactRatings
+from recommender_constants import MovieDict, MovieUserDict, UserRatingDict
+from recommender_constants import MOVIE_DICT_SMALL
+from recommender_functions import movies_to_users
+
+# rough size of one rating held in a UserRatingDict
+BYTES_PER_RATING = 100
+# rough size of the dict holding one user's ratings
+BYTES_PER_USER = 200
+CHUNK_BYTES = 1 << 18
+# a chunk of text takes about this many times its size once parsed into rows
+PARSED_PER_BYTE = 16
+# smallest chunk parsed at a time, however small the budget
+MIN_CHUNK_BYTES = 4096
+NUM_PARTITIONS = 16
+# number of rows in a spilled block
+BLOCK = struct.Struct('=q')
+
+
+def iter_rating_chunks(rating_file: TextIO, chunk_bytes: int = CHUNK_BYTES
+                       ) -> Iterator[List[Tuple[int, int, float]]]:
+    """
+    yield the (user id, movie id, rating) rows of rating_file, parsed as
+    read_ratings does, in lists of about chunk_bytes of text each
+    >>> with open('ratings_tiny.csv') as rating_file:
+    ...     list(iter_rating_chunks(rating_file, 30))
+    [[(1, 2968, 1.0), (1, 3671, 3.0)], [(2, 10, 4.0), (2, 17, 5.0)]]
+    """
+    rating_file.readline()  # skip header
+    while True:
+        lines = rating_file.readlines(chunk_bytes)
+        if not lines:
+            return
+        rows = []
+        for line in lines:
+            info_list = line.split(",")
+            rows.append((int(info_list[0]), int(info_list[1]),
+                         float(info_list[2])))
+        yield rows
+
+
+class _Spill:
+    """
+    Partition files on disk holding the rating rows of a disjoint set of
+    users each
+    """
+
+    def __init__(self, spill_dir: Optional[str], partitions: int) -> None:
+        """
+        create the empty partition files in a new directory in spill_dir
+        """
+        self._dir = tempfile.TemporaryDirectory(prefix='ratings-',
+                                                dir=spill_dir)
+        self.partitions = partitions
+        self.paths = [os.path.join(self._dir.name, 'part-%d' % part)
+                      for part in range(partitions)]
+        self.spills = 0
+
+    def write(self, buffer: UserRatingDict) -> None:
+        """
+        append the ratings in buffer to the partition of each user
+        """
+        columns = [(array('i'), array('i'), array('d'))
+                   for _ in range(self.partitions)]
+        for user_id, ratings in buffer.items():
+            users, movies, values = columns[user_id % self.partitions]
+            for movie_id, rating in ratings.items():
+                users.append(user_id)
+                movies.append(movie_id)
+                values.append(rating)
+        for path, (users, movies, values) in zip(self.paths, columns):
+            if users:
+                with open(path, 'ab') as part_file:
+                    part_file.write(BLOCK.pack(len(users)))
+                    users.tofile(part_file)
+                    movies.tofile(part_file)
+                    values.tofile(part_file)
+        self.spills += 1
+
+    def read(self, part: int) -> UserRatingDict:
+        """
+        return the ratings of partition part, later rows replacing earlier
+        rows of the same user and movie
+        """
+        user_ratings = {}
+        if not os.path.exists(self.paths[part]):
+            return user_ratings
+        with open(self.paths[part], 'rb') as part_file:
+            while True:
+                header = part_file.read(BLOCK.size)
+                if not header:
+                    break
+                count = BLOCK.unpack(header)[0]
+                users, movies, values = array('i'), array('i'), array('d')
+                users.fromfile(part_file, count)
+                movies.fromfile(part_file, count)
+                values.fromfile(part_file, count)
+                for user_id, movie_id, rating in zip(users, movies, values):
+                    if user_id in user_ratings:
+                        user_ratings[user_id][movie_id] = rating
+                    else:
+                        user_ratings[user_id] = {movie_id: rating}
+        return user_ratings
+
+    def close(self) -> None:
+        """
+        delete the partition files
+        """
+        self._dir.cleanup()
+
+
+def _read_partitions(rating_path: str, movies: MovieDict,
+                     memory_budget: int, chunk_bytes: int, partitions: int,
+                     spill_dir: Optional[str],
+                     seen: Optional[Dict[int, None]] = None
+                     ) -> Iterator[UserRatingDict]:
+    """
+    yield the kept ratings of rating_path one partition of users at a time,
+    as iter_partitions does, adding every user id read to seen if given
+    """
+    # the parsed chunk takes up to a quarter of the budget, the buffer the
+    # rest
+    chunk_bytes = max(MIN_CHUNK_BYTES,
+                      min(chunk_bytes, memory_budget // 4 // PARSED_PER_BYTE))
+    max_buffered = memory_budget - chunk_bytes * PARSED_PER_BYTE
+    buffer = {}
+    buffered = 0
+    spill = None
+    try:
+        with open(rating_path) as rating_file:
+            for rows in iter_rating_chunks(rating_file, chunk_bytes):
+                for user_id, movie_id, rating in rows:
+                    if seen is not None:
+                        seen[user_id] = None
+                    if movie_id not in movies:
+                        continue
+                    if user_id in buffer:
+                        buffer[user_id][movie_id] = rating
+                    else:
+                        buffer[user_id] = {movie_id: rating}
+                        buffered += BYTES_PER_USER
+                    buffered += BYTES_PER_RATING
+                rows = None
+                if buffered > max_buffered:
+                    if spill is None:
+                        spill = _Spill(spill_dir, partitions)
+                    spill.write(buffer)
+                    buffer = {}
+                    buffered = 0
+        if spill is None:
+            yield buffer
+            return
+        spill.write(buffer)
+        buffer = None
+        for part in range(partitions):
+            yield spill.read(part)
+    finally:
+        if spill is not None:
+            spill.close()
+
+
+def iter_partitions(rating_path: str, movies: MovieDict,
+                    memory_budget: int = 256 * 1024 * 1024,
+                    chunk_bytes: int = CHUNK_BYTES,
+                    partitions: int = NUM_PARTITIONS,
+                    spill_dir: Optional[str] = None
+                    ) -> Iterator[UserRatingDict]:
+    """
+    yield the UserRatingDict of the ratings in rating_path for movies in
+    movies one partition of users at a time; each user is in exactly one
+    partition. If the kept ratings fit in memory_budget there is a single
+    partition; otherwise they are spilled to disk and read back one
+    partition at a time, so only the partition being used is in memory
+    :param rating_path: rating file
+    :param movies: MovieDict; ratings of other movies are dropped on read
+    :param memory_budget: bytes of parsed and buffered ratings held before
+    the buffer is spilled to disk
+    :param chunk_bytes: bytes of the file parsed at a time, fewer if the
+    parsed chunk would not fit in memory_budget
+    :param partitions: number of partition files to spill to
+    :param spill_dir: directory for the partition files, the system
+    temporary directory if None
+    :return: iterator of UserRatingDict
+
+    >>> movies = {10: MOVIE_DICT_SMALL[68735], 2968: MOVIE_DICT_SMALL[68735]}
+    >>> list(iter_partitions('ratings_tiny.csv', movies, memory_budget=0,
+    ...                      partitions=2))
+    [{2: {10: 4.0}}, {1: {2968: 1.0}}]
+    """
+    return _read_partitions(rating_path, movies, memory_budget, chunk_bytes,
+                            partitions, spill_dir)
+
+
+def ingest_ratings(rating_path: str, movies: MovieDict,
+                   memory_budget: int = 256 * 1024 * 1024,
+                   chunk_bytes: int = CHUNK_BYTES,
+                   partitions: int = NUM_PARTITIONS,
+                   spill_dir: Optional[str] = None
+                   ) -> Tuple[UserRatingDict, MovieUserDict]:
+    """
+    return the UserRatingDict and MovieUserDict of the ratings in
+    rating_path for movies in movies, reading the file with
+    iter_partitions. The result is a whole UserRatingDict, so memory_budget
+    only bounds the buffered ratings, not the result; use ingest_compact
+    or iter_partitions when the ratings do not fit in memory as dicts
+    :param rating_path: rating file
+    :param movies: MovieDict; ratings of other movies are dropped on read
+    :param memory_budget: bytes of parsed and buffered ratings held before
+    the buffer is spilled to disk
+    :param chunk_bytes: bytes of the file parsed at a time
+    :param partitions: number of partition files to spill to
+    :param spill_dir: directory for the partition files, the system
+    temporary directory if None
+    :return: (user_ratings, movie_users)
+
+    >>> movies = {10: MOVIE_DICT_SMALL[68735]}
+    >>> ingest_ratings('ratings_tiny.csv', movies, memory_budget=0)
+    ({2: {10: 4.0}}, {10: [2]})
+    """
+    # users in order of their first rating, as in read_ratings
+    seen = {}
+    for part in _read_partitions(rating_path, movies, memory_budget,
+                                 chunk_bytes, partitions, spill_dir, seen):
+        seen.update(part)
+    user_ratings = {user_id: ratings for user_id, ratings in seen.items()
+                    if ratings is not None}
+    return user_ratings, movies_to_users(user_ratings)
+
+
+def ingest_compact(rating_path: str, movies: MovieDict,
+                   memory_budget: int = 256 * 1024 * 1024,
+                   chunk_bytes: int = CHUNK_BYTES,
+                   partitions: int = NUM_PARTITIONS,
+                   spill_dir: Optional[str] = None) -> CompactRatings:
+    """
+    return the ratings in rating_path for movies in movies as a
+    CompactRatings, packing each partition of iter_partitions as it is
+    read. Besides the packed ratings, about 5 bytes a rating held twice
+    while the partitions are merged, memory holds at most memory_budget of
+    buffered ratings or one partition as dicts
+    :param rating_path: rating file
+    :param movies: MovieDict; ratings of other movies are dropped on read
+    :param memory_budget: bytes of parsed and buffered ratings held before
+    the buffer is spilled to disk
+    :param chunk_bytes: bytes of the file parsed at a time
+    :param partitions: number of partition files to spill to
+    :param spill_dir: directory for the partition files, the system
+    temporary directory if None
+    :return: CompactRatings of the kept ratings
+
+    >>> movies = {10: MOVIE_DICT_SMALL[68735], 2968: MOVIE_DICT_SMALL[68735]}
+    >>> ingest_compact('ratings_tiny.csv', movies, memory_budget=0)
+    {1: {2968: 1.0}, 2: {10: 4.0}}
+    """
+    packed = []
+    for part in _read_partitions(rating_path, movies, memory_budget,
+                                 chunk_bytes, partitions, spill_dir):
+        packed.append(CompactRatings(part))
+        part = None
+    if len(packed) == 1:
+        return packed[0]
+    return CompactRatings.merge(packed)
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,323 @@
+"""Offline item-item model for the CSC108 A3 recommender.
+
+recommend_movies finds similar users and scores their movies on every
+query. train_item_model moves that work offline: for every movie i it
+accumulates, over the users who rated i, the same contribution
+get_movie_score_dict gives each movie j the user rated CUT_OFF_RATING or
+above,
+
+    weight(i, j) = sum of rating of i / (number of such movies j of the
+                   user * popularity of j)
+
+and keeps the k heaviest j. write_item_model saves the lists as flat
+arrays that ItemModel memory-maps, and ItemModel.recommend_movies merges
+the lists of the target's movies weighted by the target's ratings, so a
+query costs O(len(target_rating) * k) whatever the size of the ratings.
+
+    python recommender_itemitem.py --ratings ratings_small.csv --k 50
+"""
+
+import argparse
+import bisect
+import heapq
+import mmap
+import os
+import struct
+import time
+from array import array
+from typing import List, Dict, Optional, Tuple
+
+from recommender_constants import Rating, UserRatingDict
+from recommender_constants import USER_RATING_DICT_SMALL
+from recommender_functions import RatingIndex, sort_moviescore_dict
+from recommender_loader import BYTE_ORDER
+
+ItemModelDict = Dict[int, List[Tuple[int, float]]]
+
+MODEL_MAGIC = b'RCII'
+# bump when the file layout or the weights change
+MODEL_VERSION = 1
+# magic, version, byte order, k, number of neighbours, number of movies
+MODEL_HEADER = struct.Struct('=4sHHqqq')
+# co-rated pair weights train_item_model holds at a time
+MAX_PAIRS = 1 << 20
+
+
+def train_item_model(user_ratings: UserRatingDict, k: int = 50,
+                     index: Optional[RatingIndex] = None,
+                     max_pairs: int = MAX_PAIRS) -> ItemModelDict:
+    """
+    return {movie: [(neighbour, weight)]} with the k heaviest co-rated
+    neighbours of every movie, heaviest first, ties going to the smaller
+    movie id. The weights of every co-rated pair would take memory in
+    proportion to the sum over users of their number of ratings times
+    their number of high ratings, so the movies are trained in blocks
+    holding the weights of at most max_pairs pairs, about 100 bytes each,
+    at a time (a movie with more pairs is trained alone); each block is one
+    pass over user_ratings
+    :param user_ratings: UserRatingDict dictionary
+    :param k: number of neighbours kept per movie
+    :param index: prebuilt RatingIndex of user_ratings, built here if None
+    :param max_pairs: most (movie, neighbour) weights held at a time
+    :return: the neighbour lists
+    >>> model = train_item_model(USER_RATING_DICT_SMALL)
+    >>> model[68735]
+    [(302156, 1.75), (293660, 1.0)]
+    >>> model[124057]
+    [(293660, 1.5)]
+    >>> train_item_model(USER_RATING_DICT_SMALL, max_pairs=1) == model
+    True
+    """
+    if index is None:
+        index = RatingIndex(user_ratings)
+    # most neighbours each movie's weights can have
+    pairs = {}
+    for user, ratings in user_ratings.items():
+        num_high = len(index.high_movies[user])
+        if num_high:
+            for movie in ratings:
+                pairs[movie] = pairs.get(movie, 0) + num_high
+    model = {}
+    block = []
+    block_pairs = 0
+    for movie in sorted(pairs):
+        if block and block_pairs + pairs[movie] > max_pairs:
+            _train_block(user_ratings, block, k, index, model)
+            block = []
+            block_pairs = 0
+        block.append(movie)
+        block_pairs += pairs[movie]
+    if block:
+        _train_block(user_ratings, block, k, index, model)
+    return model
+
+
+def _train_block(user_ratings: UserRatingDict, block: List[int], k: int,
+                 index: RatingIndex, model: ItemModelDict) -> None:
+    """
+    add the neighbour lists of the movies in block to model, summing each
+    weight over the users in user_ratings order
+    """
+    popularity = index.popularity
+    weights = {movie: {} for movie in block}
+    for user, ratings in user_ratings.items():
+        high = index.high_movies[user]
+        if not high:
+            continue
+        shares = None
+        for movie, rating in ratings.items():
+            row = weights.get(movie)
+            if row is None:
+                continue
+            if shares is None:
+                # the user's share of each of their high movies
+                shares = [(neighbour, 1 / (len(high) * popularity[neighbour]))
+                          for neighbour in sorted(high)]
+            for neighbour, share in shares:
+                if neighbour != movie:
+                    row[neighbour] = row.get(neighbour, 0) + rating * share
+    for movie in block:
+        model[movie] = heapq.nsmallest(k, weights.pop(movie).items(),
+                                       key=lambda item: (-item[1], item[0]))
+
+
+def write_item_model(path: str, model: ItemModelDict, k: int) -> None:
+    """
+    save model to path as flat arrays, replacing any old file atomically
+    :param path: model file
+    :param model: neighbour lists from train_item_model
+    :param k: number of neighbours model was trained with
+    """
+    movie_ids = array('i', sorted(model))
+    offsets = array('q', [0])
+    neighbours = array('i')
+    weights = array('d')
+    for movie in movie_ids:
+        for neighbour, weight in model[movie]:
+            neighbours.append(neighbour)
+            weights.append(weight)
+        offsets.append(len(neighbours))
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as model_file:
+        model_file.write(MODEL_HEADER.pack(MODEL_MAGIC, MODEL_VERSION,
+                                           BYTE_ORDER, k, len(neighbours),
+                                           len(movie_ids)))
+        # 8 byte columns first so every column stays aligned
+        for column in (offsets, weights, movie_ids, neighbours):
+            column.tofile(model_file)
+    os.replace(tmp_path, path)
+
+
+class ItemModel:
+    """
+    A memory-mapped item-item model written by write_item_model
+    :ivar k: number of neighbours kept per movie
+    :ivar movie_ids: movies with neighbours, in ascending order
+    :ivar offsets: neighbours of movie_ids[i] are offsets[i]:offsets[i + 1]
+    :ivar neighbours: neighbour movie ids, heaviest first per movie
+    :ivar weights: weight of each neighbour
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp_dir:
+    ...     path = os.path.join(tmp_dir, 'small.items')
+    ...     write_item_model(path, train_item_model(USER_RATING_DICT_SMALL),
+    ...                      50)
+    ...     with ItemModel(path) as model:
+    ...         print(model.neighbours_of(68735),
+    ...               model.recommend_movies({68735: 4.5}, 2))
+    [(302156, 1.75), (293660, 1.0)] [302156, 293660]
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        memory-map the model at path
+        :raise ValueError: if path is not a complete model of this version
+        """
+        with open(path, 'rb') as model_file:
+            if os.fstat(model_file.fileno()).st_size < MODEL_HEADER.size:
+                raise ValueError('%s is not an item model of this version'
+                                 % path)
+            self._map = mmap.mmap(model_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        magic, version, byte_order, k, entries, count = \
+            MODEL_HEADER.unpack_from(self._map)
+        if (magic, version, byte_order) != \
+                (MODEL_MAGIC, MODEL_VERSION, BYTE_ORDER) or \
+                len(self._map) != MODEL_HEADER.size + 8 * (count + 1) + \
+                12 * entries + 4 * count:
+            self._map.close()
+            raise ValueError('%s is not an item model of this version' % path)
+        self.k = k
+        view = memoryview(self._map)
+        start = MODEL_HEADER.size
+        self.offsets = view[start:start + 8 * (count + 1)].cast('q')
+        start += 8 * (count + 1)
+        self.weights = view[start:start + 8 * entries].cast('d')
+        start += 8 * entries
+        self.movie_ids = view[start:start + 4 * count].cast('i')
+        start += 4 * count
+        self.neighbours = view[start:start + 4 * entries].cast('i')
+
+    def _span(self, movie_id: int) -> Tuple[int, int]:
+        """
+        return the start and end of the neighbours of movie_id, an empty
+        span if it has none
+        """
+        pos = bisect.bisect_left(self.movie_ids, movie_id)
+        if pos < len(self.movie_ids) and self.movie_ids[pos] == movie_id:
+            return self.offsets[pos], self.offsets[pos + 1]
+        return 0, 0
+
+    def neighbours_of(self, movie_id: int) -> List[Tuple[int, float]]:
+        """
+        return the (neighbour, weight) list of movie_id
+        """
+        start, end = self._span(movie_id)
+        return list(zip(self.neighbours[start:end].tolist(),
+                        self.weights[start:end].tolist()))
+
+    def movie_scores(self, target_rating: Rating) -> Dict[int, float]:
+        """
+        return {movie: score} merged from the neighbour lists of the movies
+        in target_rating, each weighted by the target's rating; movies the
+        target rated are left out
+        :param target_rating: dictionary of movie_ids to rating
+        :return: dictionary of movie id to score
+        """
+        movie_score_dict = {}
+        for movie in sorted(target_rating):
+            rating = target_rating[movie]
+            start, end = self._span(movie)
+            for neighbour, weight in zip(self.neighbours[start:end].tolist(),
+                                         self.weights[start:end].tolist()):
+                if neighbour not in target_rating:
+                    movie_score_dict[neighbour] = \
+                        movie_score_dict.get(neighbour, 0) + rating * weight
+        return movie_score_dict
+
+    def recommend_movies(self, target_rating: Rating,
+                         num_movies: int) -> List[int]:
+        """
+        return num_movies movie ids recommended for target_rating from the
+        neighbour lists
+        :param target_rating: dictionary of movie_ids to rating
+        :param num_movies: number of movies to recommend
+        :return: list of recommended movie ids
+        """
+        return sort_moviescore_dict(self.movie_scores(target_rating),
+                                    num_movies)
+
+    def close(self) -> None:
+        """
+        release the memory map; the model must not be used afterwards
+        """
+        for column in (self.offsets, self.weights, self.movie_ids,
+                       self.neighbours):
+            column.release()
+        self._map.close()
+
+    def __enter__(self) -> 'ItemModel':
+        """
+        return self so the model can be used in a with statement
+        """
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """
+        close the model at the end of a with statement
+        """
+        self.close()
+
+
+def main() -> None:
+    """
+    train a model, save it, and time queries against recommend_movies
+    """
+    from recommender_bench import sample_targets, summarize, time_calls
+    from recommender_functions import recommend_movies
+    from recommender_loader import load_movies, load_prepared_ratings
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--movies', default='movies.csv')
+    parser.add_argument('--ratings', default='ratings_small.csv')
+    parser.add_argument('--k', type=int, default=50)
+    parser.add_argument('--max-pairs', type=int, default=MAX_PAIRS,
+                        help='pair weights held at a time while training')
+    parser.add_argument('--output', help='model file, <ratings>.items if '
+                                         'not given')
+    parser.add_argument('--queries', type=int, default=100)
+    args = parser.parse_args()
+    output = args.output or args.ratings + '.items'
+
+    user_ratings, movie_users = load_prepared_ratings(
+        args.ratings, load_movies(args.movies))
+    index = RatingIndex(user_ratings)
+    start = time.perf_counter()
+    write_item_model(output, train_item_model(user_ratings, args.k, index,
+                                              args.max_pairs),
+                     args.k)
+    print('trained %s in %.1f s' % (output, time.perf_counter() - start))
+    targets = sample_targets(user_ratings, args.queries)
+    with ItemModel(output) as model:
+        item_times = []
+        user_times = []
+        overlap = 0
+        for target in targets:
+            item_times.extend(time_calls(
+                lambda: model.recommend_movies(target, 5), 1))
+            user_times.extend(time_calls(
+                lambda: recommend_movies(target, user_ratings, movie_users, 5,
+                                         index), 1))
+            overlap += len(set(model.recommend_movies(target, 5)) &
+                           set(recommend_movies(target, user_ratings,
+                                                movie_users, 5, index)))
+    for name, times in (('item-item', item_times),
+                        ('recommend_movies', user_times)):
+        summary = summarize(times)
+        print('%16s p50 %8.3f ms  p99 %8.3f ms' % (name, summary['p50_ms'],
+                                                   summary['p99_ms']))
+    print('mean top-5 overlap with recommend_movies: %.2f'
+          % (overlap / len(targets)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+"""Binary column cache for the CSC108 A3 movie and rating files.
+
+The first load of a CSV file converts it into a compact binary file next to
+it (``<csv>.cols``). Ratings are stored as parallel user / movie / rating
+arrays; movies as an id array plus offsets into one UTF-8 blob of titles and
+genres. Later loads memory-map the binary file instead of parsing the CSV.
+The cache records the source file's mtime and size and is rebuilt whenever
+either changes, or when the cache is not as long as its header says, as
+after an interrupted write.
+"""
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import BinaryIO, List, Tuple
+
+from recommender_constants import MovieDict, MovieUserDict, UserRatingDict
+from recommender_functions import read_movies
+
+CACHE_SUFFIX = '.cols'
+RATINGS_MAGIC = b'RCRT'
+MOVIES_MAGIC = b'RCMV'
+# bump when the file layout or the parsing rules change
+CACHE_VERSION = 2
+# magic, version, byte order, source mtime (ns), source size, row count
+HEADER = struct.Struct('=4sHHqqq')
+BYTE_ORDER = 0 if sys.byteorder == 'little' else 1
+FIELD_SEP = '\x1f'
+
+
+class RatingColumns:
+    """
+    Parallel user / movie / rating columns of a rating file, backed by a
+    memory-mapped cache file
+    :ivar users: user id of each rating row
+    :ivar movies: movie id of each rating row
+    :ivar ratings: rating of each rating row
+    """
+
+    def __init__(self, cache_path: str) -> None:
+        """
+        memory-map the ratings cache at cache_path
+        :param cache_path: path of a ratings cache file
+        :raise ValueError: if the file is not as long as its header says
+        """
+        with open(cache_path, 'rb') as cache_file:
+            self._map = mmap.mmap(cache_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        count = HEADER.unpack_from(self._map)[5]
+        if len(self._map) != HEADER.size + 16 * count:
+            self._map.close()
+            raise ValueError('truncated ratings cache: ' + cache_path)
+        view = memoryview(self._map)
+        start = HEADER.size
+        self.users = view[start:start + 4 * count].cast('i')
+        start = start + 4 * count
+        self.movies = view[start:start + 4 * count].cast('i')
+        start = start + 4 * count
+        self.ratings = view[start:start + 8 * count].cast('d')
+
+    def __len__(self) -> int:
+        """
+        return the number of rating rows
+        """
+        return len(self.users)
+
+    def to_user_ratings(self) -> UserRatingDict:
+        """
+        return the columns as the UserRatingDict read_ratings would build
+        """
+        rating_dict = {}
+        for user_id, movie_id, rating in zip(self.users, self.movies,
+                                             self.ratings):
+            if user_id in rating_dict:
+                rating_dict[user_id][movie_id] = rating
+            else:
+                rating_dict[user_id] = {movie_id: rating}
+        return rating_dict
+
+    def prepare(self, movies: MovieDict) -> Tuple[UserRatingDict,
+                                                  MovieUserDict]:
+        """
+        return the UserRatingDict and MovieUserDict that read_ratings,
+        remove_unknown_movies and movies_to_users would build, in one pass
+        over the columns: ratings of movies not in movies are skipped and
+        each movie's users are collected as its ratings are kept
+        :param movies: MovieDict dictionary
+        :return: (user_ratings, movie_users)
+        """
+        user_ratings = {}
+        movie_users = {}
+        # movies whose user lists got a user out of order
+        unsorted = set()
+        for user_id, movie_id, rating in zip(self.users, self.movies,
+                                             self.ratings):
+            ratings = user_ratings.get(user_id)
+            if ratings is None:
+                # keep the user's place in read_ratings order even if all
+                # their movies turn out to be unknown
+                ratings = user_ratings[user_id] = {}
+            if movie_id not in movies:
+                continue
+            if movie_id not in ratings:
+                users = movie_users.get(movie_id)
+                if users is None:
+                    movie_users[movie_id] = [user_id]
+                else:
+                    if user_id < users[-1]:
+                        unsorted.add(movie_id)
+                    users.append(user_id)
+            ratings[movie_id] = rating
+        for movie_id in unsorted:
+            movie_users[movie_id].sort()
+        empty_users = [user_id for user_id, ratings in user_ratings.items()
+                       if not ratings]
+        for user_id in empty_users:
+            del user_ratings[user_id]
+        return user_ratings, movie_users
+
+    def close(self) -> None:
+        """
+        release the memory map; the columns must not be used afterwards
+        """
+        for column in (self.users, self.movies, self.ratings):
+            column.release()
+        self._map.close()
+
+    def __enter__(self) -> 'RatingColumns':
+        """
+        return self so the columns can be used in a with statement
+        """
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """
+        close the columns at the end of a with statement
+        """
+        self.close()
+
+
+def cache_path_for(csv_path: str) -> str:
+    """
+    return the path of the binary cache of csv_path
+    >>> cache_path_for('ratings_small.csv')
+    'ratings_small.csv.cols'
+    """
+    return csv_path + CACHE_SUFFIX
+
+
+def _source_stamp(csv_path: str) -> tuple:
+    """
+    return (mtime in ns, size) of csv_path
+    """
+    stat = os.stat(csv_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _cache_size(cache_file: BinaryIO, magic: bytes, count: int) -> int:
+    """
+    return the length a complete cache with count rows has, reading the
+    length of the movie blob from the last movie offset in cache_file;
+    -1 if cache_file is too short to hold that offset
+    """
+    if magic == RATINGS_MAGIC:
+        return HEADER.size + 16 * count
+    columns_size = HEADER.size + 8 * (count + 1) + 4 * (count + count % 2)
+    cache_file.seek(HEADER.size + 8 * count)
+    last_offset = cache_file.read(8)
+    if len(last_offset) < 8:
+        return -1
+    return columns_size + array('q', last_offset)[0]
+
+
+def _cache_is_fresh(csv_path: str, magic: bytes) -> bool:
+    """
+    return True iff the cache of csv_path exists, is complete and was built
+    by this version from the current contents of csv_path
+    """
+    try:
+        with open(cache_path_for(csv_path), 'rb') as cache_file:
+            header = cache_file.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return False
+            cache_magic, version, byte_order, mtime, size, count = \
+                HEADER.unpack(header)
+            if (cache_magic, version, byte_order) != \
+                    (magic, CACHE_VERSION, BYTE_ORDER) or \
+                    (mtime, size) != _source_stamp(csv_path):
+                return False
+            return os.fstat(cache_file.fileno()).st_size == \
+                _cache_size(cache_file, magic, count)
+    except OSError:
+        return False
+
+
+def _write_cache(csv_path: str, magic: bytes, count: int,
+                 columns: List[array], blob: bytes = b'') -> None:
+    """
+    write the header, columns and blob to the cache of csv_path, replacing
+    any old cache atomically
+    """
+    mtime, size = _source_stamp(csv_path)
+    cache_path = cache_path_for(csv_path)
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'wb') as cache_file:
+        cache_file.write(HEADER.pack(magic, CACHE_VERSION, BYTE_ORDER,
+                                     mtime, size, count))
+        for column in columns:
+            column.tofile(cache_file)
+        cache_file.write(blob)
+    os.replace(tmp_path, cache_path)
+
+
+def build_ratings_cache(csv_path: str) -> None:
+    """
+    parse the rating CSV at csv_path the way read_ratings does and write
+    its columns to the cache file
+    :param csv_path: path of a rating file
+    """
+    users = array('i')
+    movies = array('i')
+    ratings = array('d')
+    with open(csv_path) as rating_file:
+        rating_file.readline()  # skip header
+        for line in rating_file:
+            info_list = line.split(",")
+            users.append(int(info_list[0]))
+            movies.append(int(info_list[1]))
+            ratings.append(float(info_list[2]))
+    _write_cache(csv_path, RATINGS_MAGIC, len(users), [users, movies, ratings])
+
+
+def build_movies_cache(csv_path: str) -> None:
+    """
+    parse the movie CSV at csv_path with read_movies and write it to the
+    cache file
+    :param csv_path: path of a movie file
+    """
+    with open(csv_path) as movie_file:
+        movies = read_movies(movie_file)
+    offsets = array('q', [0])
+    movie_ids = array('i')
+    records = []
+    end = 0
+    for movie_id, (title, genres) in movies.items():
+        record = FIELD_SEP.join([title] + genres).encode('utf-8')
+        records.append(record)
+        end = end + len(record)
+        offsets.append(end)
+        movie_ids.append(movie_id)
+    # keep the blob after 8-byte aligned columns
+    if len(movie_ids) % 2:
+        movie_ids.append(0)
+    _write_cache(csv_path, MOVIES_MAGIC, len(movies), [offsets, movie_ids],
+                 b''.join(records))
+
+
+def open_rating_columns(csv_path: str) -> RatingColumns:
+    """
+    return the memory-mapped columns of the rating CSV at csv_path,
+    rebuilding the cache first if it is missing or stale
+    :param csv_path: path of a rating file
+    """
+    if not _cache_is_fresh(csv_path, RATINGS_MAGIC):
+        build_ratings_cache(csv_path)
+    return RatingColumns(cache_path_for(csv_path))
+
+
+def load_ratings(csv_path: str) -> UserRatingDict:
+    """
+    return the same UserRatingDict as read_ratings(open(csv_path)), read
+    through the binary cache
+
+    >>> ratings = load_ratings('ratings_tiny.csv')
+    >>> ratings
+    {1: {2968: 1.0, 3671: 3.0}, 2: {10: 4.0, 17: 5.0}}
+    """
+    with open_rating_columns(csv_path) as columns:
+        return columns.to_user_ratings()
+
+
+def load_prepared_ratings(csv_path: str, movies: MovieDict
+                          ) -> Tuple[UserRatingDict, MovieUserDict]:
+    """
+    return the UserRatingDict of csv_path without the ratings of movies
+    not in movies, and its MovieUserDict, read through the binary cache
+
+    >>> user_ratings, movie_users = load_prepared_ratings(
+    ...     'ratings_tiny.csv', {10: ('GoldenEye', []), 17: ('Emma', []),
+    ...                          3671: ('Blazing Saddles', [])})
+    >>> user_ratings
+    {1: {3671: 3.0}, 2: {10: 4.0, 17: 5.0}}
+    >>> movie_users
+    {3671: [1], 10: [2], 17: [2]}
+    """
+    with open_rating_columns(csv_path) as columns:
+        return columns.prepare(movies)
+
+
+def load_movies(csv_path: str) -> MovieDict:
+    """
+    return the same MovieDict as read_movies(open(csv_path)), read through
+    the binary cache
+
+    >>> from recommender_constants import MOVIE_DICT_SMALL
+    >>> load_movies('movies_tiny.csv') == MOVIE_DICT_SMALL
+    True
+    """
+    if not _cache_is_fresh(csv_path, MOVIES_MAGIC):
+        build_movies_cache(csv_path)
+    with open(cache_path_for(csv_path), 'rb') as cache_file:
+        with mmap.mmap(cache_file.fileno(), 0,
+                       access=mmap.ACCESS_READ) as cache_map:
+            count = HEADER.unpack_from(cache_map)[5]
+            start = HEADER.size
+            offsets = array('q')
+            offsets.frombytes(cache_map[start:start + 8 * (count + 1)])
+            start = start + 8 * (count + 1)
+            movie_ids = array('i')
+            movie_ids.frombytes(cache_map[start:start + 4 * count])
+            start = start + 4 * (count + count % 2)
+            blob = cache_map[start:]
+    movies = {}
+    for i, movie_id in enumerate(movie_ids.tolist()):
+        record = blob[offsets[i]:offsets[i + 1]].decode('utf-8')
+        info_list = record.split(FIELD_SEP)
+        movies[movie_id] = (info_list[0], info_list[1:])
+    return movies
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
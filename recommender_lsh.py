@@ -0,0 +1,248 @@
+"""Approximate neighbour search for the CSC108 A3 recommender.
+
+For a movie most users have rated, get_similar_users compares the target
+with nearly every user. MinHashIndex instead hashes the set of movies each
+user rated into a MinHash signature at load time and buckets the users by
+bands of their signature (locality-sensitive hashing). A query only scores
+the users sharing at least one band bucket with the target, and keeps the
+top_m most similar. Two sets can only share a MinHash value if they share
+a movie, so every candidate is a user get_similar_users would also score,
+and users with a large overlap relative to their number of ratings, the
+ones the similarity favours, collide most often. More bands raise recall
+and cost; more rows per band lower both.
+
+    python recommender_lsh.py --ratings ratings_small.csv
+
+runs the doctests and reports the recall of the top_m neighbours against the exact
+get_similar_users on sampled targets.
+"""
+
+import argparse
+import random
+import time
+from array import array
+from typing import List, Dict, Optional
+
+from recommender_constants import Rating, UserRatingDict, MovieUserDict
+from recommender_constants import (USER_RATING_DICT_SMALL,
+                                   MOVIE_USER_DICT_SMALL)
+from recommender_functions import (RatingIndex, get_similarities,
+                                   get_similar_users, prune_similar_users,
+                                   score_similar_users, sort_moviescore_dict)
+
+# a Mersenne prime larger than any movie id
+PRIME = (1 << 61) - 1
+
+
+class MinHashIndex:
+    """
+    MinHash LSH buckets of the movie sets of a UserRatingDict
+    :ivar bands: number of bands; a query probes one bucket per band
+    :ivar rows: number of MinHash values per band
+    :ivar top_m: number of neighbours returned by similar_users
+    :ivar buckets: one {band key: [users]} dictionary per band
+    >>> lsh = MinHashIndex(USER_RATING_DICT_SMALL, bands=8, top_m=1)
+    >>> sim = lsh.similar_users({68735: 4.5})
+    >>> list(sim), round(sim[1], 2)
+    ([1], 0.43)
+    >>> lsh.recommend_movies({68735: 4.5}, 2)
+    [302156]
+    """
+
+    def __init__(self, user_ratings: UserRatingDict, bands: int = 32,
+                 rows: int = 1, top_m: int = 50,
+                 index: Optional[RatingIndex] = None, seed: int = 108) -> None:
+        """
+        hash every user in user_ratings into the band buckets
+        :param user_ratings: UserRatingDict dictionary
+        :param bands: number of bands
+        :param rows: number of MinHash values per band
+        :param top_m: number of neighbours returned by similar_users
+        :param index: prebuilt RatingIndex of user_ratings, built here if None
+        :param seed: seed of the hash functions
+        """
+        if index is None:
+            index = RatingIndex(user_ratings)
+        self.user_ratings = user_ratings
+        self.index = index
+        self.bands = bands
+        self.rows = rows
+        self.top_m = top_m
+        rand = random.Random(seed)
+        self._coefficients = [(rand.randrange(1, PRIME), rand.randrange(PRIME))
+                              for _ in range(bands * rows)]
+        # hashes of the rated movies only, so queries do not grow it
+        self._movie_hashes = {}
+        for ratings in user_ratings.values():
+            for movie_id in ratings:
+                if movie_id not in self._movie_hashes:
+                    self._movie_hashes[movie_id] = self._hash_movie(movie_id)
+        self.buckets = [{} for _ in range(bands)]
+        for user, ratings in user_ratings.items():
+            for band, key in enumerate(self._band_keys(ratings)):
+                self.buckets[band].setdefault(key, []).append(user)
+
+    def _hash_movie(self, movie_id: int) -> array:
+        """
+        return the bands * rows hash values of movie_id
+        """
+        return array('q', [(a * movie_id + b) % PRIME
+                           for a, b in self._coefficients])
+
+    def _hashes(self, movie_id: int) -> array:
+        """
+        return the hash values of movie_id, cached for the rated movies
+        """
+        hashes = self._movie_hashes.get(movie_id)
+        if hashes is None:
+            hashes = self._hash_movie(movie_id)
+        return hashes
+
+    def _band_keys(self, rating: Rating) -> List[tuple]:
+        """
+        return the bucket key of each band for the movies in rating
+        """
+        signature = list(map(min, zip(*[self._hashes(movie_id)
+                                        for movie_id in rating])))
+        rows = self.rows
+        return [tuple(signature[band * rows:(band + 1) * rows])
+                for band in range(self.bands)]
+
+    def candidate_users(self, target_rating: Rating) -> List[int]:
+        """
+        return the users sharing a band bucket with target_rating, in
+        ascending order
+        :param target_rating: dictionary of movie_ids to rating
+        :return: list of user ids
+        """
+        if not target_rating:
+            return []
+        candidates = set()
+        for bucket, key in zip(self.buckets, self._band_keys(target_rating)):
+            candidates.update(bucket.get(key, ()))
+        return sorted(candidates)
+
+    def similar_users(self, target_rating: Rating,
+                      top_m: Optional[int] = None,
+                      min_similarity: float = 0.0) -> Dict[int, float]:
+        """
+        return the approximate top_m users of get_similar_users with their
+        exact similarity, in ascending user order
+        :param target_rating: dictionary of movie_ids to rating
+        :param top_m: number of neighbours, self.top_m if None
+        :param min_similarity: smallest similarity kept
+        :return: dictionary of user id to similarity score
+        """
+        if top_m is None:
+            top_m = self.top_m
+        user_sim_dict = get_similarities(
+            target_rating, self.candidate_users(target_rating),
+            self.user_ratings, self.index.norms)
+        return prune_similar_users(user_sim_dict, min_similarity, top_m)
+
+    def recommend_movies(self, target_rating: Rating, num_movies: int,
+                         min_similarity: float = 0.0,
+                         top_m: Optional[int] = None) -> List[int]:
+        """
+        return recommend_movies scored from the approximate neighbours
+        :param target_rating: dictionary of movie_ids to rating
+        :param num_movies: number of movies to recommend
+        :param min_similarity: smallest neighbour similarity kept
+        :param top_m: number of neighbours, self.top_m if None
+        :return: list of recommended movie ids
+        """
+        user_sim_dict = self.similar_users(target_rating, top_m,
+                                           min_similarity)
+        movie_score_dict = score_similar_users(target_rating, user_sim_dict,
+                                               self.user_ratings, self.index)
+        return sort_moviescore_dict(movie_score_dict, num_movies)
+
+
+def top_users(user_sim_dict: Dict[int, float],
+              top_m: int) -> Dict[int, float]:
+    """
+    return the top_m entries of user_sim_dict by similarity, ties going to
+    the smaller user id, in ascending user order
+    >>> top_users({3: 0.5, 1: 0.2, 2: 0.5}, 2)
+    {2: 0.5, 3: 0.5}
+    """
+    return prune_similar_users(dict(sorted(user_sim_dict.items())),
+                               top_m=top_m)
+
+
+def measure_recall(lsh: MinHashIndex, targets: List[Rating],
+                   movie_users: MovieUserDict) -> Dict[str, float]:
+    """
+    return the mean recall of lsh.similar_users against the exact top_m of
+    get_similar_users over targets, with the mean number of users each
+    scores and the mean latency of each in ms
+    >>> lsh = MinHashIndex(USER_RATING_DICT_SMALL, top_m=2)
+    >>> measure_recall(lsh, [{68735: 4.5}], MOVIE_USER_DICT_SMALL)['recall']
+    1.0
+    """
+    recall = exact_users = approx_users = exact_time = approx_time = 0.0
+    for target in targets:
+        start = time.perf_counter()
+        exact = get_similar_users(target, lsh.user_ratings, movie_users,
+                                  lsh.index)
+        exact_time += time.perf_counter() - start
+        start = time.perf_counter()
+        approx = lsh.similar_users(target)
+        approx_time += time.perf_counter() - start
+        expected = top_users(exact, lsh.top_m)
+        if expected:
+            recall += len(expected.keys() & approx.keys()) / len(expected)
+        else:
+            recall += 1.0
+        exact_users += len(exact)
+        approx_users += len(lsh.candidate_users(target))
+    count = len(targets)
+    return {'recall': recall / count,
+            'exact_users': exact_users / count,
+            'approx_users': approx_users / count,
+            'exact_ms': exact_time / count * 1000,
+            'approx_ms': approx_time / count * 1000}
+
+
+def main() -> None:
+    """
+    report recall and latency for a grid of bands and rows
+    """
+    from recommender_bench import sample_targets
+    from recommender_loader import load_movies, load_prepared_ratings
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--movies', default='movies.csv')
+    parser.add_argument('--ratings', default='ratings_small.csv')
+    parser.add_argument('--bands', type=int, nargs='+', default=[8, 32, 128])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1, 2])
+    parser.add_argument('--top-m', type=int, default=50)
+    parser.add_argument('--queries', type=int, default=100)
+    args = parser.parse_args()
+
+    user_ratings, movie_users = load_prepared_ratings(
+        args.ratings, load_movies(args.movies))
+    index = RatingIndex(user_ratings)
+    popular = sorted(movie_users, key=lambda movie: -len(movie_users[movie]))
+    workloads = [('sampled', sample_targets(user_ratings, args.queries)),
+                 ('popular seed', [{movie: 5.0} for movie
+                                   in popular[:args.queries]])]
+    print('%12s %5s %4s %7s %10s %10s %10s %10s' % (
+        'targets', 'bands', 'rows', 'recall', 'exact_usr', 'lsh_usr',
+        'exact_ms', 'lsh_ms'))
+    for bands in args.bands:
+        for rows in args.rows:
+            lsh = MinHashIndex(user_ratings, bands, rows, args.top_m, index)
+            for name, targets in workloads:
+                report = measure_recall(lsh, targets, movie_users)
+                print('%12s %5d %4d %7.3f %10.1f %10.1f %10.3f %10.3f' % (
+                    name, bands, rows, report['recall'],
+                    report['exact_users'], report['approx_users'],
+                    report['exact_ms'], report['approx_ms']))
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
+    main()
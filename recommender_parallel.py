@@ -0,0 +1,198 @@
+"""Multi-process movie scoring for the CSC108 A3 recommender.
+
+ParallelScorer splits the candidate movies of a query across a pool of
+worker processes. The ratings' RatingIndex is handed to the pool's
+initializer, which forked workers receive without pickling, so every
+worker of a scorer shares that scorer's index copy-on-write, a worker the
+pool restarts included, and only the query-sized similarity dicts are
+pickled. Every movie is scored by one worker, summing its users in the
+same order as get_movie_score_dict, so the results are identical to the
+serial path. Fork is needed, so this mode is not available on Windows.
+"""
+
+import multiprocessing
+import os
+from typing import AbstractSet, List, Dict, Optional
+
+from recommender_constants import Rating, UserRatingDict, MovieUserDict
+from recommender_constants import (USER_RATING_DICT_SMALL,
+                                   MOVIE_USER_DICT_SMALL)
+from recommender_functions import (RatingIndex, get_similar_users,
+                                   get_candidate_movies, get_movie_score_dict,
+                                   add_user_scores, sort_moviescore_dict)
+
+# RatingIndex of the pool this worker process belongs to
+_worker_index = None
+
+
+def _init_worker(index: RatingIndex) -> None:
+    """
+    keep the index of the worker's pool; run once in each worker process
+    """
+    global _worker_index
+    _worker_index = index
+
+
+def _score_chunk(chunk: List[int], user_sims: List[tuple],
+                 num_user_movies: Dict[int, int]) -> Dict[int, float]:
+    """
+    return score_chunk of chunk, run in a worker process against the index
+    of its pool
+    """
+    return score_chunk(chunk, user_sims, num_user_movies, _worker_index)
+
+
+def score_chunk(chunk: List[int], user_sims: List[tuple],
+                num_user_movies: Dict[int, int],
+                index: RatingIndex) -> Dict[int, float]:
+    """
+    return the get_movie_score_dict scores of the movies in chunk
+    :param chunk: candidate movies to score
+    :param user_sims: (user, similarity) pairs in user_sim_dict order
+    :param num_user_movies: {user: number of candidate movies the user
+    rated CUT_OFF_RATING or above}
+    :param index: RatingIndex of the ratings user_sims came from
+    :return: dictionary of movie id to score
+    >>> score_chunk([302156], [(1, 0.5), (2, 0.25)], {1: 1, 2: 1},
+    ...             RatingIndex(USER_RATING_DICT_SMALL))
+    {302156: 0.5}
+    """
+    chunk_set = set(chunk)
+    movie_score_dict = {}
+    for movie in chunk:
+        movie_score_dict[movie] = 0
+    for user, user_sim_score in user_sims:
+        add_user_scores(movie_score_dict, user_sim_score,
+                        index.high_movies[user] & chunk_set,
+                        num_user_movies[user], index.popularity)
+    return movie_score_dict
+
+
+class ParallelScorer:
+    """
+    A process pool scoring candidate movies for recommend_movies
+    >>> with ParallelScorer(USER_RATING_DICT_SMALL, workers=2,
+    ...                     min_candidates=0) as scorer:
+    ...     scorer.recommend_movies({68735: 4.5}, MOVIE_USER_DICT_SMALL, 2)
+    [302156, 293660]
+    """
+
+    def __init__(self, user_ratings: UserRatingDict,
+                 index: Optional[RatingIndex] = None,
+                 workers: Optional[int] = None,
+                 min_candidates: int = 2000) -> None:
+        """
+        fork the worker pool over user_ratings and its index
+        :param user_ratings: UserRatingDict dictionary
+        :param index: prebuilt RatingIndex of user_ratings, built here if None
+        :param workers: number of worker processes, os.cpu_count() if None
+        :param min_candidates: candidate sets smaller than this are scored
+        in this process, where the pool overhead would dominate
+        :raise ValueError: if workers is less than 1
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        elif workers < 1:
+            raise ValueError('workers must be at least 1, not %r' % workers)
+        if index is None:
+            index = RatingIndex(user_ratings)
+        self.user_ratings = user_ratings
+        self.index = index
+        self.workers = workers
+        self.min_candidates = min_candidates
+        context = multiprocessing.get_context('fork')
+        self._pool = context.Pool(self.workers, initializer=_init_worker,
+                                  initargs=(index,))
+
+    def movie_scores(self, candidate_movies: List[int],
+                     user_sim_dict: Dict[int, float],
+                     genre_movies: Optional[AbstractSet[int]] = None
+                     ) -> Dict[int, float]:
+        """
+        return the same dictionary as get_movie_score_dict, with the
+        candidate movies split into one chunk per worker; with
+        genre_movies, only the candidates in it are scored, as
+        score_similar_users does
+        :param candidate_movies: candidate movies
+        :param user_sim_dict: similar user dict{user:sim_score}
+        :param genre_movies: only score these movies, if given
+        :return: dictionary of movie id to score
+        """
+        if genre_movies is None and (len(candidate_movies) <
+                                     self.min_candidates or
+                                     self.workers == 1):
+            return get_movie_score_dict(candidate_movies, user_sim_dict,
+                                        self.user_ratings, self.index)
+        candidate_set = set(candidate_movies)
+        high_movies = self.index.high_movies
+        # a user's count covers all their candidates, in the genre or not
+        num_user_movies = {user: len(high_movies[user] & candidate_set)
+                           for user in user_sim_dict}
+        if genre_movies is not None:
+            candidate_movies = [movie for movie in candidate_movies
+                                if movie in genre_movies]
+        user_sims = list(user_sim_dict.items())
+        if len(candidate_movies) < self.min_candidates or self.workers == 1:
+            return score_chunk(candidate_movies, user_sims, num_user_movies,
+                               self.index)
+        chunks = [candidate_movies[i::self.workers]
+                  for i in range(self.workers)]
+        results = self._pool.starmap(
+            _score_chunk,
+            [(chunk, user_sims, num_user_movies) for chunk in chunks])
+        movie_score_dict = {}
+        for movie in candidate_movies:
+            movie_score_dict[movie] = 0
+        for result in results:
+            movie_score_dict.update(result)
+        return movie_score_dict
+
+    def recommend_movies(self, target_rating: Rating,
+                         movie_users: MovieUserDict,
+                         num_movies: int, min_similarity: float = 0.0,
+                         top_m: Optional[int] = None,
+                         genre_movies: Optional[AbstractSet[int]] = None
+                         ) -> List[int]:
+        """
+        return the same list as recommend_movies, scoring in the pool
+        :param target_rating: dictionary of movie_ids to rating
+        :param movie_users: MovieUserDict of the scorer's user_ratings
+        :param num_movies: number of movies to recommend
+        :param min_similarity: prune as in get_similar_users
+        :param top_m: prune as in get_similar_users
+        :param genre_movies: only recommend these movies, if given
+        :return: list of recommended movie ids
+        """
+        user_sim_dict = get_similar_users(target_rating, self.user_ratings,
+                                          movie_users, self.index,
+                                          min_similarity, top_m)
+        candidate_movies = get_candidate_movies(
+            target_rating, list(user_sim_dict), self.user_ratings)
+        movie_score_dict = self.movie_scores(candidate_movies, user_sim_dict,
+                                             genre_movies)
+        return sort_moviescore_dict(movie_score_dict, num_movies)
+
+    def close(self) -> None:
+        """
+        stop the worker processes
+        """
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self) -> 'ParallelScorer':
+        """
+        return self so the scorer can be used in a with statement
+        """
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """
+        stop the workers at the end of a with statement
+        """
+        self.close()
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
@@ -0,0 +1,160 @@
+"""Title search index for the CSC108 A3 interactive recommender.
+
+TitleIndex lowercases every title once and keeps an inverted index from
+every 1-, 2- and 3-character substring (n-gram) of the lowercased titles to
+the movies containing it, plus the titles in sorted order for prefix
+lookups. A substring query only verifies the movies that share all of its
+trigrams instead of scanning every title. The posting list of an n-gram
+is put in rank order the first time it is searched for, and the
+MAX_RANKED_GRAMS most recently searched ranked lists are kept, so the best
+matches of a repeated short query are just the head of its list.
+"""
+
+import bisect
+import heapq
+from collections import OrderedDict
+from typing import List, Optional, Set
+
+from recommender_constants import MovieDict
+from recommender_constants import MOVIE_DICT_SMALL
+
+GRAM_SIZE = 3
+# ranked posting lists of the most recently searched n-grams that are kept
+MAX_RANKED_GRAMS = 256
+
+
+class TitleIndex:
+    """
+    A case insensitive substring and prefix search index over the titles of
+    a MovieDict
+    >>> index = TitleIndex(MOVIE_DICT_SMALL)
+    >>> index.search('a')
+    [(68735, 'Warcraft'), (293660, 'Deadpool'), (302156, 'Criminal'), \
+(124057, 'Kids of the Round Table')]
+    >>> index.search('ROUND')
+    [(124057, 'Kids of the Round Table')]
+    >>> index.search('a', limit=2)
+    [(68735, 'Warcraft'), (293660, 'Deadpool')]
+    >>> index.search('d', prefix=True)
+    [(293660, 'Deadpool')]
+    >>> index.search('xyz')
+    []
+    """
+
+    def __init__(self, movies: MovieDict) -> None:
+        """
+        build the index over the titles in movies
+        :param movies: MovieDict dictionary
+        """
+        self.titles = {}
+        self.lowered = {}
+        self.grams = {}
+        self._ranked_grams = OrderedDict()
+        for mid, (title, _) in movies.items():
+            lowered = title.lower()
+            self.titles[mid] = title
+            self.lowered[mid] = lowered
+            for size in range(1, GRAM_SIZE + 1):
+                for start in range(len(lowered) - size + 1):
+                    gram = lowered[start:start + size]
+                    self.grams.setdefault(gram, set()).add(mid)
+        self.sorted_titles = sorted((lowered, mid)
+                                    for mid, lowered in self.lowered.items())
+
+    def _rank(self, mid: int, query: str) -> tuple:
+        """
+        return the ranking key of movie mid for query: how early query
+        appears in the title, then shorter title, then smaller movie id
+        """
+        lowered = self.lowered[mid]
+        return lowered.find(query), len(lowered), mid
+
+    def _ranked_gram(self, gram: str) -> List[int]:
+        """
+        return the movies containing the n-gram gram in rank order, keeping
+        the MAX_RANKED_GRAMS most recently used lists
+        """
+        ranked = self._ranked_grams.get(gram)
+        if ranked is not None:
+            self._ranked_grams.move_to_end(gram)
+            return ranked
+        ranked = sorted(self.grams[gram],
+                        key=lambda mid: self._rank(mid, gram))
+        if len(self._ranked_grams) >= MAX_RANKED_GRAMS:
+            self._ranked_grams.popitem(last=False)
+        self._ranked_grams[gram] = ranked
+        return ranked
+
+    def _substring_matches(self, query: str) -> Set[int]:
+        """
+        return the ids of movies whose lowercased title contains query
+        """
+        if query == '':
+            return set(self.titles)
+        if len(query) <= GRAM_SIZE:
+            return set(self.grams.get(query, ()))
+        postings = []
+        for start in range(len(query) - GRAM_SIZE + 1):
+            gram = query[start:start + GRAM_SIZE]
+            if gram not in self.grams:
+                return set()
+            postings.append(self.grams[gram])
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                return candidates
+        return {mid for mid in candidates if query in self.lowered[mid]}
+
+    def _prefix_matches(self, query: str) -> List[int]:
+        """
+        return the ids of movies whose lowercased title starts with query
+        """
+        sorted_titles = self.sorted_titles
+        start = bisect.bisect_left(sorted_titles, (query,))
+        matches = []
+        for pos in range(start, len(sorted_titles)):
+            lowered, mid = sorted_titles[pos]
+            if not lowered.startswith(query):
+                break
+            matches.append(mid)
+        return matches
+
+    def search(self, query: str, limit: Optional[int] = None,
+               prefix: bool = False) -> List[tuple]:
+        """
+        return (movie id, title) for the movies whose title contains query
+        (or starts with it if prefix), ignoring case; without a limit the
+        matches are the same as search_movie's. Results are ranked by how
+        early in the title the query appears, then by shorter title, then
+        by smaller movie id
+        :param query: text to look for
+        :param limit: return at most this many results
+        :param prefix: only match titles starting with query
+        :return: list of (movie id, title)
+        """
+        query = query.lower()
+        if not prefix and query in self.grams:
+            ranked = self._ranked_gram(query)[:limit]
+        else:
+            if prefix:
+                matches = self._prefix_matches(query)
+            else:
+                matches = self._substring_matches(query)
+
+            def rank(mid: int) -> tuple:
+                """ranking key of a matching movie"""
+                return self._rank(mid, query)
+
+            if limit is None:
+                ranked = sorted(matches, key=rank)
+            else:
+                ranked = heapq.nsmallest(limit, matches, key=rank)
+        return [(mid, self.titles[mid]) for mid in ranked]
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
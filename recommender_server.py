@@ -0,0 +1,345 @@
+"""Long-running HTTP/JSON server for the CSC108 A3 recommender.
+
+The server loads the movie and rating files once and then answers requests
+against the in-memory data:
+
+    GET  /ready                   200 once the data is loaded, 503 before
+    GET  /metrics                 request counts and latency percentiles
+    GET  /search?q=star&limit=10  title search
+    POST /recommend               {"ratings": {"745": 5}, "num_movies": 5}
+
+Requests are handled by an asyncio front end. Recommendations are scored in
+a pool of worker processes forked after loading, so they share the loaded
+data copy-on-write and the event loop stays free while they run.
+
+    python recommender_server.py --ratings ratings_small.csv --port 8108
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional
+from urllib.parse import urlsplit, parse_qs
+
+from recommender_bench import percentile
+from recommender_constants import Rating
+from recommender_functions import RatingIndex, recommend_movies
+from recommender_loader import load_movies, load_prepared_ratings
+from recommender_search import TitleIndex
+
+# the loaded data, set before the worker pool is forked
+_MODEL = None
+# latencies kept per route for the percentiles in /metrics
+LATENCY_WINDOW = 1000
+MAX_BODY = 1 << 20
+# metrics of any other path are counted under UNKNOWN_ROUTE
+ROUTES = ('/ready', '/metrics', '/search', '/recommend')
+UNKNOWN_ROUTE = 'other'
+MIN_RATING = 0.5
+MAX_RATING = 5.0
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large',
+           503: 'Service Unavailable'}
+
+
+class Model:
+    """
+    The read-only data the server answers from
+    :ivar movies: MovieDict
+    :ivar ratings: UserRatingDict without unknown movies
+    :ivar movie_users: MovieUserDict of ratings
+    :ivar index: RatingIndex of ratings
+    :ivar titles: TitleIndex of movies
+    """
+
+    def __init__(self, movie_path: str, rating_path: str) -> None:
+        """
+        load and index the movie and rating files
+        :param movie_path: movie file
+        :param rating_path: rating file
+        """
+        self.movies = load_movies(movie_path)
+        self.ratings, self.movie_users = load_prepared_ratings(rating_path,
+                                                               self.movies)
+        self.index = RatingIndex(self.ratings)
+        self.titles = TitleIndex(self.movies)
+
+    def recommend(self, target_rating: Rating,
+                  num_movies: int) -> List[int]:
+        """
+        return recommend_movies for target_rating
+        """
+        return recommend_movies(target_rating, self.ratings,
+                                self.movie_users, num_movies, self.index)
+
+
+def _recommend(target_rating: Rating, num_movies: int) -> List[int]:
+    """
+    return recommendations from the forked copy of the model; run in a
+    worker process
+    """
+    return _MODEL.recommend(target_rating, num_movies)
+
+
+class RecommenderServer:
+    """
+    The request handlers and metrics of the server
+    >>> server = RecommenderServer('movies_tiny.csv', 'ratings_tiny.csv')
+    >>> server.handle('GET', '/ready', b'')
+    (503, {'ready': False})
+    """
+
+    def __init__(self, movie_path: str, rating_path: str,
+                 workers: Optional[int] = None) -> None:
+        """
+        :param movie_path: movie file
+        :param rating_path: rating file
+        :param workers: number of scoring processes, os.cpu_count() if None;
+        0 scores in a thread of this process instead
+        """
+        self.movie_path = movie_path
+        self.rating_path = rating_path
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.workers = workers
+        self.port = None
+        self.model = None
+        self.pool = None
+        self.counts = collections.Counter()
+        self.latencies = collections.defaultdict(
+            lambda: collections.deque(maxlen=LATENCY_WINDOW))
+
+    def load(self) -> None:
+        """
+        load the data and fork the scoring pool; the server is ready after
+        this returns
+        """
+        global _MODEL
+        model = Model(self.movie_path, self.rating_path)
+        _MODEL = model
+        if self.workers:
+            self.pool = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context('fork'))
+        self.model = model
+
+    def close(self) -> None:
+        """
+        stop the scoring pool
+        """
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def handle(self, method: str, target: str, body: bytes) -> tuple:
+        """
+        return (status, payload) for the requests that need no scoring;
+        POST /recommend is answered by recommend
+        >>> server = RecommenderServer('movies_tiny.csv', 'ratings_tiny.csv',
+        ...                            workers=0)
+        >>> server.load()
+        >>> server.handle('GET', '/ready', b'')
+        (200, {'ready': True})
+        >>> server.handle('GET', '/search?q=dead&limit=5', b'')
+        (200, {'results': [{'movie_id': 293660, 'title': 'Deadpool'}]})
+        >>> server.handle('GET', '/nowhere', b'')
+        (404, {'error': 'unknown path /nowhere'})
+        >>> server.handle('GET', '/search?q=dead&limit=0', b'')
+        (400, {'error': 'bad request: limit must be a positive integer'})
+        """
+        url = urlsplit(target)
+        if url.path == '/ready':
+            if self.model is None:
+                return 503, {'ready': False}
+            return 200, {'ready': True}
+        if url.path == '/metrics':
+            return 200, self.metrics()
+        if url.path not in ROUTES:
+            return 404, {'error': 'unknown path ' + url.path}
+        if self.model is None:
+            return 503, {'error': 'loading'}
+        if url.path == '/search':
+            if method != 'GET':
+                return 405, {'error': 'use GET'}
+            query = parse_qs(url.query)
+            try:
+                limit = int(query.get('limit', ['10'])[0])
+            except ValueError:
+                limit = 0
+            if limit < 1:
+                return 400, {'error': 'bad request: limit must be a '
+                                      'positive integer'}
+            results = self.model.titles.search(query.get('q', [''])[0],
+                                               limit=limit)
+            return 200, {'results': [{'movie_id': mid, 'title': title}
+                                     for mid, title in results]}
+        return 405, {'error': 'use POST'}
+
+    def parse_recommend(self, body: bytes) -> tuple:
+        """
+        return (target_rating, num_movies) from a /recommend request body
+        :raise ValueError: if a movie id is not an integer, a rating is not
+        a number from MIN_RATING to MAX_RATING, no movie is rated, or
+        num_movies is not a positive integer
+        >>> server = RecommenderServer('movies_tiny.csv', 'ratings_tiny.csv')
+        >>> server.parse_recommend(b'{"ratings": {"745": 5}, "num_movies": 3}')
+        ({745: 5.0}, 3)
+        >>> server.parse_recommend(b'{"ratings": {"745": 0}}')
+        Traceback (most recent call last):
+        ...
+        ValueError: ratings must be from 0.5 to 5.0
+        """
+        request = json.loads(body)
+        target_rating = {}
+        for movie, rating in request['ratings'].items():
+            if isinstance(rating, bool) or \
+                    not isinstance(rating, (int, float)) or \
+                    not MIN_RATING <= rating <= MAX_RATING:
+                raise ValueError('ratings must be from %s to %s'
+                                 % (MIN_RATING, MAX_RATING))
+            target_rating[int(movie)] = float(rating)
+        if not target_rating:
+            raise ValueError('rate at least one movie')
+        num_movies = request.get('num_movies', 5)
+        if isinstance(num_movies, bool) or not isinstance(num_movies, int) \
+                or num_movies < 1:
+            raise ValueError('num_movies must be a positive integer')
+        return target_rating, num_movies
+
+    async def recommend(self, body: bytes) -> tuple:
+        """
+        return (status, payload) of a /recommend request, scored in the
+        worker pool
+        """
+        if self.model is None:
+            return 503, {'error': 'loading'}
+        try:
+            target_rating, num_movies = self.parse_recommend(body)
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            return 400, {'error': 'bad request: %s' % error}
+        loop = asyncio.get_running_loop()
+        if self.pool is None:
+            results = await loop.run_in_executor(
+                None, self.model.recommend, target_rating, num_movies)
+        else:
+            results = await loop.run_in_executor(
+                self.pool, _recommend, target_rating, num_movies)
+        movies = self.model.movies
+        return 200, {'recommendations': [{'movie_id': mid,
+                                          'title': movies[mid][0]}
+                                         for mid in results]}
+
+    def metrics(self) -> Dict[str, Dict]:
+        """
+        return the request count and latency percentiles of each route
+        """
+        report = {}
+        for route, count in self.counts.items():
+            latencies = list(self.latencies[route])
+            report[route] = {'requests': count,
+                             'p50_ms': percentile(latencies, 50) * 1000,
+                             'p90_ms': percentile(latencies, 90) * 1000,
+                             'p99_ms': percentile(latencies, 99) * 1000}
+        return report
+
+    async def serve_connection(self, reader: asyncio.StreamReader,
+                               writer: asyncio.StreamWriter) -> None:
+        """
+        answer the HTTP/1.1 requests of one connection
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                start = time.perf_counter()
+                parts = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = headers.get('content-length', '0')
+                # without a request line or a length the rest of the stream
+                # cannot be framed, so answer 400 and close
+                framed = len(parts) == 3 and length.isdecimal()
+                target = parts[1] if len(parts) > 1 else ''
+                if not framed:
+                    status, payload = 400, {'error': 'malformed request'}
+                elif int(length) > MAX_BODY:
+                    status, payload = 413, {'error': 'body too large'}
+                else:
+                    body = await reader.readexactly(int(length))
+                    route = urlsplit(target).path
+                    if route == '/recommend' and parts[0] == 'POST':
+                        status, payload = await self.recommend(body)
+                    else:
+                        status, payload = self.handle(parts[0], target, body)
+                data = json.dumps(payload).encode('utf-8')
+                keep_alive = framed and status != 413 and \
+                    headers.get('connection', '').lower() != 'close'
+                writer.write(('HTTP/1.1 %d %s\r\nContent-Type: '
+                              'application/json\r\nContent-Length: %d\r\n'
+                              'Connection: %s\r\n\r\n' % (
+                                  status, REASONS[status], len(data),
+                                  'keep-alive' if keep_alive else 'close')
+                              ).encode('latin-1') + data)
+                await writer.drain()
+                route = urlsplit(target).path
+                if route not in ROUTES:
+                    route = UNKNOWN_ROUTE
+                self.counts[route] += 1
+                self.latencies[route].append(time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        except (ValueError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int,
+                    started: Optional[asyncio.Event] = None) -> None:
+        """
+        listen on host:port, load the data in the background, and serve
+        until cancelled
+        :param started: set once the server is listening
+        """
+        server = await asyncio.start_server(self.serve_connection, host, port)
+        self.port = server.sockets[0].getsockname()[1]
+        if started is not None:
+            started.set()
+        loop = asyncio.get_running_loop()
+        async with server:
+            await loop.run_in_executor(None, self.load)
+            try:
+                await server.serve_forever()
+            finally:
+                self.close()
+
+
+def main() -> None:
+    """
+    parse the command line and run the server
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--movies', default='movies.csv')
+    parser.add_argument('--ratings', default='ratings_small.csv')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8108)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='scoring processes, 0 to score in a thread')
+    args = parser.parse_args()
+    server = RecommenderServer(args.movies, args.ratings, args.workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
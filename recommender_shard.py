@@ -0,0 +1,466 @@
+"""Hash-sharded ratings with scatter-gather recommendations.
+
+ShardedRecommender splits the users into N shards by user id modulo N and
+runs each shard in its own worker process, which loads and keeps only its
+users' ratings, movie to users lists and RatingIndex. Everything
+recommend_movies needs about a user is local to the user's shard except
+the popularity of each movie, so the shards' popularity counts are summed
+once at start up and sent back to every shard. A query is sent to every
+shard; each finds its similar users and returns each user's similarity
+and contributions to the movie scores, and the coordinator adds the
+contributions of all shards' users in ascending user order, the order
+recommend_movies adds them in, so the scores and the top movies are the
+same to the last bit. A genre filter
+is sent to the shards once and then referred to by a slot number, and
+recommend_batch sends its queries from a separate thread, so the
+coordinator keeps reading replies while it sends and neither side of a
+pipe can fill up waiting for the other. A recommender answers one caller
+at a time: recommend_movies and recommend_batch raise RuntimeError while a
+recommend_batch generator is still open.
+
+min_similarity is applied by each shard to its own users. top_m depends on
+the similarities in every shard, so each shard returns only its own top_m
+users and the coordinator keeps the top_m over all shards.
+
+    python recommender_shard.py --ratings ratings_small.csv --shards 1 2 4
+
+prints the query throughput of each shard count.
+"""
+
+import argparse
+import multiprocessing
+import queue
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.connection import Connection
+from typing import (AbstractSet, Iterable, Iterator, List, Dict, Optional,
+                    Tuple)
+
+from recommender_constants import Rating, UserRatingDict
+from recommender_constants import USER_RATING_DICT_SMALL
+from recommender_functions import (RatingIndex, movies_to_users,
+                                   get_similar_users, prune_similar_users,
+                                   add_user_scores,
+                                   sort_moviescore_dict)
+from recommender_loader import load_movies, open_rating_columns
+
+# queries in flight per shard in recommend_batch
+WINDOW = 8
+# genre filters each shard keeps, by slot number
+MAX_GENRE_SETS = 8
+
+
+def shard_of(user_id: int, shards: int) -> int:
+    """
+    return the shard holding user_id
+    >>> shard_of(7, 3)
+    1
+    """
+    return user_id % shards
+
+
+def _load_shard(shard: int, shards: int, movie_path: str,
+                rating_path: str) -> UserRatingDict:
+    """
+    return the ratings of the users of shard in rating_path, without the
+    ratings of movies not in movie_path, in read_ratings order; the
+    memory-mapped columns are read row by row so only the shard's ratings
+    are held
+    """
+    movies = load_movies(movie_path)
+    user_ratings = {}
+    with open_rating_columns(rating_path) as columns:
+        for user_id, movie_id, rating in zip(columns.users, columns.movies,
+                                             columns.ratings):
+            if shard_of(user_id, shards) != shard or movie_id not in movies:
+                continue
+            if user_id in user_ratings:
+                user_ratings[user_id][movie_id] = rating
+            else:
+                user_ratings[user_id] = {movie_id: rating}
+    return user_ratings
+
+
+def _user_scores(target_rating: Rating, user_sim_dict: Dict[int, float],
+                 index: RatingIndex,
+                 genre_movies: Optional[AbstractSet[int]]
+                 ) -> Dict[int, Tuple[float, Dict[int, float]]]:
+    """
+    return each user of user_sim_dict mapped to their similarity and their
+    own contributions to the movie scores of score_similar_users, which
+    add up to those scores when added in ascending user order
+    """
+    user_scores = {}
+    for user, user_sim_score in user_sim_dict.items():
+        user_movies = [movie for movie in index.high_movies[user]
+                       if movie not in target_rating]
+        num_user_movie = len(user_movies)
+        if genre_movies is not None:
+            user_movies = [movie for movie in user_movies
+                           if movie in genre_movies]
+        movie_score_dict = {}
+        add_user_scores(movie_score_dict, user_sim_score, user_movies,
+                        num_user_movie, index.popularity)
+        user_scores[user] = (user_sim_score, movie_score_dict)
+    return user_scores
+
+
+def _serve_shard(conn: Connection, shard: int,
+                 shards: int, user_ratings: Optional[UserRatingDict],
+                 movie_path: Optional[str],
+                 rating_path: Optional[str]) -> None:
+    """
+    hold one shard and answer the coordinator's requests on conn until it
+    sends None; run in a worker process. ('genres', slot, movies) stores a
+    genre filter without a reply, and ('query', target_rating, slot,
+    min_similarity, top_m) is answered with _user_scores of the shard's
+    similar users
+    :param user_ratings: the shard's ratings, loaded from the files if None
+    """
+    try:
+        if user_ratings is None:
+            user_ratings = _load_shard(shard, shards, movie_path, rating_path)
+        movie_users = movies_to_users(user_ratings)
+        index = RatingIndex(user_ratings)
+        conn.send(('ok', index.popularity))
+        # scores divide by the popularity over all shards
+        index.popularity = conn.recv()
+    except Exception as error:
+        conn.send(('error', repr(error)))
+        return
+    genre_sets = {}
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        if request[0] == 'genres':
+            genre_sets[request[1]] = request[2]
+            continue
+        _, target_rating, slot, min_similarity, top_m = request
+        try:
+            genre_movies = None if slot is None else genre_sets[slot]
+            user_sim_dict = get_similar_users(target_rating, user_ratings,
+                                              movie_users, index,
+                                              min_similarity, top_m)
+            conn.send(('ok', _user_scores(target_rating, user_sim_dict,
+                                          index, genre_movies)))
+        except Exception as error:
+            conn.send(('error', repr(error)))
+
+
+class ShardedRecommender:
+    """
+    recommend_movies over ratings split across worker processes by user
+    >>> with ShardedRecommender(2, USER_RATING_DICT_SMALL) as sharded:
+    ...     sharded.recommend_movies({68735: 4.5}, 2)
+    [302156, 293660]
+    """
+
+    def __init__(self, shards: int,
+                 user_ratings: Optional[UserRatingDict] = None,
+                 movie_path: Optional[str] = None,
+                 rating_path: Optional[str] = None) -> None:
+        """
+        start one worker per shard; each loads its users from movie_path
+        and rating_path, or takes them from user_ratings when given
+        :param shards: number of shards
+        :param user_ratings: ratings already passed through
+        remove_unknown_movies, split by shard and handed to the workers when
+        they fork; as every worker forks from this process, whose memory
+        holds all of user_ratings, this is meant for tests and small data,
+        and large data should be loaded from the files
+        :param movie_path: movie file, used without user_ratings
+        :param rating_path: rating file, used without user_ratings
+        :raise RuntimeError: if a shard fails to load
+        """
+        if user_ratings is None and not (movie_path and rating_path):
+            raise ValueError('give user_ratings or movie_path and rating_path')
+        if user_ratings is None:
+            # build the binary caches once here rather than in every shard
+            load_movies(movie_path)
+            open_rating_columns(rating_path).close()
+            parts = [None] * shards
+        else:
+            parts = [{} for _ in range(shards)]
+            for user, ratings in user_ratings.items():
+                parts[shard_of(user, shards)][user] = ratings
+        context = multiprocessing.get_context('fork')
+        self.shards = shards
+        self._conns = []
+        self._workers = []
+        # genre filter -> slot number the shards keep it under
+        self._genre_slots = OrderedDict()
+        # set while a recommend_batch generator has queries on the pipes
+        self._busy = False
+        for shard in range(shards):
+            conn, worker_conn = context.Pipe()
+            worker = context.Process(
+                target=_serve_shard,
+                args=(worker_conn, shard, shards, parts[shard], movie_path,
+                      rating_path), daemon=True)
+            worker.start()
+            worker_conn.close()
+            self._conns.append(conn)
+            self._workers.append(worker)
+        parts = None
+        popularity = {}
+        try:
+            for counts in self._gather_all():
+                for movie, count in counts.items():
+                    popularity[movie] = popularity.get(movie, 0) + count
+        except RuntimeError:
+            self.close()
+            raise
+        for conn in self._conns:
+            conn.send(popularity)
+
+    def _gather(self, conn: Connection) -> object:
+        """
+        return the next reply on conn
+        :raise RuntimeError: if the shard reported an error
+        """
+        try:
+            status, value = conn.recv()
+        except (EOFError, OSError) as error:
+            # the worker exited, e.g. killed while loading its shard
+            raise RuntimeError('shard failed: ' + repr(error))
+        if status != 'ok':
+            raise RuntimeError('shard failed: ' + value)
+        return value
+
+    def _gather_all(self) -> List[object]:
+        """
+        return the next reply of every shard, in shard order; every shard's
+        reply is read even if one reports an error
+        :raise RuntimeError: if a shard reported an error
+        """
+        replies = []
+        error = None
+        for conn in self._conns:
+            try:
+                replies.append(self._gather(conn))
+            except RuntimeError as shard_error:
+                error = shard_error
+        if error is not None:
+            raise error
+        return replies
+
+    def _check_idle(self) -> None:
+        """
+        :raise RuntimeError: if a recommend_batch generator is still open,
+        as its replies would be read by the wrong caller
+        """
+        if self._busy:
+            raise RuntimeError('a recommend_batch generator is still open; '
+                               'finish or close it first')
+
+    def _genre_slot(self, genre_movies: Optional[AbstractSet[int]]
+                    ) -> Optional[int]:
+        """
+        return the slot the shards keep genre_movies under, sending it to
+        them first if they do not have it; None without a filter
+        """
+        if genre_movies is None:
+            return None
+        genre_movies = frozenset(genre_movies)
+        slot = self._genre_slots.get(genre_movies)
+        if slot is not None:
+            self._genre_slots.move_to_end(genre_movies)
+            return slot
+        if len(self._genre_slots) < MAX_GENRE_SETS:
+            slot = len(self._genre_slots)
+        else:
+            # reuse the slot of the least recently used filter
+            slot = self._genre_slots.popitem(last=False)[1]
+        for conn in self._conns:
+            conn.send(('genres', slot, genre_movies))
+        self._genre_slots[genre_movies] = slot
+        return slot
+
+    def _scatter(self, target_rating: Rating, slot: Optional[int],
+                 min_similarity: float, top_m: Optional[int]) -> None:
+        """
+        send a query to every shard
+        :raise RuntimeError: if a shard worker has exited
+        """
+        for conn in self._conns:
+            try:
+                conn.send(('query', target_rating, slot, min_similarity,
+                           top_m))
+            except OSError as error:
+                raise RuntimeError('shard failed: ' + repr(error))
+
+    def _merge(self, partials: List[Dict], num_movies: int,
+               top_m: Optional[int]) -> List[int]:
+        """
+        return the top num_movies of the shards' _user_scores, adding the
+        users' contributions in ascending user order; with top_m, only the
+        top_m users over all shards are added
+        """
+        user_scores = {}
+        for partial in partials:
+            user_scores.update(partial)
+        users = sorted(user_scores)
+        if top_m is not None:
+            users = list(prune_similar_users(
+                {user: user_scores[user][0] for user in users}, top_m=top_m))
+        movie_score_dict = {}
+        for user in users:
+            for movie, score in user_scores[user][1].items():
+                movie_score_dict[movie] = movie_score_dict.get(movie, 0) + score
+        return sort_moviescore_dict(movie_score_dict, num_movies)
+
+    def recommend_movies(self, target_rating: Rating, num_movies: int,
+                         genre_movies: Optional[AbstractSet[int]] = None,
+                         min_similarity: float = 0.0,
+                         top_m: Optional[int] = None) -> List[int]:
+        """
+        return recommend_movies for target_rating, scored by every shard
+        :param target_rating: dictionary of movie_ids to rating
+        :param num_movies: number of movies to recommend
+        :param genre_movies: only recommend these movies, if given
+        :param min_similarity: prune as in get_similar_users
+        :param top_m: prune as in get_similar_users
+        :return: list of recommended movie ids
+        :raise RuntimeError: if a recommend_batch generator is still open
+        """
+        self._check_idle()
+        self._scatter(target_rating, self._genre_slot(genre_movies),
+                      min_similarity, top_m)
+        return self._merge(self._gather_all(), num_movies, top_m)
+
+    def recommend_batch(self, targets: Iterable[Rating], num_movies: int,
+                        genre_movies: Optional[AbstractSet[int]] = None,
+                        min_similarity: float = 0.0,
+                        top_m: Optional[int] = None
+                        ) -> Iterator[List[int]]:
+        """
+        yield recommend_movies for each of targets, keeping up to WINDOW
+        queries in flight so the shards do not wait for the coordinator;
+        the queries are sent from a thread while this one reads the
+        replies. The recommender is busy until the generator finishes or is
+        closed
+        :raise RuntimeError: if another recommend_batch generator is open
+        >>> with ShardedRecommender(2, USER_RATING_DICT_SMALL) as sharded:
+        ...     list(sharded.recommend_batch([{68735: 4.5}, {302156: 4.5}], 2))
+        [[302156, 293660], [68735]]
+        """
+        self._check_idle()
+        self._busy = True
+        window = threading.Semaphore(WINDOW)
+        stop = threading.Event()
+        # True for each query sent, then None at the end or the exception
+        # that stopped the sender
+        sent = queue.Queue()
+
+        def scatter_all() -> None:
+            """
+            send the queries, at most WINDOW ahead of the replies read
+            """
+            try:
+                slot = self._genre_slot(genre_movies)
+                for target_rating in targets:
+                    window.acquire()
+                    if stop.is_set():
+                        break
+                    self._scatter(target_rating, slot, min_similarity,
+                                  top_m)
+                    sent.put(True)
+            except BaseException as error:
+                sent.put(error)
+                return
+            sent.put(None)
+
+        sender = threading.Thread(target=scatter_all, daemon=True)
+        sender.start()
+        try:
+            while True:
+                item = sent.get()
+                if item is None:
+                    break
+                if item is not True:
+                    raise item
+                try:
+                    results = self._merge(self._gather_all(), num_movies,
+                                          top_m)
+                finally:
+                    window.release()
+                yield results
+        finally:
+            stop.set()
+            window.release()
+            sender.join()
+            # read the replies of queries sent but not yet gathered
+            while not sent.empty():
+                if sent.get_nowait() is True:
+                    try:
+                        self._gather_all()
+                    except RuntimeError:
+                        pass
+            self._busy = False
+
+    def close(self) -> None:
+        """
+        stop the shard workers
+        """
+        for conn in self._conns:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            conn.close()
+        for worker in self._workers:
+            worker.join()
+
+    def __enter__(self) -> 'ShardedRecommender':
+        """
+        return self so the recommender can be used in a with statement
+        """
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """
+        stop the workers at the end of a with statement
+        """
+        self.close()
+
+
+def main() -> None:
+    """
+    time sharded recommendations for each shard count
+    """
+    from recommender_bench import sample_targets
+    from recommender_functions import recommend_movies
+    from recommender_loader import load_prepared_ratings
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--movies', default='movies.csv')
+    parser.add_argument('--ratings', default='ratings_small.csv')
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--queries', type=int, default=500)
+    args = parser.parse_args()
+
+    user_ratings, movie_users = load_prepared_ratings(
+        args.ratings, load_movies(args.movies))
+    index = RatingIndex(user_ratings)
+    targets = sample_targets(user_ratings, args.queries)
+    start = time.perf_counter()
+    expected = [recommend_movies(target, user_ratings, movie_users, 5, index)
+                for target in targets]
+    elapsed = time.perf_counter() - start
+    print('%8s %12s %10s' % ('shards', 'queries/s', 'same'))
+    print('%8s %12.1f %10s' % ('serial', len(targets) / elapsed, True))
+    del user_ratings, movie_users, index
+    for shards in args.shards:
+        with ShardedRecommender(shards, movie_path=args.movies,
+                                rating_path=args.ratings) as sharded:
+            start = time.perf_counter()
+            results = list(sharded.recommend_batch(targets, 5))
+            elapsed = time.perf_counter() - start
+        print('%8d %12.1f %10s' % (shards, len(targets) / elapsed,
+                                   results == expected))
+
+
+if __name__ == '__main__':
+    main()
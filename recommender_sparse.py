@@ -0,0 +1,420 @@
+"""Sparse-matrix recommendation engine for the CSC108 A3 recommender.
+
+The ratings are stored as a compressed sparse row (CSR) matrix of users by
+movies, with its transpose (CSC) for column lookups. User and movie ids are
+remapped to dense row / column numbers so the matrix can be kept in flat
+arrays instead of nested dicts.
+
+The standard library has no vectorized kernels, so the products are still
+Python loops over the arrays; the engine is faster than recommend_movies
+because it scores into a dense column vector instead of a dict and shares
+the unpacked columns across a batch, not by orders of magnitude.
+
+    python recommender_sparse.py --ratings ratings_small.csv
+
+prints the milliseconds per query of recommend_movies and the engine.
+"""
+
+import argparse
+import itertools
+import time
+from array import array
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
+
+from recommender_constants import Rating, UserRatingDict
+from recommender_constants import USER_RATING_DICT_SMALL
+from recommender_functions import (CUT_OFF_RATING, rating_norm,
+                                   sort_moviescore_dict)
+
+# targets whose similarity matrix is built and scored at a time in
+# recommend_batch
+BLOCK_SIZE = 64
+
+
+class RatingMatrix:
+    """
+    A UserRatingDict stored as CSR (rows are users) and CSC (columns are
+    movies) arrays, plus the per-user and per-movie values scoring needs
+    :ivar user_ids: row number -> user id, in ascending user id order
+    :ivar movie_ids: column number -> movie id, in ascending movie id order
+    :ivar user_rows: {user_id: row number}
+    :ivar movie_cols: {movie_id: column number}
+    :ivar indptr, indices, data: CSR arrays of the rating matrix, each row
+    in the order of the user's ratings in user_ratings
+    :ivar col_indptr, col_indices, col_data: CSC arrays of the rating matrix
+    :ivar high_indptr, high_indices: CSR arrays of ratings >= CUT_OFF_RATING
+    :ivar norms: row number -> sum of the user's squared ratings
+    :ivar popularity: column number -> number of users who rated the movie
+    >>> matrix = RatingMatrix(USER_RATING_DICT_SMALL)
+    >>> matrix.user_ids
+    [1, 2]
+    >>> matrix.movie_ids
+    [68735, 124057, 293660, 302156]
+    >>> list(matrix.indptr), list(matrix.indices), list(matrix.data)
+    ([0, 2, 5], [0, 3, 0, 1, 2], [3.5, 4.0, 1.0, 1.5, 4.5])
+    >>> list(matrix.col_indptr), list(matrix.col_indices)
+    ([0, 2, 3, 4, 5], [0, 1, 1, 1, 0])
+    >>> list(matrix.high_indices)
+    [0, 3, 2]
+    >>> list(matrix.popularity)
+    [2, 1, 1, 1]
+    """
+
+    def __init__(self, user_ratings: UserRatingDict) -> None:
+        """
+        build the CSR / CSC arrays from user_ratings
+        :param user_ratings: UserRatingDict dictionary
+        """
+        self.user_ids = sorted(user_ratings)
+        movie_set = set()
+        for ratings in user_ratings.values():
+            movie_set.update(ratings)
+        self.movie_ids = sorted(movie_set)
+        self.user_rows = {user: row for row, user in enumerate(self.user_ids)}
+        self.movie_cols = {movie: col
+                           for col, movie in enumerate(self.movie_ids)}
+
+        self.indptr = array('l', [0])
+        self.indices = array('l')
+        self.data = array('d')
+        self.high_indptr = array('l', [0])
+        self.high_indices = array('l')
+        self.norms = array('d')
+        self.popularity = array('l', [0] * len(self.movie_ids))
+        for user in self.user_ids:
+            ratings = user_ratings[user]
+            # same summation order as get_similarity so norms match exactly
+            norm = 0.0
+            for rating in ratings.values():
+                norm = norm + rating ** 2
+            self.norms.append(norm)
+            # the user's rating order, which get_similarities sums in
+            for movie, rating in ratings.items():
+                col = self.movie_cols[movie]
+                self.indices.append(col)
+                self.data.append(rating)
+                self.popularity[col] += 1
+                if rating >= CUT_OFF_RATING:
+                    self.high_indices.append(col)
+            self.indptr.append(len(self.indices))
+            self.high_indptr.append(len(self.high_indices))
+        self._build_columns()
+
+    def _build_columns(self) -> None:
+        """
+        build the CSC transpose of the CSR arrays, rows ascending per column
+        """
+        self.col_indptr = array('l', [0] * (len(self.movie_ids) + 1))
+        for col in self.indices:
+            self.col_indptr[col + 1] += 1
+        for col in range(len(self.movie_ids)):
+            self.col_indptr[col + 1] += self.col_indptr[col]
+        nnz = len(self.indices)
+        self.col_indices = array('l', [0] * nnz)
+        self.col_data = array('d', [0.0] * nnz)
+        fill = array('l', self.col_indptr[:-1])
+        for row in range(len(self.user_ids)):
+            for pos in range(self.indptr[row], self.indptr[row + 1]):
+                col = self.indices[pos]
+                self.col_indices[fill[col]] = row
+                self.col_data[fill[col]] = self.data[pos]
+                fill[col] += 1
+
+
+class SparseRecommender:
+    """
+    Recommendation engine over a RatingMatrix, returning the same results
+    as recommend_movies with sparse matrix-vector products
+    >>> engine = SparseRecommender(USER_RATING_DICT_SMALL)
+    >>> engine.recommend_movies({302156: 4.5}, 2)
+    [68735]
+    >>> engine.recommend_movies({68735: 4.5}, 2)
+    [302156, 293660]
+    """
+
+    def __init__(self, user_ratings: UserRatingDict) -> None:
+        """
+        build the rating matrix for user_ratings
+        :param user_ratings: UserRatingDict dictionary
+        """
+        self.matrix = RatingMatrix(user_ratings)
+        # list indexing is faster than array indexing in the scoring loop
+        self._popularity = self.matrix.popularity.tolist()
+
+    def target_vector(self, target_rating: Rating) -> List[tuple]:
+        """
+        return the target ratings as a sparse vector of (column, rating)
+        pairs in target_rating order, skipping movies nobody rated
+        :param target_rating: dictionary of movie_ids to rating
+        :return: list of (column, rating)
+        >>> engine = SparseRecommender(USER_RATING_DICT_SMALL)
+        >>> engine.target_vector({293660: 4.5, 10: 3.0})
+        [(2, 4.5)]
+        """
+        movie_cols = self.matrix.movie_cols
+        return [(movie_cols[movie], rating)
+                for movie, rating in target_rating.items()
+                if movie in movie_cols]
+
+    def similar_rows(self, target_rating: Rating,
+                     columns: Optional[Dict[int, List[tuple]]] = None
+                     ) -> Dict[int, float]:
+        """
+        return {row: similarity} for every user who rated at least one
+        movie in target_rating, in ascending row order. The shared products
+        are A . t, accumulated column by column in target order; like
+        get_similarities, a user with fewer ratings than the target is
+        summed over their own row instead, in their rating order, so the
+        similarities are the same to the last bit
+        :param target_rating: dictionary of movie_ids to rating
+        :param columns: {column: [(row, rating)]} cache to share across
+        calls, filled in as columns are read
+        :return: dictionary of row number to similarity score
+        """
+        matrix = self.matrix
+        if columns is None:
+            columns = {}
+        target_vector = self.target_vector(target_rating)
+        shared = {}
+        for col, rating in target_vector:
+            if col not in columns:
+                start = matrix.col_indptr[col]
+                end = matrix.col_indptr[col + 1]
+                columns[col] = list(zip(matrix.col_indices[start:end],
+                                        matrix.col_data[start:end]))
+            for row, value in columns[col]:
+                shared[row] = shared.get(row, 0.0) + rating * value
+        target_norm = rating_norm(target_rating)
+        target_len = len(target_rating)
+        target_cols = dict(target_vector)
+        indptr, indices, data = matrix.indptr, matrix.indices, matrix.data
+        row_sim = {}
+        for row in sorted(shared):
+            start = indptr[row]
+            end = indptr[row + 1]
+            products = shared[row]
+            if end - start < target_len:
+                products = 0.0
+                for pos in range(start, end):
+                    rating = target_cols.get(indices[pos])
+                    if rating is not None:
+                        products += data[pos] * rating
+            row_sim[row] = (products * products) / \
+                (target_norm * matrix.norms[row])
+        return row_sim
+
+    def similar_users(self, target_rating: Rating) -> Dict[int, float]:
+        """
+        return the same dictionary as get_similar_users
+        :param target_rating: dictionary of movie_ids to rating
+        :return: dictionary of user id to similarity score
+        >>> engine = SparseRecommender(USER_RATING_DICT_SMALL)
+        >>> sim = engine.similar_users({293660: 4.5})
+        >>> len(sim)
+        1
+        >>> round(sim[2], 2)
+        0.86
+        """
+        user_ids = self.matrix.user_ids
+        return {user_ids[row]: sim
+                for row, sim in self.similar_rows(target_rating).items()}
+
+    def movie_scores(self, target_rating: Rating,
+                     row_sim: Dict[int, float],
+                     high_rows: Optional[Dict[int, List[int]]] = None
+                     ) -> Dict[int, float]:
+        """
+        return the same dictionary as get_movie_score_dict for the candidate
+        movies of target_rating, scored with H^T . w where H is the high
+        rating matrix and w the neighbour similarities
+        :param target_rating: dictionary of movie_ids to rating
+        :param row_sim: {row: similarity} from similar_rows
+        :param high_rows: {row: high rating columns} cache to share across
+        calls, filled in as rows are read
+        :return: dictionary of movie id to score
+        >>> engine = SparseRecommender(USER_RATING_DICT_SMALL)
+        >>> rows = engine.similar_rows({68735: 4.5})
+        >>> engine.movie_scores({68735: 4.5}, rows) == \\
+        ...     {302156: rows[0], 293660: rows[1]}
+        True
+        """
+        matrix = self.matrix
+        if high_rows is None:
+            high_rows = {}
+        popularity = self._popularity
+        target_cols = {col for col, _ in self.target_vector(target_rating)}
+        # H^T . w as a dense column vector; each term is the add_user_scores
+        # formula, added in ascending row order as get_movie_score_dict does
+        col_score = [0.0] * len(matrix.movie_ids)
+        for row, sim in row_sim.items():
+            if row not in high_rows:
+                start = matrix.high_indptr[row]
+                end = matrix.high_indptr[row + 1]
+                high_rows[row] = matrix.high_indices[start:end].tolist()
+            cols = [col for col in high_rows[row] if col not in target_cols]
+            num_user_movie = len(cols)
+            for col in cols:
+                col_score[col] += sim / (num_user_movie * popularity[col])
+        movie_ids = matrix.movie_ids
+        # every neighbour similarity is positive, so only scored movies are
+        # non-zero
+        return {movie_ids[col]: score for col, score in enumerate(col_score)
+                if score}
+
+    def recommend_movies(self, target_rating: Rating,
+                         num_movies: int) -> List[int]:
+        """
+        return the same list as recommend_movies for target_rating
+        :param target_rating: dictionary of movie_ids to rating
+        :param num_movies: number of movies to recommend
+        :return: list of recommended movie ids
+        """
+        row_sim = self.similar_rows(target_rating)
+        movie_score_dict = self.movie_scores(target_rating, row_sim)
+        return sort_moviescore_dict(movie_score_dict, num_movies)
+
+    def similarity_matrix(self, targets: List[Rating]) -> Tuple[array, array,
+                                                               array]:
+        """
+        return the targets-by-users similarity matrix S as CSR arrays
+        (indptr, indices, data), with one row per target in targets order
+        and the neighbour rows ascending within each target row
+        :param targets: list of target ratings
+        :return: CSR arrays of S
+        >>> engine = SparseRecommender(USER_RATING_DICT_SMALL)
+        >>> indptr, indices, data = engine.similarity_matrix(
+        ...     [{293660: 4.5}, {68735: 4.5}])
+        >>> list(indptr), list(indices)
+        ([0, 1, 3], [1, 0, 1])
+        >>> list(data) == list(engine.similar_rows({293660: 4.5}).values()) + \\
+        ...     list(engine.similar_rows({68735: 4.5}).values())
+        True
+        """
+        # every column any target rated is unpacked once for all targets
+        columns = {}
+        indptr = array('l', [0])
+        indices = array('l')
+        data = array('d')
+        for target in targets:
+            row_sim = self.similar_rows(target, columns)
+            indices.extend(row_sim)
+            data.extend(row_sim.values())
+            indptr.append(len(indices))
+        return indptr, indices, data
+
+    def recommend_batch(self, targets: Iterable[Rating], num_movies: int,
+                        block_size: int = BLOCK_SIZE) -> Iterator[List[int]]:
+        """
+        yield the recommend_movies result for each target in targets order,
+        block_size targets at a time: each block shares one similarity
+        matrix, and its results are yielded before the next block is read,
+        so only one block's matrix and unpacked rows are held at a time
+        :param targets: iterable of target ratings
+        :param num_movies: number of movies to recommend per target
+        :param block_size: targets scored together
+        :return: iterator of recommended movie id lists
+        >>> engine = SparseRecommender(USER_RATING_DICT_SMALL)
+        >>> list(engine.recommend_batch([{302156: 4.5}, {68735: 4.5}], 2,
+        ...                             block_size=1))
+        [[68735], [302156, 293660]]
+        """
+        targets = iter(targets)
+        while True:
+            block = list(itertools.islice(targets, block_size))
+            if not block:
+                return
+            indptr, indices, data = self.similarity_matrix(block)
+            high_rows = {}
+            for target_num, target in enumerate(block):
+                start = indptr[target_num]
+                end = indptr[target_num + 1]
+                row_sim = dict(zip(indices[start:end], data[start:end]))
+                movie_score_dict = self.movie_scores(target, row_sim,
+                                                     high_rows)
+                yield sort_moviescore_dict(movie_score_dict, num_movies)
+
+
+def recommend_movies_batch(targets: Dict[int, Rating],
+                           user_ratings: UserRatingDict,
+                           num_movies: int,
+                           engine: Optional[SparseRecommender] = None,
+                           block_size: int = BLOCK_SIZE
+                           ) -> Iterator[Tuple[int, List[int]]]:
+    """
+    yield (target id, recommendations) for every target in targets, a
+    block of block_size targets at a time; each list equals the
+    recommend_movies result for the target alone
+    :param targets: dictionary of target id to target ratings, e.g. every
+    user in user_ratings for nightly recommendations
+    :param user_ratings: UserRatingDict dictionary
+    :param num_movies: number of movies to recommend per target
+    :param engine: prebuilt SparseRecommender of user_ratings, built here
+    if None
+    :param block_size: targets scored together
+    :return: iterator of (target id, list of movie ids)
+    >>> targets = {7: {302156: 4.5}, 8: {68735: 4.5}}
+    >>> for target_id, movies in recommend_movies_batch(
+    ...         targets, USER_RATING_DICT_SMALL, 2):
+    ...     print(target_id, movies)
+    7 [68735]
+    8 [302156, 293660]
+    """
+    if engine is None:
+        engine = SparseRecommender(user_ratings)
+    results = engine.recommend_batch(targets.values(), num_movies,
+                                     block_size)
+    for target_id, movies in zip(targets, results):
+        yield target_id, movies
+
+
+def main() -> None:
+    """
+    time recommend_movies, SparseRecommender.recommend_movies and
+    recommend_batch on sampled targets and on whole user histories
+    """
+    from recommender_bench import sample_targets
+    from recommender_functions import RatingIndex, recommend_movies
+    from recommender_loader import load_movies, load_prepared_ratings
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--movies', default='movies.csv')
+    parser.add_argument('--ratings', default='ratings_small.csv')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    user_ratings, movie_users = load_prepared_ratings(
+        args.ratings, load_movies(args.movies))
+    index = RatingIndex(user_ratings)
+    engine = SparseRecommender(user_ratings)
+    histories = [user_ratings[user]
+                 for user in sorted(user_ratings)[:args.queries]]
+    print('%10s %18s %12s %12s %6s' % ('targets', 'engine', 'ms/query',
+                                       'speed-up', 'same'))
+    for name, targets in (('sampled', sample_targets(user_ratings,
+                                                     args.queries)),
+                          ('histories', histories)):
+        runs = [
+            ('recommend_movies', lambda: [
+                recommend_movies(target, user_ratings, movie_users, 5, index)
+                for target in targets]),
+            ('sparse', lambda: [engine.recommend_movies(target, 5)
+                                for target in targets]),
+            ('sparse batch', lambda: list(engine.recommend_batch(targets,
+                                                                 5)))]
+        baseline = expected = None
+        for engine_name, run in runs:
+            best = float('inf')
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                results = run()
+                best = min(best, time.perf_counter() - start)
+            if expected is None:
+                baseline, expected = best, results
+            print('%10s %18s %12.3f %12.2f %6s' % (
+                name, engine_name, best * 1000 / len(targets),
+                baseline / best, results == expected))
+
+
+if __name__ == '__main__':
+    main()
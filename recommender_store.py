@@ -0,0 +1,218 @@
+"""Incrementally updatable ratings for the CSC108 A3 recommender.
+
+RatingStore keeps a UserRatingDict, its MovieUserDict and its RatingIndex
+consistent as single ratings are added, changed or removed, so a stream of
+new ratings does not need read_ratings / remove_unknown_movies /
+movies_to_users to be run again.
+"""
+
+from typing import AbstractSet, List, Dict, Optional
+
+from recommender_constants import MovieDict, Rating, UserRatingDict
+from recommender_constants import (MOVIE_DICT_SMALL, USER_RATING_DICT_SMALL,
+                                   MOVIE_USER_DICT_SMALL)
+from recommender_functions import (CUT_OFF_RATING, RatingIndex,
+                                   RecommendTrace, movies_to_users,
+                                   recommend_movies)
+
+
+def _positions(lists: Dict[int, List[int]]) -> Dict[int, Dict[int, int]]:
+    """
+    return {key: {item: position in lists[key]}}
+    >>> _positions({10: [1, 2]})
+    {10: {1: 0, 2: 1}}
+    """
+    return {key: {item: pos for pos, item in enumerate(items)}
+            for key, items in lists.items()}
+
+
+def _append(lists: Dict[int, List[int]],
+            positions: Dict[int, Dict[int, int]], key: int, item: int) -> None:
+    """
+    append item to lists[key], creating the list if needed
+    """
+    items = lists.setdefault(key, [])
+    positions.setdefault(key, {})[item] = len(items)
+    items.append(item)
+
+
+def _discard(lists: Dict[int, List[int]],
+             positions: Dict[int, Dict[int, int]], key: int, item: int) -> None:
+    """
+    remove item from lists[key] in O(1) by moving the last item into its
+    place, and drop the list when it becomes empty
+    >>> lists = {10: [1, 2, 3]}
+    >>> positions = _positions(lists)
+    >>> _discard(lists, positions, 10, 1)
+    >>> lists, positions
+    ({10: [3, 2]}, {10: {2: 1, 3: 0}})
+    """
+    items = lists[key]
+    item_positions = positions[key]
+    pos = item_positions.pop(item)
+    last = items.pop()
+    if last != item:
+        items[pos] = last
+        item_positions[last] = pos
+    if not items:
+        del lists[key]
+        del positions[key]
+
+
+class RatingStore:
+    """
+    Ratings with their movie to users dictionary and RatingIndex, updated in
+    O(1) amortized time per rating
+    :ivar user_ratings: UserRatingDict of every known rating
+    :ivar movie_users: MovieUserDict of user_ratings; the user lists keep
+    the users but not in ascending order once ratings are removed
+    :ivar index: RatingIndex of user_ratings
+    :ivar version: number of changes made so far, for caches built on the
+    store to notice updates
+    >>> store = RatingStore(dict(USER_RATING_DICT_SMALL), MOVIE_DICT_SMALL)
+    >>> store.recommend_movies({68735: 4.5}, 2)
+    [302156, 293660]
+    >>> store.add_rating(3, 124057, 5.0)
+    >>> store.add_rating(3, 68735, 4.0)
+    >>> store.recommend_movies({68735: 4.5}, 3)
+    [302156, 124057, 293660]
+    >>> store.remove_rating(3, 124057)
+    >>> store.remove_rating(3, 68735)
+    >>> store.movie_users == MOVIE_USER_DICT_SMALL
+    True
+    >>> 3 in store.user_ratings
+    False
+    """
+
+    def __init__(self, user_ratings: Optional[UserRatingDict] = None,
+                 movies: Optional[MovieDict] = None) -> None:
+        """
+        build the store on top of user_ratings, which it then updates
+        :param user_ratings: starting ratings, already passed through
+        remove_unknown_movies when movies is given; empty if None
+        :param movies: if given, ratings for movies not in it are ignored
+        as remove_unknown_movies would drop them
+        """
+        if user_ratings is None:
+            user_ratings = {}
+        self.user_ratings = user_ratings
+        self.movies = movies
+        self.movie_users = movies_to_users(user_ratings)
+        self.index = RatingIndex(user_ratings)
+        self.version = 0
+        self._user_positions = _positions(self.movie_users)
+        self._high_positions = _positions(self.index.high_raters)
+
+    def add_rating(self, user_id: int, movie_id: int, rating: float) -> None:
+        """
+        record that user_id rated movie_id with rating, replacing any
+        earlier rating of that movie by that user
+        :param user_id: user id
+        :param movie_id: movie id
+        :param rating: rating
+        """
+        if self.movies is not None and movie_id not in self.movies:
+            return
+        ratings = self.user_ratings.get(user_id)
+        if ratings is not None and movie_id in ratings:
+            self.update_rating(user_id, movie_id, rating)
+            return
+        self.version += 1
+        if ratings is None:
+            ratings = self.user_ratings[user_id] = {}
+            self.index.high_movies[user_id] = set()
+            self.index.norms[user_id] = 0.0
+        ratings[movie_id] = rating
+        _append(self.movie_users, self._user_positions, movie_id, user_id)
+        popularity = self.index.popularity
+        popularity[movie_id] = popularity.get(movie_id, 0) + 1
+        self.index.norms[user_id] += rating ** 2
+        if rating >= CUT_OFF_RATING:
+            self._add_high(user_id, movie_id)
+
+    def update_rating(self, user_id: int, movie_id: int,
+                      rating: float) -> None:
+        """
+        change the existing rating of movie_id by user_id to rating
+        :param user_id: user id
+        :param movie_id: movie id
+        :param rating: new rating
+        :raise KeyError: if user_id has not rated movie_id
+        """
+        ratings = self.user_ratings[user_id]
+        old_rating = ratings[movie_id]
+        self.version += 1
+        ratings[movie_id] = rating
+        self.index.norms[user_id] += rating ** 2 - old_rating ** 2
+        was_high = old_rating >= CUT_OFF_RATING
+        is_high = rating >= CUT_OFF_RATING
+        if is_high and not was_high:
+            self._add_high(user_id, movie_id)
+        elif was_high and not is_high:
+            self._remove_high(user_id, movie_id)
+
+    def remove_rating(self, user_id: int, movie_id: int) -> None:
+        """
+        forget the rating of movie_id by user_id, dropping the user once
+        they have no ratings left
+        :param user_id: user id
+        :param movie_id: movie id
+        :raise KeyError: if user_id has not rated movie_id
+        """
+        ratings = self.user_ratings[user_id]
+        rating = ratings.pop(movie_id)
+        self.version += 1
+        _discard(self.movie_users, self._user_positions, movie_id, user_id)
+        popularity = self.index.popularity
+        popularity[movie_id] -= 1
+        if popularity[movie_id] == 0:
+            del popularity[movie_id]
+        if rating >= CUT_OFF_RATING:
+            self._remove_high(user_id, movie_id)
+        if ratings:
+            self.index.norms[user_id] -= rating ** 2
+        else:
+            del self.user_ratings[user_id]
+            del self.index.high_movies[user_id]
+            del self.index.norms[user_id]
+
+    def _add_high(self, user_id: int, movie_id: int) -> None:
+        """
+        mark movie_id as rated CUT_OFF_RATING or above by user_id
+        """
+        self.index.high_movies[user_id].add(movie_id)
+        _append(self.index.high_raters, self._high_positions, movie_id,
+                user_id)
+
+    def _remove_high(self, user_id: int, movie_id: int) -> None:
+        """
+        unmark movie_id as rated CUT_OFF_RATING or above by user_id
+        """
+        self.index.high_movies[user_id].discard(movie_id)
+        _discard(self.index.high_raters, self._high_positions, movie_id,
+                 user_id)
+
+    def recommend_movies(self, target_rating: Rating, num_movies: int,
+                         trace: Optional[RecommendTrace] = None,
+                         genre_movies: Optional[AbstractSet[int]] = None,
+                         min_similarity: float = 0.0,
+                         top_m: Optional[int] = None) -> List[int]:
+        """
+        return recommend_movies for target_rating on the current ratings
+        :param target_rating: dictionary of movie_ids to rating
+        :param num_movies: number of movies to recommend
+        :param trace: records the stages if given
+        :param genre_movies: only recommend these movies, if given
+        :param min_similarity: prune as in get_similar_users
+        :param top_m: prune as in get_similar_users
+        :return: list of recommended movie ids
+        """
+        return recommend_movies(target_rating, self.user_ratings,
+                                self.movie_users, num_movies, self.index,
+                                trace, genre_movies, min_similarity, top_m)
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
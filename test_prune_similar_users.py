@@ -0,0 +1,107 @@
+"""Unit test for neighbour pruning in get_similar_users"""
+import asyncio
+import random
+import unittest
+
+from recommender_async import recommend_movies_async
+from recommender_bench import random_ratings
+from recommender_cache import CachedRecommender
+from recommender_cursor import iter_recommendations
+from recommender_functions import (RatingIndex, movies_to_users,
+                                   get_similar_users, prune_similar_users,
+                                   recommend_movies)
+from recommender_lsh import MinHashIndex
+from recommender_parallel import ParallelScorer
+from recommender_shard import ShardedRecommender
+from recommender_store import RatingStore
+
+OPTIONS = [(0.02, None), (0.0, 10), (0.02, 10)]
+
+
+class TestPruneSimilarUsers(unittest.TestCase):
+
+    def setUp(self):
+        self.ratings = random_ratings(random.Random(25), 3000, 200, 100)
+        self.movie_users = movies_to_users(self.ratings)
+        self.index = RatingIndex(self.ratings)
+
+    def test_same_as_sorting(self):
+        full = get_similar_users({1: 4.0, 2: 2.5}, self.ratings,
+                                 self.movie_users, self.index)
+        ranked = sorted(full, key=lambda user: (-full[user], user))
+        for min_similarity in (0.0, 0.02):
+            for top_m in (None, 1, 10, len(full) + 1):
+                kept = [user for user in ranked
+                        if full[user] >= min_similarity][:top_m]
+                pruned = get_similar_users({1: 4.0, 2: 2.5}, self.ratings,
+                                           self.movie_users, self.index,
+                                           min_similarity, top_m)
+                self.assertEqual(list(pruned), sorted(kept))
+                self.assertEqual(pruned, {user: full[user] for user in kept})
+
+    def test_no_pruning_by_default(self):
+        target = {3: 5.0, 4: 1.5}
+        self.assertEqual(
+            recommend_movies(target, self.ratings, self.movie_users, 10,
+                             self.index, top_m=len(self.ratings)),
+            recommend_movies(target, self.ratings, self.movie_users, 10))
+        sim = {2: 0.5, 1: 0.5}
+        self.assertEqual(prune_similar_users(sim), sim)
+
+    def test_every_recommender_prunes(self):
+        target = {3: 5.0, 4: 1.5, 7: 4.0}
+        genre_movies = frozenset(range(1, 101, 2))
+        store = RatingStore(self.ratings)
+        cache = CachedRecommender(store)
+        scorer = ParallelScorer(self.ratings, self.index, workers=2,
+                                min_candidates=0)
+        try:
+            with ShardedRecommender(3, self.ratings) as sharded:
+                for min_similarity, top_m in OPTIONS:
+                    expected = recommend_movies(
+                        target, self.ratings, self.movie_users, 10,
+                        self.index, min_similarity=min_similarity,
+                        top_m=top_m)
+                    in_genre = recommend_movies(
+                        target, self.ratings, self.movie_users, 10,
+                        self.index, genre_movies=genre_movies,
+                        min_similarity=min_similarity, top_m=top_m)
+                    self.assertEqual(scorer.recommend_movies(
+                        target, self.movie_users, 10, min_similarity, top_m),
+                        expected)
+                    self.assertEqual(list(iter_recommendations(
+                        target, self.ratings, self.movie_users, self.index,
+                        max_results=10, min_similarity=min_similarity,
+                        top_m=top_m)), expected)
+                    self.assertEqual(asyncio.run(recommend_movies_async(
+                        target, self.ratings, self.movie_users, 10,
+                        self.index, chunk_size=7,
+                        min_similarity=min_similarity, top_m=top_m)),
+                        expected)
+                    self.assertEqual(store.recommend_movies(
+                        target, 10, min_similarity=min_similarity,
+                        top_m=top_m), expected)
+                    self.assertEqual(cache.recommend_movies(
+                        target, 10, min_similarity=min_similarity,
+                        top_m=top_m), expected)
+                    self.assertEqual(sharded.recommend_movies(
+                        target, 10, min_similarity=min_similarity,
+                        top_m=top_m), expected)
+                    self.assertEqual(list(sharded.recommend_batch(
+                        [target], 10, genre_movies, min_similarity, top_m)),
+                        [in_genre])
+        finally:
+            scorer.close()
+
+    def test_lsh_prunes_its_neighbours(self):
+        lsh = MinHashIndex(self.ratings, index=self.index)
+        target = {3: 5.0, 4: 1.5, 7: 4.0}
+        found = lsh.similar_users(target, top_m=len(self.ratings))
+        self.assertEqual(lsh.similar_users(target, len(self.ratings), 0.02),
+                         prune_similar_users(found, 0.02))
+        self.assertEqual(lsh.similar_users(target, 10, 0.02),
+                         prune_similar_users(found, 0.02, 10))
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
@@ -0,0 +1,68 @@
+"""Unit test for recommender_functions.RatingIndex and get_similarities"""
+import random
+import unittest
+
+from recommender_bench import random_ratings
+from recommender_functions import (RatingIndex, CUT_OFF_RATING,
+                                   movies_to_users, rating_norm,
+                                   get_similarity, get_similarities)
+
+
+class TestRatingIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.ratings = random_ratings(random.Random(1), 2000, 100, 80)
+        self.index = RatingIndex(self.ratings)
+
+    def test_lookups_match_the_ratings(self):
+        movie_users = movies_to_users(self.ratings)
+        self.assertEqual(self.index.popularity,
+                         {movie: len(users)
+                          for movie, users in movie_users.items()})
+        for user, ratings in self.ratings.items():
+            self.assertEqual(self.index.high_movies[user],
+                             {movie for movie, rating in ratings.items()
+                              if rating >= CUT_OFF_RATING})
+            self.assertEqual(self.index.norms[user],
+                             sum(rating ** 2 for rating in ratings.values()))
+        high_raters = {}
+        for user, ratings in self.ratings.items():
+            for movie, rating in ratings.items():
+                if rating >= CUT_OFF_RATING:
+                    high_raters.setdefault(movie, []).append(user)
+        self.assertEqual(self.index.high_raters, high_raters)
+
+    def test_empty(self):
+        index = RatingIndex({})
+        self.assertEqual((index.popularity, index.high_movies,
+                          index.high_raters, index.norms), ({}, {}, {}, {}))
+
+
+class TestGetSimilarities(unittest.TestCase):
+
+    def setUp(self):
+        self.ratings = random_ratings(random.Random(7), 2000, 100, 80)
+        self.index = RatingIndex(self.ratings)
+
+    def test_same_as_get_similarity(self):
+        rand = random.Random(8)
+        users = sorted(self.ratings)
+        for size in (1, 3, 20, 60):
+            # half-star ratings sum exactly, so the order the shared
+            # products are added in does not matter
+            target = {movie: rand.randint(1, 10) / 2
+                      for movie in rand.sample(range(1, 81), size)}
+            expected = {user: get_similarity(target, self.ratings[user])
+                        for user in users}
+            self.assertEqual(get_similarities(target, users, self.ratings),
+                             expected)
+            self.assertEqual(get_similarities(target, users, self.ratings,
+                                              self.index.norms), expected)
+
+    def test_rating_norm(self):
+        self.assertEqual(rating_norm({}), 0.0)
+        self.assertEqual(rating_norm({1: 0.5, 2: 3.0}), 9.25)
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
@@ -0,0 +1,37 @@
+"""Unit test for read_movies with quoted fields"""
+import csv
+import io
+import unittest
+
+from recommender_functions import read_movies
+
+
+def csv_reference(text):
+    reader = csv.reader(io.StringIO(text))
+    next(reader)
+    return {int(row[0]): (row[1], row[4:]) for row in reader}
+
+
+class TestReadMovies(unittest.TestCase):
+
+    def test_movies_csv(self):
+        with open('movies.csv') as movie_file:
+            text = movie_file.read()
+        self.assertEqual(read_movies(io.StringIO(text)), csv_reference(text))
+
+    def test_quoted_fields(self):
+        text = ('movie_id,title,release,budget,genres\n'
+                '1,"Good, the Bad",1966,1200000,Western\n'
+                '2,"Say ""Hi""",2001,5,Comedy,Drama\n'
+                '3,"Two\nLines",1999,7\n'
+                '4,Plain,2000,1,Action\n')
+        expected = {1: ('Good, the Bad', ['Western']),
+                    2: ('Say "Hi"', ['Comedy', 'Drama']),
+                    3: ('Two\nLines', []),
+                    4: ('Plain', ['Action'])}
+        self.assertEqual(read_movies(io.StringIO(text)), expected)
+        self.assertEqual(csv_reference(text), expected)
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
@@ -0,0 +1,67 @@
+"""Unit test for recommender_functions.recommend_movies with a RatingIndex"""
+import random
+import unittest
+
+from recommender_bench import random_ratings
+from recommender_functions import (RatingIndex, movies_to_users,
+                                   get_users_who_watched, get_similarity,
+                                   get_candidate_movies, get_candidate_users,
+                                   get_movie_popularity, get_num_user_movie,
+                                   sort_moviescore_dict, recommend_movies)
+
+
+def baseline_recommend(target_rating, user_ratings, movie_users, num_movies):
+    """Reference: recommend_movies as it was before any index, scoring each
+    candidate movie from the ratings alone."""
+    user_sim_dict = {user: get_similarity(target_rating, user_ratings[user])
+                     for user in get_users_who_watched(list(target_rating),
+                                                       movie_users)}
+    similar_users = list(user_sim_dict)
+    candidate_movies = get_candidate_movies(target_rating, similar_users,
+                                            user_ratings)
+    movie_score_dict = {}
+    for movie in candidate_movies:
+        popularity = get_movie_popularity(movie, user_ratings)
+        score = 0
+        for user in get_candidate_users(movie, user_ratings, similar_users):
+            score = score + user_sim_dict[user] / (
+                get_num_user_movie(user, candidate_movies, user_ratings)
+                * popularity)
+        movie_score_dict[movie] = score
+    return sort_moviescore_dict(movie_score_dict, num_movies)
+
+
+class TestRecommendMovies(unittest.TestCase):
+
+    def setUp(self):
+        self.ratings = random_ratings(random.Random(5), 1500, 80, 60)
+        self.movie_users = movies_to_users(self.ratings)
+        self.index = RatingIndex(self.ratings)
+
+    def test_index_matches_baseline(self):
+        rand = random.Random(6)
+        for size in (1, 2, 5, 15):
+            target = {movie: rand.randint(1, 10) / 2
+                      for movie in rand.sample(range(1, 61), size)}
+            expected = baseline_recommend(target, self.ratings,
+                                          self.movie_users, 10)
+            self.assertEqual(recommend_movies(target, self.ratings,
+                                              self.movie_users, 10,
+                                              self.index), expected, target)
+            self.assertEqual(recommend_movies(target, self.ratings,
+                                              self.movie_users, 10),
+                             expected, target)
+
+    def test_index_reused_across_targets(self):
+        # one index serves every target without being changed
+        norms = dict(self.index.norms)
+        for movie in range(1, 61):
+            recommend_movies({movie: 5.0}, self.ratings, self.movie_users, 5,
+                             self.index)
+        self.assertEqual(self.index.norms, norms)
+        self.assertEqual(self.index.high_movies, RatingIndex(
+            self.ratings).high_movies)
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
@@ -0,0 +1,63 @@
+"""Unit test for recommender_functions.RecommendTrace"""
+import random
+import unittest
+
+from recommender_bench import random_ratings
+from recommender_functions import (RatingIndex, RecommendTrace,
+                                   movies_to_users, get_similar_users,
+                                   recommend_movies)
+
+STAGES = ['get_similar_users', 'get_candidate_movies', 'get_movie_score_dict',
+          'sort_moviescore_dict']
+
+
+class TestRecommendTrace(unittest.TestCase):
+
+    def setUp(self):
+        self.ratings = random_ratings(random.Random(19), 2000, 100, 80)
+        self.movie_users = movies_to_users(self.ratings)
+        self.index = RatingIndex(self.ratings)
+
+    def test_stages(self):
+        target = {1: 4.0, 2: 2.5}
+        calls = []
+        trace = RecommendTrace(lambda *call: calls.append(call))
+        movies = recommend_movies(target, self.ratings, self.movie_users, 10,
+                                  self.index, trace)
+        self.assertEqual(movies, recommend_movies(
+            target, self.ratings, self.movie_users, 10, self.index))
+        self.assertEqual([stage for stage, _, _ in trace.stages], STAGES)
+        self.assertEqual(calls, trace.stages)
+        items = [items for _, _, items in trace.stages]
+        self.assertEqual(items[0], len(get_similar_users(
+            target, self.ratings, self.movie_users, self.index)))
+        self.assertEqual(items[3], len(movies))
+        for _, seconds, _ in trace.stages:
+            self.assertGreaterEqual(seconds, 0.0)
+        self.assertEqual(trace.total(),
+                         sum(seconds for _, seconds, _ in trace.stages))
+
+    def test_genre_stages(self):
+        trace = RecommendTrace()
+        recommend_movies({1: 4.0}, self.ratings, self.movie_users, 5,
+                         self.index, trace, genre_movies={2, 3, 4})
+        self.assertEqual([stage for stage, _, _ in trace.stages],
+                         ['get_similar_users', 'get_filtered_movie_score_dict',
+                          'sort_moviescore_dict'])
+
+    def test_counters_and_as_dict(self):
+        trace = RecommendTrace()
+        trace.count('hits')
+        trace.count('hits', 2)
+        start = trace.start()
+        trace.record('stage', start, 7)
+        report = trace.as_dict()
+        self.assertEqual(report['counters'], {'hits': 3})
+        self.assertEqual(list(report['stages']), ['stage'])
+        self.assertEqual(report['stages']['stage']['items'], 7)
+        self.assertEqual(report['stages']['stage']['ms'],
+                         trace.stages[0][1] * 1000)
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
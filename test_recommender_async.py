@@ -0,0 +1,92 @@
+"""Unit test for recommender_async.recommend_movies_async"""
+import asyncio
+import random
+import threading
+import unittest
+from unittest import mock
+
+from recommender_async import recommend_movies_async
+from recommender_bench import random_ratings
+from recommender_functions import (RatingIndex, RecommendTrace,
+                                   movies_to_users, recommend_movies)
+
+
+class TestRecommendMoviesAsync(unittest.TestCase):
+
+    def setUp(self):
+        self.ratings = random_ratings(random.Random(23), 4000, 300, 80)
+        self.movie_users = movies_to_users(self.ratings)
+        self.index = RatingIndex(self.ratings)
+
+    def query(self, target, **kwargs):
+        return recommend_movies_async(target, self.ratings, self.movie_users,
+                                      5, self.index, **kwargs)
+
+    def test_same_as_recommend_movies(self):
+        for target in ({1: 4.0}, {5: 5.0, 6: 2.0}, {7: 3.5, 8: 4.5, 9: 1.0}):
+            expected = recommend_movies(target, self.ratings,
+                                        self.movie_users, 5, self.index)
+            for chunk_size in (1, 7, 1000):
+                self.assertEqual(asyncio.run(self.query(
+                    target, chunk_size=chunk_size)), expected)
+
+    def test_cancel_stops_scoring(self):
+        trace = RecommendTrace()
+
+        async def cancel_early():
+            task = asyncio.create_task(self.query({1: 4.0}, chunk_size=1,
+                                                  trace=trace))
+            for _ in range(3):
+                await asyncio.sleep(0)
+            task.cancel()
+            await task
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(cancel_early())
+        self.assertLess(trace.counters['async_users'],
+                        len(self.movie_users[1]))
+
+    def test_timeout(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(self.query({1: 4.0}, timeout=0))
+        trace = RecommendTrace()
+        self.assertEqual(asyncio.run(self.query(
+            {1: 4.0}, timeout=0, best_effort=True, trace=trace)), [])
+        self.assertEqual(trace.counters, {'async_timeouts': 1})
+        self.assertEqual(asyncio.run(self.query(
+            {1: 4.0}, timeout=60, best_effort=True)),
+            recommend_movies({1: 4.0}, self.ratings, self.movie_users, 5))
+
+
+    def test_genre_movies(self):
+        for target in ({1: 4.0}, {5: 5.0, 6: 2.0}):
+            for genre_movies in ({1, 2, 3, 10, 20, 30}, set(range(40, 81))):
+                for top_m in (None, 20):
+                    expected = recommend_movies(
+                        target, self.ratings, self.movie_users, 5,
+                        self.index, genre_movies=genre_movies, top_m=top_m)
+                    self.assertEqual(asyncio.run(self.query(
+                        target, chunk_size=7, top_m=top_m,
+                        genre_movies=genre_movies)), expected)
+
+    def test_index_built_off_the_loop(self):
+        threads = []
+
+        def build(user_ratings):
+            threads.append(threading.get_ident())
+            return RatingIndex(user_ratings)
+
+        async def query():
+            threads.append(threading.get_ident())
+            return await recommend_movies_async(
+                {1: 4.0}, self.ratings, self.movie_users, 5)
+
+        with mock.patch('recommender_async.RatingIndex', build):
+            self.assertEqual(asyncio.run(query()), recommend_movies(
+                {1: 4.0}, self.ratings, self.movie_users, 5, self.index))
+        self.assertEqual(len(threads), 2)
+        self.assertNotEqual(threads[0], threads[1])
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
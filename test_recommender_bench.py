@@ -0,0 +1,73 @@
+"""Smoke test running every recommender_bench subcommand on small data"""
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import recommender_bench
+
+
+class TestBenchCommands(unittest.TestCase):
+
+    def setUp(self):
+        # ratings_tiny rates none of movies_tiny's movies, so pair it with
+        # the full movie file; both are copied so their caches go here too
+        self.tmp_dir = tempfile.mkdtemp()
+        self.movie_path = os.path.join(self.tmp_dir, 'movies.csv')
+        self.rating_path = os.path.join(self.tmp_dir, 'ratings.csv')
+        shutil.copy('movies.csv', self.movie_path)
+        shutil.copy('ratings_tiny.csv', self.rating_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def bench(self, *args):
+        output = io.StringIO()
+        with mock.patch.object(sys, 'argv', ['recommender_bench.py']
+                               + list(args)), \
+                contextlib.redirect_stdout(output):
+            recommender_bench.main()
+        return output.getvalue()
+
+    def test_synthetic_data(self):
+        self.assertIn('median_ms', self.bench('candidates', '--sizes', '1000',
+                                              '--repeat', '1'))
+        paths = self.bench('generate', '--ratings', '1000',
+                           '--data-dir', self.tmp_dir).split()
+        self.assertEqual(len(paths), 2)
+        for path in paths:
+            self.assertTrue(os.path.exists(path))
+        self.assertIn('bytes/rating', self.bench(
+            'memory', '--rating-file', self.rating_path, '--queries', '2'))
+
+    def test_run_and_compare(self):
+        result_path = os.path.join(self.tmp_dir, 'result.json')
+        self.bench('run', '--movie-file', self.movie_path, '--rating-file',
+                   self.rating_path, '--queries', '2', '--repeat', '1',
+                   '--output', result_path)
+        with open(result_path) as result_file:
+            result = json.load(result_file)
+        self.assertEqual(result['queries'], 2)
+        self.assertTrue(result['stages'])
+        output = self.bench('compare', result_path, result_path)
+        self.assertIn('old_p50_ms', output)
+        self.assertNotIn('REGRESSION', output)
+
+    def test_feature_benchmarks(self):
+        data = ['--movie-file', self.movie_path, '--rating-file',
+                self.rating_path, '--queries', '2']
+        self.assertIn('push_ms', self.bench('genres', *data))
+        self.assertIn('speedup', self.bench('prune', *data))
+        self.assertIn('same True', self.bench('pages', *data))
+        output = self.bench('movies', '--movie-file', self.movie_path,
+                            '--repeat', '1', '--data-dir', self.tmp_dir)
+        self.assertIn('read_movies', output)
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
@@ -0,0 +1,78 @@
+"""Unit test for recommender_cache.CachedRecommender"""
+import random
+import unittest
+
+from recommender_bench import random_ratings
+from recommender_cache import CachedRecommender
+from recommender_functions import get_similar_users, recommend_movies
+from recommender_store import RatingStore
+
+
+class TestCachedRecommender(unittest.TestCase):
+
+    def setUp(self):
+        ratings = random_ratings(random.Random(13), 2000, 150, 80)
+        self.store = RatingStore(ratings)
+        self.cached = CachedRecommender(self.store)
+
+    def expected(self, target, num_movies, **options):
+        store = self.store
+        return recommend_movies(target, store.user_ratings,
+                                store.movie_users, num_movies, store.index,
+                                **options)
+
+    def test_options_match_recommend_movies(self):
+        for options in ({}, {'genre_movies': frozenset(range(1, 80, 3))},
+                        {'min_similarity': 0.02}, {'top_m': 5},
+                        {'genre_movies': {2, 4, 6}, 'top_m': 10}):
+            for _ in range(2):
+                self.assertEqual(
+                    self.cached.recommend_movies({1: 4.0, 2: 2.5}, 10,
+                                                 **options),
+                    self.expected({1: 4.0, 2: 2.5}, 10, **options), options)
+
+    def test_invalidated_when_store_changes(self):
+        target = {3: 5.0}
+        self.cached.recommend_movies(target, 5)
+        sim = self.cached.similar_users(target)
+        version = self.store.version
+        for user in range(200, 210):
+            self.store.add_rating(user, 3, 5.0)
+            self.store.add_rating(user, 79, 5.0)
+        self.assertNotEqual(self.store.version, version)
+        self.assertEqual(self.cached.recommend_movies(target, 5),
+                         self.expected(target, 5))
+        self.assertIn(79, self.cached.recommend_movies(target, 5))
+        self.assertNotEqual(self.cached.similar_users(target), sim)
+        self.store.remove_rating(200, 79)
+        self.assertEqual(self.cached.recommend_movies(target, 5),
+                         self.expected(target, 5))
+
+    def test_results_are_copies(self):
+        target = {3: 5.0}
+        sim = self.cached.similar_users(target)
+        sim.clear()
+        movies = self.cached.recommend_movies(target, 5)
+        movies.clear()
+        self.assertTrue(self.cached.similar_users(target))
+        self.assertEqual(self.cached.recommend_movies(target, 5),
+                         self.expected(target, 5))
+        self.assertEqual(self.cached.stats()['results']['hits'], 1)
+
+
+    def test_reordered_targets_scored_canonically(self):
+        # the similarities of these two orders differ in the last bit
+        first, second = {1: 0.7, 2: 0.1, 3: 0.2}, {2: 0.1, 3: 0.2, 1: 0.7}
+        canonical = dict(sorted(first.items()))
+        store = self.store
+        for target in (first, second):
+            cached = CachedRecommender(store)
+            self.assertEqual(cached.similar_users(target), get_similar_users(
+                canonical, store.user_ratings, store.movie_users,
+                store.index))
+            self.assertEqual(cached.recommend_movies(target, 10),
+                             self.expected(canonical, 10))
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
@@ -0,0 +1,56 @@
+"""Unit test for recommender_compact.CompactRatings"""
+import random
+import unittest
+
+from recommender_bench import random_ratings
+from recommender_compact import CompactRatings
+from recommender_functions import (remove_unknown_movies, movies_to_users,
+                                   recommend_movies)
+
+
+class TestCompactRatings(unittest.TestCase):
+
+    def setUp(self):
+        self.ratings = random_ratings(random.Random(14), 2000, 50, 200)
+
+    def test_same_mapping(self):
+        compact = CompactRatings(self.ratings)
+        self.assertEqual(compact, self.ratings)
+        self.assertEqual(len(compact), len(self.ratings))
+        for user, ratings in self.ratings.items():
+            self.assertEqual(len(compact[user]), len(ratings))
+            self.assertEqual(dict(compact[user].items()), ratings)
+        self.assertNotIn(51, compact)
+        self.assertNotIn(201, compact[1])
+        self.assertRaises(KeyError, compact.__getitem__, 51)
+
+    def test_from_columns(self):
+        rows = [(user, movie, rating) for user, ratings
+                in self.ratings.items() for movie, rating in ratings.items()]
+        random.Random(1).shuffle(rows)
+        compact = CompactRatings.from_columns(*zip(*rows))
+        self.assertEqual(compact, self.ratings)
+
+    def test_remove_unknown_movies(self):
+        movies = {movie: ('', []) for movie in range(1, 200, 3)}
+        compact = CompactRatings(self.ratings)
+        remove_unknown_movies(self.ratings, movies)
+        remove_unknown_movies(compact, movies)
+        self.assertEqual(compact, self.ratings)
+        self.assertEqual(sorted(compact), sorted(self.ratings))
+
+    def test_recommend_movies(self):
+        compact = CompactRatings(self.ratings)
+        for target in ({1: 5.0, 2: 3.5}, {10: 4.0}, {7: 1.0, 8: 4.5}):
+            self.assertEqual(
+                recommend_movies(target, compact, movies_to_users(compact),
+                                 10),
+                recommend_movies(target, self.ratings,
+                                 movies_to_users(self.ratings), 10))
+
+    def test_bad_rating(self):
+        self.assertRaises(ValueError, CompactRatings, {1: {10: 3.3}})
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
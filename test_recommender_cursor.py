@@ -0,0 +1,40 @@
+"""Unit test for recommender_cursor.RecommendCursor"""
+import random
+import unittest
+
+from recommender_bench import random_ratings
+from recommender_cursor import RecommendCursor, iter_recommendations
+from recommender_functions import (RatingIndex, movies_to_users,
+                                   recommend_movies)
+
+
+class TestRecommendCursor(unittest.TestCase):
+
+    def setUp(self):
+        self.ratings = random_ratings(random.Random(24), 3000, 200, 100)
+        self.movie_users = movies_to_users(self.ratings)
+        self.index = RatingIndex(self.ratings)
+
+    def test_pages_match_recommend_movies(self):
+        for target in ({1: 4.0}, {5: 5.0, 6: 2.0}):
+            expected = recommend_movies(target, self.ratings,
+                                        self.movie_users, 1000, self.index)
+            cursor = RecommendCursor(target, self.ratings, self.movie_users,
+                                     self.index)
+            pages = []
+            while not cursor.exhausted:
+                pages.extend(cursor.next_page(7))
+            self.assertEqual(pages, expected)
+            self.assertEqual(cursor.returned, len(expected))
+
+    def test_max_results_and_genres(self):
+        allowed = set(range(1, 100, 3))
+        expected = recommend_movies({1: 4.0}, self.ratings, self.movie_users,
+                                    10, self.index, genre_movies=allowed)
+        self.assertEqual(list(iter_recommendations(
+            {1: 4.0}, self.ratings, self.movie_users, self.index, allowed,
+            max_results=10)), expected)
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
@@ -0,0 +1,76 @@
+"""Unit test for genre filtered recommend_movies"""
+import random
+import unittest
+
+from recommender_bench import random_ratings
+from recommender_functions import (RatingIndex, movies_to_users,
+                                   get_similar_users, get_candidate_movies,
+                                   get_movie_score_dict, sort_moviescore_dict,
+                                   recommend_movies)
+from recommender_genres import GenreIndex, MAX_CACHED_FILTERS
+
+
+class TestGenreFilter(unittest.TestCase):
+
+    def setUp(self):
+        rand = random.Random(20)
+        names = ['Action', 'Comedy', 'Drama', 'Western']
+        self.movies = {movie: ('', rand.sample(names, rand.randint(0, 2)))
+                       for movie in range(1, 121)}
+        self.ratings = random_ratings(rand, 3000, 150, 120)
+        self.movie_users = movies_to_users(self.ratings)
+        self.index = RatingIndex(self.ratings)
+        self.genres = GenreIndex(self.movies)
+
+    def test_bitmaps(self):
+        for genre in ('Action', 'Western'):
+            self.assertEqual(self.genres.movies_with([genre]),
+                             {movie for movie, (_, genres)
+                              in self.movies.items() if genre in genres})
+        self.assertEqual(
+            self.genres.movies_with(['Action', 'Drama'], match_all=True),
+            {movie for movie, (_, genres) in self.movies.items()
+             if 'Action' in genres and 'Drama' in genres})
+
+    def test_decode(self):
+        movies = {movie: ('', []) for movie in range(1000, 3000, 3)}
+        genres = GenreIndex(movies)
+        bitmap = 0
+        for pos in (0, 7, 8, 9, 63, 64, 400, len(movies) - 1):
+            bitmap |= 1 << pos
+        self.assertEqual(genres.decode(bitmap),
+                         [genres.movie_ids[pos] for pos
+                          in (0, 7, 8, 9, 63, 64, 400, len(movies) - 1)])
+        self.assertEqual(genres.decode(0), [])
+
+    def test_cache_keeps_recently_used(self):
+        first = self.genres.movies_with(['Action'])
+        for count in range(MAX_CACHED_FILTERS - 1):
+            self.genres.movies_with(['Genre %d' % count])
+        # using the first filter again keeps it past the next eviction
+        self.assertIs(self.genres.movies_with(['Action']), first)
+        self.genres.movies_with(['Comedy'])
+        self.assertIs(self.genres.movies_with(['Action']), first)
+        self.assertNotIn((frozenset(['Genre 0']), False), self.genres._cache)
+
+    def test_same_as_filtering_after_scoring(self):
+        for genres in (['Western'], ['Comedy', 'Drama'], ['Horror']):
+            allowed = self.genres.movies_with(genres)
+            for target in ({1: 4.0}, {5: 5.0, 6: 2.0}, {7: 3.5, 8: 4.5}):
+                user_sim_dict = get_similar_users(
+                    target, self.ratings, self.movie_users, self.index)
+                movie_score_dict = get_movie_score_dict(
+                    get_candidate_movies(target, list(user_sim_dict),
+                                         self.ratings),
+                    user_sim_dict, self.ratings, self.index)
+                expected = sort_moviescore_dict(
+                    {movie: score for movie, score in movie_score_dict.items()
+                     if movie in allowed}, 10)
+                self.assertEqual(
+                    recommend_movies(target, self.ratings, self.movie_users,
+                                     10, self.index, genre_movies=allowed),
+                    expected)
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
@@ -0,0 +1,87 @@
+"""Unit test for recommender_ingest.ingest_ratings"""
+import os
+import random
+import tempfile
+import tracemalloc
+import unittest
+
+from recommender_compact import CompactRatings
+from recommender_functions import (read_ratings, remove_unknown_movies,
+                                   movies_to_users)
+from recommender_ingest import ingest_ratings, ingest_compact, iter_partitions
+
+
+class TestIngestRatings(unittest.TestCase):
+
+    def setUp(self):
+        rand = random.Random(15)
+        handle, self.path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w') as rating_file:
+            rating_file.write('user_id,movie_id,rating,timestamp\n')
+            for _ in range(40000):
+                rating_file.write('%d,%d,%.1f,0\n' % (
+                    rand.randint(1, 2000), rand.randint(1, 100),
+                    rand.randint(1, 10) / 2))
+        self.movies = {movie: ('', []) for movie in range(1, 100, 2)}
+        with open(self.path) as rating_file:
+            self.expected = read_ratings(rating_file)
+        remove_unknown_movies(self.expected, self.movies)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def assert_same(self, user_ratings, movie_users):
+        self.assertEqual(user_ratings, self.expected)
+        self.assertEqual(list(user_ratings), list(self.expected))
+        self.assertEqual(movie_users, movies_to_users(self.expected))
+
+    def test_in_memory(self):
+        self.assert_same(*ingest_ratings(self.path, self.movies))
+
+    def test_spilled(self):
+        with tempfile.TemporaryDirectory() as spill_dir:
+            self.assert_same(*ingest_ratings(
+                self.path, self.movies, memory_budget=100 * 500,
+                chunk_bytes=4096, partitions=7, spill_dir=spill_dir))
+            self.assertEqual(os.listdir(spill_dir), [])
+
+    def test_partitions(self):
+        parts = list(iter_partitions(self.path, self.movies,
+                                     memory_budget=100 * 500, partitions=7))
+        self.assertEqual(len(parts), 7)
+        merged = {}
+        for part in parts:
+            self.assertFalse(set(merged) & set(part))
+            merged.update(part)
+        self.assertEqual(merged, self.expected)
+
+    def test_compact(self):
+        self.assertEqual(ingest_compact(self.path, self.movies,
+                                        memory_budget=100 * 500),
+                         CompactRatings(self.expected))
+
+    def peak_memory(self, function):
+        tracemalloc.start()
+        try:
+            function()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_peak_memory_within_budget(self):
+        budget = 200 * 1024
+        # the kept ratings as dicts take several times the budget
+        self.assertGreater(self.peak_memory(
+            lambda: ingest_ratings(self.path, self.movies, budget)),
+            4 * budget)
+        # the budget, one partition and the packed ratings
+        self.assertLess(self.peak_memory(
+            lambda: ingest_compact(self.path, self.movies, budget,
+                                   partitions=32)), 2 * budget)
+        self.assertLess(self.peak_memory(
+            lambda: [len(part) for part in iter_partitions(
+                self.path, self.movies, budget, partitions=32)]), 2 * budget)
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
@@ -0,0 +1,69 @@
+"""Unit test for recommender_itemitem"""
+import os
+import random
+import tempfile
+import tracemalloc
+import unittest
+
+from recommender_bench import random_ratings
+from recommender_itemitem import ItemModel, train_item_model, write_item_model
+
+
+class TestItemModel(unittest.TestCase):
+
+    def setUp(self):
+        self.ratings = random_ratings(random.Random(18), 2000, 100, 150)
+        handle, self.path = tempfile.mkstemp(suffix='.items')
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_round_trip(self):
+        model = train_item_model(self.ratings, k=10)
+        write_item_model(self.path, model, 10)
+        with ItemModel(self.path) as loaded:
+            self.assertEqual(loaded.k, 10)
+            for movie, neighbours in model.items():
+                self.assertLessEqual(len(neighbours), 10)
+                self.assertEqual(loaded.neighbours_of(movie), neighbours)
+                weights = [weight for _, weight in neighbours]
+                self.assertEqual(weights, sorted(weights, reverse=True))
+            self.assertEqual(loaded.neighbours_of(1000), [])
+
+    def test_blocks_bound_memory(self):
+        peaks = []
+        models = []
+        for max_pairs in (10 ** 9, 2000):
+            tracemalloc.start()
+            models.append(train_item_model(self.ratings, k=5,
+                                           max_pairs=max_pairs))
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        self.assertEqual(models[0], models[1])
+        self.assertLess(peaks[1], peaks[0] / 2)
+
+    def test_recommend_skips_rated_movies(self):
+        write_item_model(self.path, train_item_model(self.ratings), 50)
+        target = {1: 5.0, 2: 3.0}
+        with ItemModel(self.path) as loaded:
+            results = loaded.recommend_movies(target, 10)
+        self.assertEqual(len(results), 10)
+        self.assertFalse(set(results) & set(target))
+
+    def test_not_a_model(self):
+        with open(self.path, 'wb') as model_file:
+            model_file.write(b'\0' * 64)
+        self.assertRaises(ValueError, ItemModel, self.path)
+        for size in (0, 10):
+            with open(self.path, 'wb') as model_file:
+                model_file.write(b'RCII'[:size] + b'\0' * max(0, size - 4))
+            self.assertRaises(ValueError, ItemModel, self.path)
+        write_item_model(self.path, train_item_model(self.ratings), 5)
+        with open(self.path, 'r+b') as model_file:
+            model_file.truncate(os.path.getsize(self.path) - 4)
+        self.assertRaises(ValueError, ItemModel, self.path)
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
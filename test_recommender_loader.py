@@ -0,0 +1,106 @@
+"""Unit test for the recommender_loader binary cache"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from recommender_functions import (read_movies, read_ratings,
+                                   remove_unknown_movies, movies_to_users)
+from recommender_loader import (load_movies, load_ratings, cache_path_for,
+                                open_rating_columns, load_prepared_ratings,
+                                RatingColumns)
+
+
+class TestLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.rating_path = os.path.join(self.tmp_dir, 'ratings.csv')
+        self.movie_path = os.path.join(self.tmp_dir, 'movies.csv')
+        shutil.copy('ratings_tiny.csv', self.rating_path)
+        shutil.copy('movies_tiny.csv', self.movie_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_same_as_read_functions(self):
+        with open(self.rating_path) as rating_file:
+            expected = read_ratings(rating_file)
+        # first load builds the cache, second load reads it
+        self.assertEqual(load_ratings(self.rating_path), expected)
+        self.assertTrue(os.path.exists(cache_path_for(self.rating_path)))
+        self.assertEqual(load_ratings(self.rating_path), expected)
+        with open(self.movie_path) as movie_file:
+            expected = read_movies(movie_file)
+        self.assertEqual(load_movies(self.movie_path), expected)
+        self.assertEqual(load_movies(self.movie_path), expected)
+
+    def test_columns(self):
+        with open_rating_columns(self.rating_path) as columns:
+            self.assertEqual(len(columns), 4)
+            self.assertEqual(columns.users.tolist(), [1, 1, 2, 2])
+            self.assertEqual(columns.movies.tolist(), [2968, 3671, 10, 17])
+            self.assertEqual(columns.ratings.tolist(), [1.0, 3.0, 4.0, 5.0])
+
+    def test_stale_cache_is_rebuilt(self):
+        load_ratings(self.rating_path)
+        load_movies(self.movie_path)
+        with open(self.rating_path, 'a') as rating_file:
+            rating_file.write('3,10,2.5,835355493\n')
+        with open(self.movie_path, 'a') as movie_file:
+            movie_file.write('10,GoldenEye,1995-11-16,130.0,Action\n')
+        self.assertEqual(load_ratings(self.rating_path)[3], {10: 2.5})
+        self.assertEqual(load_movies(self.movie_path)[10],
+                         ('GoldenEye', ['Action']))
+
+    def test_truncated_cache_is_rebuilt(self):
+        expected_ratings = load_ratings(self.rating_path)
+        expected_movies = load_movies(self.movie_path)
+        for path in (self.rating_path, self.movie_path):
+            cache_path = cache_path_for(path)
+            with open(cache_path, 'r+b') as cache_file:
+                cache_file.truncate(os.path.getsize(cache_path) - 3)
+        with self.assertRaises(ValueError):
+            RatingColumns(cache_path_for(self.rating_path))
+        self.assertEqual(load_ratings(self.rating_path), expected_ratings)
+        self.assertEqual(load_movies(self.movie_path), expected_movies)
+
+    def test_prepared_ratings(self):
+        with open(self.rating_path, 'w') as rating_file:
+            rating_file.write('user_id,movie_id,rating,timestamp\n'
+                              '5,10,4.0,0\n3,99,2.0,0\n3,10,1.0,0\n'
+                              '4,99,3.0,0\n5,17,2.5,0\n5,10,3.5,0\n')
+        movies = {10: ('GoldenEye', []), 17: ('Emma', [])}
+        with open(self.rating_path) as rating_file:
+            expected = read_ratings(rating_file)
+        remove_unknown_movies(expected, movies)
+        user_ratings, movie_users = load_prepared_ratings(self.rating_path,
+                                                          movies)
+        self.assertEqual(user_ratings, expected)
+        self.assertEqual(list(user_ratings), list(expected))
+        self.assertEqual(movie_users, movies_to_users(expected))
+        self.assertEqual(movie_users[10], [3, 5])
+
+    def test_prepared_ratings_descending_users(self):
+        with open(self.rating_path, 'w') as rating_file:
+            rating_file.write('user_id,movie_id,rating,timestamp\n')
+            for user in range(3000, 0, -1):
+                rating_file.write('%d,%d,4.0,0\n' % (user, 10 + user % 2))
+        movies = {10: ('GoldenEye', []), 11: ('Emma', [])}
+        user_ratings, movie_users = load_prepared_ratings(self.rating_path,
+                                                          movies)
+        self.assertEqual(movie_users, movies_to_users(user_ratings))
+        self.assertEqual(movie_users[10], list(range(2, 3001, 2)))
+
+    def test_non_ascii_titles(self):
+        with open(self.movie_path, 'w') as movie_file:
+            movie_file.write('movie_id,title,release_date,runtime,genres\n'
+                             '1,Amélie,2001-04-25,122.0,Comedy,Romance\n'
+                             '2,Léon,1994-09-14,110.0\n')
+        self.assertEqual(load_movies(self.movie_path),
+                         {1: ('Amélie', ['Comedy', 'Romance']),
+                          2: ('Léon', [])})
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
@@ -0,0 +1,32 @@
+"""Unit test for recommender_lsh.MinHashIndex"""
+import random
+import unittest
+
+from recommender_bench import random_ratings
+from recommender_functions import movies_to_users, get_similar_users
+from recommender_lsh import MinHashIndex, top_users
+
+
+class TestMinHashIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.ratings = random_ratings(random.Random(17), 3000, 200, 300)
+        self.movie_users = movies_to_users(self.ratings)
+        self.targets = [{movie: 4.0} for movie in range(1, 300, 30)]
+
+    def test_candidates_share_a_movie(self):
+        lsh = MinHashIndex(self.ratings, bands=16, rows=2)
+        for target in self.targets:
+            exact = get_similar_users(target, self.ratings, self.movie_users)
+            self.assertLessEqual(set(lsh.candidate_users(target)),
+                                 set(exact))
+
+    def test_many_bands_find_exact_neighbours(self):
+        lsh = MinHashIndex(self.ratings, bands=512, rows=1, top_m=5)
+        for target in self.targets:
+            exact = get_similar_users(target, self.ratings, self.movie_users)
+            self.assertEqual(lsh.similar_users(target), top_users(exact, 5))
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
@@ -0,0 +1,92 @@
+"""Unit test for recommender_parallel.ParallelScorer"""
+import os
+import time
+import unittest
+
+from recommender_functions import (read_movies, read_ratings,
+                                   remove_unknown_movies, movies_to_users,
+                                   RatingIndex, recommend_movies,
+                                   get_similar_users, get_candidate_movies,
+                                   get_movie_score_dict)
+from recommender_parallel import ParallelScorer
+
+TARGETS = [{663: 5, 274: 4.5, 745: 4.5}, {2109: 3, 954: 4}, {745: 5},
+           {1262: 5}]
+
+
+class TestParallelScorer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open('movies.csv') as movie_file:
+            movies = read_movies(movie_file)
+        with open('ratings_small.csv') as rating_file:
+            cls.ratings = read_ratings(rating_file)
+        remove_unknown_movies(cls.ratings, movies)
+        cls.movie_users = movies_to_users(cls.ratings)
+        cls.index = RatingIndex(cls.ratings)
+        cls.scorer = ParallelScorer(cls.ratings, cls.index, workers=3,
+                                    min_candidates=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.scorer.close()
+
+    def test_scores_identical_to_serial(self):
+        for target in TARGETS:
+            sim = get_similar_users(target, self.ratings, self.movie_users,
+                                    self.index)
+            candidates = get_candidate_movies(target, list(sim), self.ratings)
+            expected = get_movie_score_dict(candidates, sim, self.ratings,
+                                            self.index)
+            actual = self.scorer.movie_scores(candidates, sim)
+            self.assertEqual(list(actual.items()), list(expected.items()))
+
+    def test_recommend_movies(self):
+        for target in TARGETS:
+            expected = recommend_movies(target, self.ratings,
+                                        self.movie_users, 10, self.index)
+            self.assertEqual(self.scorer.recommend_movies(
+                target, self.movie_users, 10), expected)
+
+    def test_genre_filter(self):
+        allowed = frozenset(movie for movie in self.movie_users
+                            if movie % 3 == 0)
+        for target in TARGETS:
+            self.assertEqual(
+                self.scorer.recommend_movies(target, self.movie_users, 10,
+                                             genre_movies=allowed),
+                recommend_movies(target, self.ratings, self.movie_users, 10,
+                                 self.index, genre_movies=allowed))
+
+    def test_bad_workers(self):
+        with self.assertRaises(ValueError):
+            ParallelScorer(self.ratings, self.index, workers=0)
+
+    def test_restarted_worker_keeps_its_scorer(self):
+        scorer = ParallelScorer(self.ratings, self.index, workers=1,
+                                min_candidates=0)
+        other = {1: {10: 4.0, 11: 5.0}, 2: {10: 3.0, 12: 4.5}}
+        try:
+            with ParallelScorer(other, workers=1, min_candidates=0):
+                # the pool replaces a worker that died after another
+                # scorer was created; the worker exits inside a task, as
+                # one killed while waiting would keep the task queue locked
+                worker = scorer._pool._pool[0]
+                scorer._pool.apply_async(os._exit, (1,))
+                worker.join()
+                while worker in scorer._pool._pool:
+                    time.sleep(0.01)
+                for target in TARGETS:
+                    self.assertEqual(
+                        scorer.recommend_movies(target, self.movie_users, 10),
+                        recommend_movies(target, self.ratings,
+                                         self.movie_users, 10, self.index))
+        finally:
+            # the task the worker died in never finishes, so close would
+            # wait for it forever
+            scorer._pool.terminate()
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
@@ -0,0 +1,64 @@
+"""Unit test for recommender_search.TitleIndex"""
+import random
+import unittest
+
+from recommender import search_movie
+from recommender_functions import read_movies
+from recommender_search import TitleIndex, MAX_RANKED_GRAMS
+
+
+class TestTitleIndex(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open('movies.csv') as movie_file:
+            cls.movies = read_movies(movie_file)
+        cls.index = TitleIndex(cls.movies)
+
+    def test_same_matches_as_search_movie(self):
+        rand = random.Random(11)
+        titles = [title for title, _ in self.movies.values()]
+        queries = ['', 'a', 'ZZ', 'the', 'star wars', 'qxj', 'Toy Story']
+        for _ in range(200):
+            # random substrings of real titles, in random case
+            title = rand.choice(titles)
+            start = rand.randrange(len(title))
+            query = title[start:start + rand.randint(1, 12)]
+            queries.append(query.upper() if rand.random() < 0.5 else query)
+        for query in queries:
+            self.assertEqual(sorted(self.index.search(query)),
+                             sorted(search_movie(query, self.movies)))
+
+    def test_prefix(self):
+        expected = sorted((mid, title)
+                          for mid, (title, _) in self.movies.items()
+                          if title.lower().startswith('toy'))
+        self.assertEqual(sorted(self.index.search('Toy', prefix=True)),
+                         expected)
+
+    def test_limit_keeps_best_ranked(self):
+        results = self.index.search('star', limit=5)
+        self.assertEqual(results, self.index.search('star')[:5])
+        for _, title in results:
+            self.assertTrue(title.lower().startswith('star'))
+
+
+    def test_short_queries_ranked_lazily(self):
+        index = TitleIndex(self.movies)
+        for query in ('a', 'e', 'st', 'war', 'a'):
+            results = index.search(query, limit=10)
+            self.assertEqual(results, index.search(query)[:10])
+            ranked = sorted(index.search(query),
+                            key=lambda result: (
+                                result[1].lower().find(query),
+                                len(result[1]), result[0]))
+            self.assertEqual(results, ranked[:10])
+        grams = sorted(index.grams)[:MAX_RANKED_GRAMS + 10]
+        for gram in grams:
+            index.search(gram, limit=1)
+        self.assertEqual(list(index._ranked_grams),
+                         grams[-MAX_RANKED_GRAMS:])
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
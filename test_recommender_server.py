@@ -0,0 +1,146 @@
+"""Unit test for recommender_server.RecommenderServer"""
+import asyncio
+import http.client
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from recommender_constants import (USER_RATING_DICT_SMALL,
+                                   MOVIE_USER_DICT_SMALL)
+from recommender_functions import recommend_movies
+from recommender_server import RecommenderServer
+
+
+class TestRecommenderServer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # the tiny files have no shared movies, so serve the small
+        # constants' movies with ratings written to a temporary file
+        cls.rating_path = cls.rating_file()
+        cls.server = RecommenderServer('movies_tiny.csv', cls.rating_path,
+                                       workers=2)
+        started = threading.Event()
+
+        async def serve():
+            cls.loop = asyncio.get_running_loop()
+            cls.task = asyncio.current_task()
+            cls.loop.call_soon(started.set)
+            await cls.server.serve('127.0.0.1', 0)
+
+        def run():
+            try:
+                asyncio.run(serve())
+            except asyncio.CancelledError:
+                pass
+
+        cls.thread = threading.Thread(target=run)
+        cls.thread.start()
+        started.wait()
+        while cls.server.port is None or cls.server.model is None:
+            time.sleep(0.01)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.call_soon_threadsafe(cls.task.cancel)
+        cls.thread.join()
+        os.remove(cls.rating_path)
+        os.remove(cls.rating_path + '.cols')
+
+    @staticmethod
+    def rating_file():
+        rating_file = tempfile.NamedTemporaryFile('w', suffix='.csv',
+                                                  delete=False)
+        rating_file.write('userId,movieId,rating,timestamp\n')
+        for user, ratings in USER_RATING_DICT_SMALL.items():
+            for movie, rating in ratings.items():
+                rating_file.write('%d,%d,%s,0\n' % (user, movie, rating))
+        rating_file.close()
+        return rating_file.name
+
+    def request(self, method, path, payload=None):
+        connection = http.client.HTTPConnection('127.0.0.1', self.server.port)
+        body = None if payload is None else json.dumps(payload)
+        connection.request(method, path, body)
+        response = connection.getresponse()
+        result = response.status, json.loads(response.read())
+        connection.close()
+        return result
+
+    def test_ready(self):
+        self.assertEqual(self.request('GET', '/ready'), (200, {'ready': True}))
+
+    def test_recommend(self):
+        status, payload = self.request(
+            'POST', '/recommend', {'ratings': {'68735': 4.5},
+                                   'num_movies': 2})
+        self.assertEqual(status, 200)
+        expected = recommend_movies({68735: 4.5}, USER_RATING_DICT_SMALL,
+                                    MOVIE_USER_DICT_SMALL, 2)
+        self.assertEqual([movie['movie_id']
+                          for movie in payload['recommendations']], expected)
+
+    def test_bad_request(self):
+        status, _ = self.request('POST', '/recommend', {'ratings': {}})
+        self.assertEqual(status, 400)
+
+    def test_malformed_requests(self):
+        for payload in ({'ratings': {'68735': 0}},
+                        {'ratings': {'68735': 5.5}},
+                        {'ratings': {'68735': '4'}},
+                        {'ratings': {'war': 4.0}},
+                        {'ratings': {'1.5': 4.0}},
+                        {'ratings': [68735]},
+                        {'ratings': {'68735': 4.0}, 'num_movies': -1}):
+            self.assertEqual(self.request('POST', '/recommend', payload)[0],
+                             400, payload)
+        for limit in ('abc', '-1', '0'):
+            self.assertEqual(
+                self.request('GET', '/search?q=war&limit=' + limit)[0], 400)
+        self.assertEqual(self.request('GET', '/ready'), (200, {'ready': True}))
+
+    def raw_request(self, data):
+        with socket.create_connection(('127.0.0.1', self.server.port)) as sock:
+            sock.sendall(data)
+            response = b''
+            while True:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    return response
+                response = response + chunk
+
+    def test_unframed_requests(self):
+        post = b'POST /recommend HTTP/1.1\r\nContent-Length: %s\r\n\r\n'
+        for data in (b'GARBAGE\r\n\r\n', b'GET /ready\r\n\r\n',
+                     post % b'ab', post % b'-1', post % b'1e3'):
+            head, _, body = self.raw_request(data).partition(b'\r\n\r\n')
+            self.assertTrue(head.startswith(b'HTTP/1.1 400 '), data)
+            self.assertIn(b'Connection: close', head)
+            self.assertEqual(json.loads(body), {'error': 'malformed request'})
+        self.assertEqual(self.request('GET', '/ready'), (200, {'ready': True}))
+
+    def test_unknown_paths_share_metrics(self):
+        for number in range(3):
+            self.assertEqual(self.request('GET', '/missing%d' % number)[0],
+                             404)
+        status, payload = self.request('GET', '/metrics')
+        self.assertGreaterEqual(payload['other']['requests'], 3)
+        self.assertFalse([route for route in payload
+                          if route.startswith('/missing')])
+
+    def test_search_and_metrics(self):
+        status, payload = self.request('GET', '/search?q=war')
+        self.assertEqual(status, 200)
+        self.assertEqual(payload['results'],
+                         [{'movie_id': 68735, 'title': 'Warcraft'}])
+        status, payload = self.request('GET', '/metrics')
+        self.assertEqual(status, 200)
+        self.assertGreaterEqual(payload['/search']['requests'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
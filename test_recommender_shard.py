@@ -0,0 +1,117 @@
+"""Unit test for recommender_shard.ShardedRecommender"""
+import os
+import random
+import unittest
+from unittest import mock
+
+from recommender_bench import random_ratings
+from recommender_functions import (RatingIndex, movies_to_users,
+                                   recommend_movies)
+from recommender_loader import load_movies, load_prepared_ratings
+from recommender_shard import ShardedRecommender
+
+
+class TestShardedRecommender(unittest.TestCase):
+
+    def test_same_as_recommend_movies(self):
+        ratings = random_ratings(random.Random(21), 3000, 150, 120)
+        movie_users = movies_to_users(ratings)
+        index = RatingIndex(ratings)
+        targets = [{movie: 4.0, movie + 1: 2.5} for movie in range(1, 120, 7)]
+        expected = [recommend_movies(target, ratings, movie_users, 10, index)
+                    for target in targets]
+        allowed = set(range(1, 121, 3))
+        expected_genre = [recommend_movies(target, ratings, movie_users, 10,
+                                           index, genre_movies=allowed)
+                          for target in targets]
+        with ShardedRecommender(3, ratings) as sharded:
+            self.assertEqual([sharded.recommend_movies(target, 10)
+                              for target in targets], expected)
+            self.assertEqual(list(sharded.recommend_batch(targets * 3, 10)),
+                             expected * 3)
+            self.assertEqual([sharded.recommend_movies(target, 10, allowed)
+                              for target in targets], expected_genre)
+
+    def test_batch_with_genre_filter(self):
+        # replies and genre sets large enough to fill the pipes if the
+        # coordinator stopped reading while it sent
+        rand = random.Random(121)
+        ratings = {user: {movie: rand.randint(1, 10) / 2 for movie
+                          in rand.sample(range(1, 20001), 300)}
+                   for user in range(1, 401)}
+        movie_users = movies_to_users(ratings)
+        index = RatingIndex(ratings)
+        allowed = set(range(1, 20001))
+        targets = [{movie: 5.0 for movie in rand.sample(range(1, 20001), 60)}
+                   for _ in range(16)]
+        expected = [recommend_movies(target, ratings, movie_users, 5, index,
+                                     genre_movies=allowed)
+                    for target in targets]
+        with ShardedRecommender(2, ratings) as sharded:
+            self.assertEqual(list(sharded.recommend_batch(targets, 5,
+                                                          allowed)),
+                             expected)
+            # a batch left early must not leave replies behind
+            batch = sharded.recommend_batch(targets, 5, allowed)
+            self.assertEqual(next(batch), expected[0])
+            batch.close()
+            self.assertEqual(sharded.recommend_movies(targets[1], 5,
+                                                      frozenset(allowed)),
+                             expected[1])
+
+    def test_near_tie_exact(self):
+        # movies 40 and 50 get the same three contributions, so they tie
+        # and 40 comes first; summing 50's per shard (users 1 and 3 in one,
+        # 2 in the other) would round it above 40
+        ratings = {1: {1: 0.5, 50: 4.0, 90: 0.5},
+                   2: {1: 0.5, 50: 4.0, 91: 0.5},
+                   3: {1: 1.0, 50: 4.0, 92: 0.5},
+                   4: {1: 0.5, 40: 4.0, 90: 0.5},
+                   6: {1: 0.5, 40: 4.0, 91: 0.5},
+                   8: {1: 1.0, 40: 4.0, 92: 0.5}}
+        expected = recommend_movies({1: 5.0}, ratings,
+                                    movies_to_users(ratings), 2)
+        self.assertEqual(expected, [40, 50])
+        with ShardedRecommender(2, ratings) as sharded:
+            self.assertEqual(sharded.recommend_movies({1: 5.0}, 2), expected)
+            self.assertEqual(list(sharded.recommend_batch([{1: 5.0}], 2)),
+                             [expected])
+
+    def test_busy_while_batch_open(self):
+        ratings = {1: {10: 4.0, 11: 5.0}, 2: {10: 3.0, 12: 4.5}}
+        with ShardedRecommender(2, ratings) as sharded:
+            batch = sharded.recommend_batch([{10: 4.0}] * 3, 2)
+            self.assertEqual(next(batch), [11, 12])
+            with self.assertRaises(RuntimeError):
+                sharded.recommend_movies({10: 4.0}, 2)
+            with self.assertRaises(RuntimeError):
+                next(sharded.recommend_batch([{10: 4.0}], 2))
+            batch.close()
+            self.assertEqual(sharded.recommend_movies({10: 4.0}, 2), [11, 12])
+
+    def test_dead_worker(self):
+        ratings = {1: {10: 4.0, 11: 5.0}, 2: {10: 3.0, 12: 4.5}}
+        # the workers fork with the patch and exit while loading
+        with mock.patch('recommender_shard.movies_to_users',
+                        side_effect=lambda _: os._exit(1)):
+            with self.assertRaises(RuntimeError):
+                ShardedRecommender(2, ratings)
+        with ShardedRecommender(2, ratings) as sharded:
+            sharded._workers[1].kill()
+            sharded._workers[1].join()
+            with self.assertRaises(RuntimeError):
+                sharded.recommend_movies({10: 4.0}, 2)
+
+    def test_load_from_files(self):
+        ratings, movie_users = load_prepared_ratings(
+            'ratings_small.csv', load_movies('movies.csv'))
+        with ShardedRecommender(2, movie_path='movies.csv',
+                                rating_path='ratings_small.csv') as sharded:
+            for target in ({745: 5.0}, {2109: 3.0, 954: 4.0}):
+                self.assertEqual(sharded.recommend_movies(target, 5),
+                                 recommend_movies(target, ratings,
+                                                  movie_users, 5))
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
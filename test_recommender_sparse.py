@@ -0,0 +1,95 @@
+"""Unit test for recommender_sparse.SparseRecommender"""
+import random
+import unittest
+
+from recommender_functions import (read_movies, read_ratings,
+                                   remove_unknown_movies, movies_to_users,
+                                   RatingIndex, get_similar_users,
+                                   recommend_movies)
+from recommender_sparse import SparseRecommender, recommend_movies_batch
+
+
+class TestSparseRecommender(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open('movies.csv') as movie_file:
+            movies = read_movies(movie_file)
+        with open('ratings_small.csv') as rating_file:
+            cls.ratings = read_ratings(rating_file)
+        remove_unknown_movies(cls.ratings, movies)
+        cls.movie_users = movies_to_users(cls.ratings)
+        cls.index = RatingIndex(cls.ratings)
+        cls.engine = SparseRecommender(cls.ratings)
+        rand = random.Random(2)
+        cls.targets = []
+        for user in rand.sample(sorted(cls.ratings), 30):
+            ratings = cls.ratings[user]
+            movies = rand.sample(sorted(ratings), min(len(ratings), 5))
+            cls.targets.append({movie: ratings[movie] for movie in movies})
+
+    def test_same_as_recommend_movies(self):
+        for target in self.targets:
+            for num_movies in (5, 50):
+                self.assertEqual(
+                    self.engine.recommend_movies(target, num_movies),
+                    recommend_movies(target, self.ratings, self.movie_users,
+                                     num_movies, self.index))
+
+    def test_tie_order(self):
+        # the whole ranking, where equal scores are ordered by movie id
+        for target in self.targets[:10]:
+            expected = recommend_movies(target, self.ratings,
+                                        self.movie_users, 10 ** 6, self.index)
+            self.assertEqual(self.engine.recommend_movies(target, 10 ** 6),
+                             expected)
+        ratings = {1: {10: 4.0, 30: 4.0, 20: 4.0}, 2: {10: 4.0, 40: 5.0}}
+        engine = SparseRecommender(ratings)
+        self.assertEqual(engine.recommend_movies({10: 4.0}, 3),
+                         recommend_movies({10: 4.0}, ratings,
+                                          movies_to_users(ratings), 3))
+        self.assertEqual(engine.recommend_movies({10: 4.0}, 3), [40, 20, 30])
+
+    def test_similarities_bit_identical(self):
+        # whole histories are longer than many users' rows, which are then
+        # summed in the user's own rating order
+        for user in sorted(self.ratings)[:40]:
+            target = self.ratings[user]
+            self.assertEqual(
+                self.engine.similar_users(target),
+                get_similar_users(target, self.ratings, self.movie_users,
+                                  self.index))
+        # (0.1 + 0.2) + 0.3 != (0.3 + 0.2) + 0.1: user 1 has fewer ratings
+        # than the target, so the sum runs in user 1's order
+        ratings = {1: {3: 1.0, 2: 1.0, 1: 1.0}, 2: {4: 5.0}}
+        target = {1: 0.1, 2: 0.2, 3: 0.3, 4: 1.0}
+        self.assertEqual(SparseRecommender(ratings).similar_users(target),
+                         get_similar_users(target, ratings,
+                                           movies_to_users(ratings)))
+
+    def test_batch_same_as_recommend_movies(self):
+        users = sorted(self.ratings)[:40]
+        targets = {user: self.ratings[user] for user in users}
+        results = dict(recommend_movies_batch(targets, self.ratings, 5,
+                                              self.engine, block_size=16))
+        self.assertEqual(list(results), users)
+        for user in users:
+            self.assertEqual(results[user], recommend_movies(
+                self.ratings[user], self.ratings, self.movie_users, 5,
+                self.index))
+
+    def test_batch_streams_blocks(self):
+        read = []
+
+        def targets():
+            for target in self.targets:
+                read.append(target)
+                yield target
+
+        results = self.engine.recommend_batch(targets(), 5, block_size=4)
+        next(results)
+        self.assertEqual(len(read), 4)
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
@@ -0,0 +1,67 @@
+"""Unit test for recommender_store.RatingStore"""
+import random
+import unittest
+
+from recommender_functions import (RatingIndex, movies_to_users,
+                                   recommend_movies)
+from recommender_store import RatingStore
+
+
+class TestRatingStore(unittest.TestCase):
+
+    def assert_consistent(self, store):
+        """store matches indexes rebuilt from scratch"""
+        user_ratings = store.user_ratings
+        self.assertEqual({movie: sorted(users)
+                          for movie, users in store.movie_users.items()},
+                         {movie: sorted(users) for movie, users
+                          in movies_to_users(user_ratings).items()})
+        expected = RatingIndex(user_ratings)
+        self.assertEqual(store.index.popularity, expected.popularity)
+        self.assertEqual(store.index.high_movies, expected.high_movies)
+        self.assertEqual({movie: sorted(users) for movie, users
+                          in store.index.high_raters.items()},
+                         {movie: sorted(users) for movie, users
+                          in expected.high_raters.items()})
+        self.assertEqual(store.index.norms.keys(), expected.norms.keys())
+        for user, norm in expected.norms.items():
+            self.assertAlmostEqual(store.index.norms[user], norm, places=9)
+
+    def test_random_events(self):
+        rand = random.Random(9)
+        store = RatingStore()
+        stars = [0.5 * half for half in range(1, 11)]
+        for step in range(3000):
+            user = rand.randint(1, 30)
+            movie = rand.randint(1, 60)
+            rated = movie in store.user_ratings.get(user, {})
+            event = rand.random()
+            if rated and event < 0.3:
+                store.remove_rating(user, movie)
+            elif rated and event < 0.6:
+                store.update_rating(user, movie, rand.choice(stars))
+            else:
+                store.add_rating(user, movie, rand.choice(stars))
+            if step % 500 == 0:
+                self.assert_consistent(store)
+        self.assert_consistent(store)
+        target = {1: 4.0, 2: 2.5}
+        self.assertEqual(store.recommend_movies(target, 10),
+                         recommend_movies(target, store.user_ratings,
+                                          movies_to_users(store.user_ratings),
+                                          10))
+
+    def test_unknown_movies_ignored(self):
+        store = RatingStore({}, {10: ('GoldenEye', ['Action'])})
+        store.add_rating(1, 11, 4.0)
+        store.add_rating(1, 10, 4.0)
+        self.assertEqual(store.user_ratings, {1: {10: 4.0}})
+
+    def test_missing_rating(self):
+        store = RatingStore({1: {10: 3.0}})
+        self.assertRaises(KeyError, store.remove_rating, 1, 11)
+        self.assertRaises(KeyError, store.update_rating, 2, 10, 3.0)
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)
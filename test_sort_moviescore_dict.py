@@ -0,0 +1,40 @@
+"""Unit test for recommender_functions.sort_moviescore_dict"""
+import random
+import unittest
+
+from recommender_functions import sort_moviescore_dict
+
+
+def full_sort(movie_score_dict, limit):
+    """Reference ranking: sort every movie by (score desc, movie_id asc)."""
+    return sorted(movie_score_dict,
+                  key=lambda movie: (-movie_score_dict[movie], movie))[:limit]
+
+
+class TestSortMovieScoreDict(unittest.TestCase):
+
+    def test_matches_full_sort(self):
+        # property: for random score dicts, with few distinct scores so
+        # there are many ties, the top-k equals the full sort's prefix
+        rand = random.Random(108)
+        for _ in range(500):
+            num_movies = rand.randint(0, 60)
+            scores = [rand.random() for _ in range(rand.randint(1, 5))]
+            movie_ids = rand.sample(range(1, 1000), num_movies)
+            movie_score_dict = {movie: rand.choice(scores)
+                                for movie in movie_ids}
+            limit = rand.randint(0, num_movies + 5)
+            self.assertEqual(sort_moviescore_dict(movie_score_dict, limit),
+                             full_sort(movie_score_dict, limit))
+
+    def test_many_ties_beyond_limit(self):
+        # 30 tied movies after the best one; the smallest ids must win no
+        # matter in which order the dict was built
+        movie_score_dict = {movie: 1.0 for movie in range(60, 0, -2)}
+        movie_score_dict[999] = 2.0
+        self.assertEqual(sort_moviescore_dict(movie_score_dict, 4),
+                         [999, 2, 4, 6])
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)